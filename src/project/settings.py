@@ -42,6 +42,22 @@ SITE_ID = 1
 # See: https://github.com/jalMogo/mgmt/issues/112
 API_CACHE_TIMEOUT = 1
 
+# How long to keep the serialized places and submissions that dataset
+# snapshots are assembled from. Items that have not changed are reused from
+# one snapshot to the next, so this should be longer than the time between
+# snapshots.
+SNAPSHOT_CHUNK_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# How long to keep the list of each dataset's data indexes. Changes to the
+# indexes clear it from the cache right away, so by default it is kept until
+# then.
+DATA_INDEX_CACHE_TIMEOUT = None
+
+# How long to remember the credentials and permissions of the remote clients
+# that sign users in (see remote_client_user). Changes to a client clear it
+# from the cache right away.
+REMOTE_CLIENT_CACHE_TIMEOUT = 60 * 5
+
 # Where should the user be redirected to when they visit the root of the site?
 ROOT_REDIRECT_TO = "api-root"
 
@@ -118,8 +134,15 @@ REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "oauth2_provider.ext.rest_framework.OAuth2Authentication",
     ),
+    "DEFAULT_RENDERER_CLASSES": (
+        "sa_api_v2.renderers.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
 }
 
+# The encoder used by the JSON renderers; see sa_api_v2.json_backends.
+JSON_RENDERER_BACKEND = "sa_api_v2.json_backends.OrjsonBackend"
+
 ###############################################################################
 #
 # Request/Response processing
@@ -208,6 +231,20 @@ INSTALLED_APPS = (
 CELERY_RESULT_BACKEND = "djcelery.backends.database:DatabaseBackend"
 CELERY_ACCEPT_CONTENT = ["json", "msgpack", "yaml", "pickle"]
 
+# How often, in seconds, to write the API key usage (the last IP address and
+# time that each key was used) from the cache to the database. The usage is
+# written by a periodic task, so a celery beat process must be running (see
+# the Procfile), and the web processes must share the cache with the workers
+# (e.g., redis; the default local-memory cache is per-process).
+API_KEY_USAGE_FLUSH_INTERVAL = 60 * 5
+
+CELERYBEAT_SCHEDULE = {
+    "flush-api-key-usage": {
+        "task": "sa_api_v2.tasks.flush_api_key_usage",
+        "schedule": API_KEY_USAGE_FLUSH_INTERVAL,
+    },
+}
+
 
 ###############################################################################
 #
@@ -1,14 +1,20 @@
 import base64
+import hashlib
 import logging
+from django.conf import settings
 from django.contrib.auth import get_user_model, SESSION_KEY, BACKEND_SESSION_KEY
+from django.core import cache as django_cache
 
 # from provider.oauth2.models import Client
 from oauth2_provider.models import Application
-from remote_client_user.models import ClientPermissions
+from remote_client_user.models import ClientPermissions, get_client_cache_key
 from rest_framework.authentication import get_authorization_header
+from sa_api_v2.cache import UserCache
 
 logger = logging.getLogger("remote_client_user")
 
+REMOTE_CLIENT_BACKEND = "sa_api_v2.auth_backends.CachedModelBackend"
+
 
 def get_authed_user(request):
     # Get the HTTP Authorization header value
@@ -29,30 +35,80 @@ def get_authed_user(request):
     except ValueError:
         return None
 
-    # Get the client
+    # Get the client's permissions
+    client_permissions = get_client_permissions(client_id, client_secret)
+    if client_permissions is None:
+        return None
+
+    # Get or create the user if the client allows
+    allow_remote_signin, allow_remote_signup = client_permissions
+    if not allow_remote_signin:
+        return None
+
+    user = get_user_by_username(username)
+    if user is None:
+        if not allow_remote_signup:
+            return None
+        User = get_user_model()
+        user = User.objects.create_user(username=username, email=email)
+    return user
+
+
+def get_client_permissions(client_id, client_secret):
+    """
+    Get the (allow_remote_signin, allow_remote_signup) permissions of the
+    client with the given credentials, or None if there is no such client or
+    it has no permissions. The result is cached for
+    REMOTE_CLIENT_CACHE_TIMEOUT seconds, or until the client or its
+    permissions change.
+    """
+    key = get_client_cache_key(client_id, client_secret)
+    cached = django_cache.cache.get(key)
+    if cached is not None:
+        return cached or None
+
     try:
-        #        client = Client.objects.select_related('permissions').get(client_id=client_id, client_secret=client_secret)
         client = Application.objects.select_related("permissions").get(
             client_id=client_id, client_secret=client_secret
         )
-    #    except Client.DoesNotExist:
-    except Application.DoesNotExist:
-        return None
+        client_permissions = (
+            client.permissions.allow_remote_signin,
+            client.permissions.allow_remote_signup,
+        )
+    except (Application.DoesNotExist, ClientPermissions.DoesNotExist):
+        client_permissions = None
 
-    # Get or create the user if the client allows
-    try:
-        if not client.permissions.allow_remote_signin:
-            return None
-    except ClientPermissions.DoesNotExist:
-        return None
+    # Cache unknown clients as False, so that they're remembered too.
+    django_cache.cache.set(
+        key, client_permissions or False, settings.REMOTE_CLIENT_CACHE_TIMEOUT
+    )
+    return client_permissions
+
+
+def get_user_id_cache_key(username):
+    return "remote-client-user:" + hashlib.sha256(username.encode()).hexdigest()
+
+
+def get_user_by_username(username):
+    """
+    Get the user with the given username, through the user cache. The user's
+    id is cached by username.
+    """
+    key = get_user_id_cache_key(username)
+    user_id = django_cache.cache.get(key)
+    if user_id is not None:
+        user = UserCache.get_instance(user_id=user_id)
+        if user is not None and user.username == username:
+            return user
 
     User = get_user_model()
     try:
         user = User.objects.get(username=username)
     except User.DoesNotExist:
-        if not client.permissions.allow_remote_signup:
-            return None
-        user = User.objects.create_user(username=username, email=email)
+        return None
+
+    UserCache.set_instance(user, user_id=user.id)
+    django_cache.cache.set(key, user.id, settings.REMOTE_CLIENT_CACHE_TIMEOUT)
     return user
 
 
@@ -61,12 +117,14 @@ def RemoteClientMiddleware(get_response):
         user = get_authed_user(request)
 
         # Set the current user ID and the appropriate authentication backend
-        # on the session.
-        if user:
+        # on the session. Only write them if they changed, so that the
+        # session doesn't have to be saved on every request.
+        if user and (
+            str(request.session.get(SESSION_KEY)) != str(user.id)
+            or request.session.get(BACKEND_SESSION_KEY) != REMOTE_CLIENT_BACKEND
+        ):
             request.session[SESSION_KEY] = user.id
-            request.session[
-                BACKEND_SESSION_KEY
-            ] = "sa_api_v2.auth_backends.CachedModelBackend"
+            request.session[BACKEND_SESSION_KEY] = REMOTE_CLIENT_BACKEND
         response = get_response(request)
         return response
 
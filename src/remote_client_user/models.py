@@ -1,4 +1,9 @@
+import hashlib
+from django.core import cache as django_cache
 from django.db import models
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from oauth2_provider.models import Application
 
 
 # Create your models here.
@@ -12,3 +17,38 @@ class ClientPermissions(models.Model):
 
     def __str__(self):
         return self.client.url
+
+
+def get_client_cache_key(client_id, client_secret):
+    credentials = "%s;%s" % (client_id, client_secret)
+    return "remote-client:" + hashlib.sha256(credentials.encode()).hexdigest()
+
+
+@receiver(pre_save, sender=Application)
+def clear_previous_client_credentials(sender, instance, **kwargs):
+    if instance.pk is not None:
+        previous = (
+            Application.objects.filter(pk=instance.pk)
+            .values_list("client_id", "client_secret")
+            .first()
+        )
+        if previous is not None:
+            django_cache.cache.delete(get_client_cache_key(*previous))
+
+
+@receiver(post_save, sender=Application)
+@receiver(post_delete, sender=Application)
+def clear_client_credentials(sender, instance, **kwargs):
+    django_cache.cache.delete(
+        get_client_cache_key(instance.client_id, instance.client_secret)
+    )
+
+
+@receiver(post_save, sender=ClientPermissions)
+@receiver(post_delete, sender=ClientPermissions)
+def clear_client_permissions(sender, instance, **kwargs):
+    try:
+        client = instance.client
+    except Application.DoesNotExist:
+        return
+    clear_client_credentials(Application, client)
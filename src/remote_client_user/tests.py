@@ -1,7 +1,9 @@
 import base64
-from django.contrib.auth import get_user_model
+from django.contrib.auth import get_user_model, SESSION_KEY
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.cache import cache as django_cache
 from django.test import TestCase, RequestFactory
-from remote_client_user.middleware import get_authed_user
+from remote_client_user.middleware import RemoteClientMiddleware, get_authed_user
 from remote_client_user.models import ClientPermissions
 
 # from provider.constants import CONFIDENTIAL
@@ -11,9 +13,15 @@ from oauth2_provider.models import Application
 
 # from oauth2_provider.models.Application import CLIENT_CONFIDENTIAL
 from nose.tools import assert_is_none, assert_is_not_none
+from sa_api_v2.cache import cache_buffer
 
 
 class RemoteClientUserTests(TestCase):
+    def setUp(self):
+        # Clients and users are cached by their credentials and usernames.
+        django_cache.clear()
+        cache_buffer.reset()
+
     def test_no_auth_with_blank_auth_header(self):
         request = RequestFactory().get("")
         request.META.pop("HTTP_AUTHORIZATION", None)
@@ -143,3 +151,43 @@ class RemoteClientUserTests(TestCase):
 
         auth = get_authed_user(request)
         assert_is_not_none(auth)
+
+    def test_cached_auth_skips_queries_and_session_writes(self):
+        User = get_user_model()
+        user = User.objects.create_user(
+            username="mjumbewu", email="mjumbewu@example.com", password="!"
+        )
+
+        client = Application.objects.create(
+            client_id="abc",
+            client_secret="123",
+            user_id=user.id,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            redirect_uris="http://www.example.com",
+        )
+        ClientPermissions.objects.create(client=client, allow_remote_signin=True)
+
+        middleware = RemoteClientMiddleware(lambda request: None)
+        session = SessionStore()
+
+        def make_request():
+            request = RequestFactory().get("")
+            request.META["HTTP_AUTHORIZATION"] = (
+                b"Remote "
+                + base64.encodestring(b"abc;123;mjumbewu;mjumbewu@example.com").strip()
+            )
+            request.session = session
+            return request
+
+        middleware(make_request())
+        self.assertEqual(session[SESSION_KEY], user.id)
+
+        session.modified = False
+        with self.assertNumQueries(0):
+            middleware(make_request())
+        self.assertFalse(session.modified)
+
+        # Changing the client's permissions takes effect right away.
+        client.permissions.allow_remote_signin = False
+        client.permissions.save()
+        assert_is_none(get_authed_user(make_request()))
@@ -31,7 +31,7 @@ from .cors.models import Origin
 from .cors.admin import OriginAdmin
 
 from adminsortable2.admin import SortableInlineAdminMixin
-from .tasks import clone_related_dataset_data
+from .tasks import clone_related_dataset_data, reindex_dataset
 import nested_admin
 
 __all__ = []
@@ -383,6 +383,31 @@ class DataSetAdmin(DjangoObjectActions, admin.ModelAdmin):
                 obj.owner = user
         super(DataSetAdmin, self).save_model(request, obj, form, change)
 
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not models.DataIndex:
+            return super(DataSetAdmin, self).save_formset(
+                request, form, formset, change
+            )
+
+        # Index the dataset's things in the background, rather than while
+        # the admin waits for the page to load.
+        indexes = formset.save(commit=False)
+        for index in formset.deleted_objects:
+            index.delete()
+        for index in indexes:
+            index.save(reindex=False)
+        formset.save_m2m()
+
+        if indexes:
+            reindex_dataset.apply_async(
+                args=[form.instance.id, [index.id for index in indexes]]
+            )
+            messages.info(
+                request,
+                "Indexing %s. Please give it a few moments."
+                % (", ".join(index.attr_name for index in indexes),),
+            )
+
 
 class InlinePlaceTagAdmin(admin.StackedInline):
     model = models.PlaceTag
@@ -28,7 +28,7 @@ class APIKeyBackend(object):
         client, key_instance = self._get_client_and_key(request, key)
         if None in (client, key_instance):
             return None
-        # key_instance.login(ip_address)
+        key_instance.login(ip_address)
         self.key_instance = key_instance
         return client
 
@@ -72,6 +72,21 @@ def check_api_authorization(request):
     return (client, auth)
 
 
+def record_api_key_usage(request):
+    """
+    Record the usage of the API key in the '%s' request header, if it is one
+    of the dataset's keys, without authenticating the request with it (e.g.,
+    for reads that don't need a client).
+    """ % KEY_HEADER
+    key = request.META.get(KEY_HEADER)
+    if not key:
+        return
+
+    key_instance = request.get_dataset().get_key(key)
+    if key_instance is not None:
+        key_instance.login(request.META["REMOTE_ADDR"])
+
+
 class ApiKeyAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
         """
@@ -9,7 +9,9 @@ http://jetfar.com/simple-api-key-generation-in-python/
 license unknown.
 """
 
+from django.core import cache as django_cache
 from django.db import models
+from django.db.models import Case, Value, When
 from django.db.models.signals import post_save
 from django.utils.timezone import now
 
@@ -21,6 +23,35 @@ from ..models.mixins import CloneableModelMixin
 KEY_SIZE = 32
 
 
+# The usage of the keys is recorded in the cache (see ApiKey.login), along
+# with a log of the keys that have been used: each key that is used takes a
+# numbered slot in the log, unless it already has one that hasn't been
+# flushed.
+USAGE_SLOT_COUNT_CACHE_KEY = "apikey-usage-slots"
+USAGE_FLUSH_STATE_CACHE_KEY = "apikey-usage-flushed"
+
+
+def get_usage_cache_key(key_id):
+    return "apikey-usage:%s" % (key_id,)
+
+
+def get_usage_logged_cache_key(key_id):
+    return "apikey-usage-logged:%s" % (key_id,)
+
+
+def get_usage_slot_cache_key(slot):
+    return "apikey-usage-slot:%s" % (slot,)
+
+
+def take_usage_slot():
+    cache = django_cache.cache
+    try:
+        return cache.incr(USAGE_SLOT_COUNT_CACHE_KEY)
+    except ValueError:
+        cache.add(USAGE_SLOT_COUNT_CACHE_KEY, 0, None)
+        return cache.incr(USAGE_SLOT_COUNT_CACHE_KEY)
+
+
 def generate_unique_api_key():
     """random string suitable for use with ApiKey.
 
@@ -55,8 +86,64 @@ class ApiKey(CloneableModelMixin, models.Model):
         db_table = "apikey_apikey"
 
     def login(self, ip_address):
-        self.logged_ip = ip_address
-        self.save()
+        """
+        Record that the key was used from the given address. The usage is
+        kept in the cache until flush_usage writes it to the database, so
+        that requests don't wait on the write.
+        """
+        cache = django_cache.cache
+        cache.set(get_usage_cache_key(self.pk), (ip_address, now()), None)
+        if cache.add(get_usage_logged_cache_key(self.pk), True, None):
+            cache.set(get_usage_slot_cache_key(take_usage_slot()), self.pk, None)
+
+    @classmethod
+    def flush_usage(cls):
+        """
+        Write the usage recorded by login to the keys that were used, in a
+        single update. Returns the number of keys that were written.
+
+        Each flush only reads the slots of the log that were taken before the
+        previous flush, so that no request is still writing to them; usage is
+        written within two flushes of being recorded.
+        """
+        cache = django_cache.cache
+        flushed_through, pending_through = cache.get(
+            USAGE_FLUSH_STATE_CACHE_KEY, (0, 0)
+        )
+        latest = cache.get(USAGE_SLOT_COUNT_CACHE_KEY, 0)
+        if latest < pending_through:
+            # The log was started over (e.g., the cache was cleared).
+            flushed_through = pending_through = 0
+        cache.set(USAGE_FLUSH_STATE_CACHE_KEY, (pending_through, latest), None)
+
+        slot_cache_keys = [
+            get_usage_slot_cache_key(slot)
+            for slot in range(flushed_through + 1, pending_through + 1)
+        ]
+        key_ids = set(cache.get_many(slot_cache_keys).values())
+        cache.delete_many(slot_cache_keys)
+        if not key_ids:
+            return 0
+
+        # Take the keys out of the log before reading their usage, so that
+        # any usage recorded after the read logs the key again.
+        cache.delete_many([get_usage_logged_cache_key(key_id) for key_id in key_ids])
+        usage_cache_keys = {get_usage_cache_key(key_id): key_id for key_id in key_ids}
+        usage = cache.get_many(list(usage_cache_keys))
+        if not usage:
+            return 0
+
+        logged_ips, last_useds = [], []
+        for usage_cache_key, (ip_address, last_used) in usage.items():
+            key_id = usage_cache_keys[usage_cache_key]
+            logged_ips.append(When(id=key_id, then=Value(ip_address or None)))
+            last_useds.append(When(id=key_id, then=Value(last_used)))
+
+        cls.objects.filter(id__in=[usage_cache_keys[k] for k in usage]).update(
+            logged_ip=Case(*logged_ips, output_field=models.GenericIPAddressField()),
+            last_used=Case(*last_useds, output_field=models.DateTimeField()),
+        )
+        return len(usage)
 
     def logout(self):
         # YAGNI?
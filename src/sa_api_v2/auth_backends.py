@@ -1,3 +1,4 @@
+from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
 from .cache import UserCache
 from social_core.backends.discourse import DiscourseAuth
@@ -5,12 +6,24 @@ from social_core.backends.discourse import DiscourseAuth
 
 class CachedModelBackend(ModelBackend):
     def get_user(self, user_id):
+        """
+        Get the user, along with their groups, group permissions and social
+        auth records, from the cache if possible.
+        """
         user = UserCache.get_instance(user_id=user_id)
         if user is None:
-            user = super(CachedModelBackend, self).get_user(user_id)
+            user = self.get_user_principal(user_id)
             UserCache.set_instance(user, user_id=user_id)
         return user
 
+    def get_user_principal(self, user_id):
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.with_principal_relations().get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
 
 class DiscourseAuthHDK(DiscourseAuth):
     name = "discourse-hdk"
@@ -2,8 +2,7 @@ from collections import defaultdict
 from django.conf import settings
 from django.core import cache as django_cache
 from django.core.exceptions import ObjectDoesNotExist
-from django.core.urlresolvers import reverse
-from . import utils
+from . import routes, utils
 
 import logging
 
@@ -365,6 +364,21 @@ class UserCache(Cache):
     def get_other_keys(cls, **params):
         return set([cls.get_instance_key(**params)])
 
+    @classmethod
+    def clear_users(cls, user_ids):
+        """
+        Clear the cached instances of the users with the given ids. The keys
+        are deleted from the remote cache directly, as well as from the
+        buffer, since group changes are usually made outside of API requests
+        (e.g., in the admin).
+        """
+        keys = set()
+        for user_id in user_ids:
+            keys |= cls.get_other_keys(user_id=user_id)
+        if keys:
+            cache_buffer.delete_many(keys)
+            django_cache.cache.delete_many(list(keys))
+
 
 class DataSetCache(Cache):
     # == Raw query caching
@@ -397,6 +411,43 @@ class DataSetCache(Cache):
         key = self.get_permissions_key(**params)
         cache_buffer.set(key, permissions)
 
+    def get_indexes_key(self, dataset_id):
+        return "dataset-indexes:%s" % (dataset_id,)
+
+    def get_indexes(self, dataset_id, indexes_getter):
+        """
+        Get the list of the dataset's data indexes. The list is read from and
+        cleared in the remote cache directly, rather than through the buffer,
+        so that index changes made outside of API requests (e.g., in the
+        admin) take effect right away. Since any change clears the list, it
+        is kept for DATA_INDEX_CACHE_TIMEOUT (by default, until it is cleared).
+        """
+        key = self.get_indexes_key(dataset_id)
+        indexes = django_cache.cache.get(key)
+        if indexes is None:
+            indexes = list(indexes_getter())
+            timeout = getattr(settings, "DATA_INDEX_CACHE_TIMEOUT", None)
+            django_cache.cache.set(key, indexes, timeout)
+        return indexes
+
+    def clear_indexes(self, dataset_id):
+        django_cache.cache.delete(self.get_indexes_key(dataset_id))
+
+    def get_compiled_permissions_key(self, **params):
+        return "dataset-compiled-permissions:%s" % (params["dataset_id"],)
+
+    def get_compiled_permissions(self, dataset_id, compiler):
+        """
+        Get the compiled data permissions for the dataset, compiling them if
+        they are not cached.
+        """
+        key = self.get_compiled_permissions_key(dataset_id=dataset_id)
+        compiled = cache_buffer.get(key)
+        if compiled is None:
+            compiled = compiler()
+            cache_buffer.set(key, compiled)
+        return compiled
+
     # == Serialized data caching
     def get_bulk_data_cache_key(self, dataset_id, submission_set_name, format, **flags):
         return "bulk_data:%s:%s:%s:%s" % (
@@ -406,6 +457,16 @@ class DataSetCache(Cache):
             ":".join(k for k, v in list(flags.items()) if v),
         )
 
+    def get_bulk_data_chunk_key(
+        self, dataset_id, submission_set_name, thing_id, **flags
+    ):
+        return "bulk_data_chunk:%s:%s:%s:%s" % (
+            dataset_id,
+            submission_set_name,
+            ":".join(k for k, v in sorted(flags.items()) if v),
+            thing_id,
+        )
+
     def get_instance_params(self, dataset_obj):
         params = {
             "owner_username": dataset_obj.owner.username,
@@ -420,15 +481,19 @@ class DataSetCache(Cache):
         owner, dataset = list(map(params.get, ("owner_username", "dataset_slug")))
         prefixes = super(DataSetCache, self).get_request_prefixes(**params)
 
-        instance_path = reverse("dataset-detail", args=[owner, dataset])
-        collection_path = reverse("dataset-list", args=[owner])
+        instance_path = routes.build_path("dataset-detail", owner, dataset)
+        collection_path = routes.build_path("dataset-list", owner)
         prefixes.update([instance_path, collection_path])
 
         return prefixes
 
     def get_other_keys(self, **params):
         return set(
-            [self.get_instance_key(**params), self.get_permissions_key(**params)]
+            [
+                self.get_instance_key(**params),
+                self.get_permissions_key(**params),
+                self.get_compiled_permissions_key(**params),
+            ]
         )
 
 
@@ -450,11 +515,11 @@ class PlaceCache(Cache):
         )
         prefixes = super(PlaceCache, self).get_request_prefixes(**params)
 
-        instance_path = reverse("place-detail", args=[owner, dataset, place])
-        collection_path = reverse("place-list", args=[owner, dataset])
-        dataset_instance_path = reverse("dataset-detail", args=[owner, dataset])
-        dataset_collection_path = reverse("dataset-list", args=[owner])
-        action_collection_path = reverse("action-list", args=[owner, dataset])
+        instance_path = routes.build_path("place-detail", owner, dataset, place)
+        collection_path = routes.build_path("place-list", owner, dataset)
+        dataset_instance_path = routes.build_path("dataset-detail", owner, dataset)
+        dataset_collection_path = routes.build_path("dataset-list", owner)
+        action_collection_path = routes.build_path("action-list", owner, dataset)
         prefixes.update(
             [
                 instance_path,
@@ -516,33 +581,36 @@ class SubmissionCache(Cache):
         # TODO: it's pretty clear that a developer should be able to register
         # a URL with or cache key or prefix or something to be cleared. How
         # would that work?
-        specific_instance_path = reverse(
+        specific_instance_path = routes.build_path(
             "submission-detail",
-            args=[owner, dataset, place_model, submission_set_name, submission],
+            owner,
+            dataset,
+            place_model,
+            submission_set_name,
+            submission,
         )
-        general_instance_path = reverse(
-            "submission-detail",
-            args=[owner, dataset, place_model, "submissions", submission],
+        general_instance_path = routes.build_path(
+            "submission-detail", owner, dataset, place_model, "submissions", submission
         )
-        specific_collection_path = reverse(
-            "submission-list", args=[owner, dataset, place_model, submission_set_name]
+        specific_collection_path = routes.build_path(
+            "submission-list", owner, dataset, place_model, submission_set_name
         )
-        general_collection_path = reverse(
-            "submission-list", args=[owner, dataset, place_model, "submissions"]
+        general_collection_path = routes.build_path(
+            "submission-list", owner, dataset, place_model, "submissions"
         )
-        specific_all_path = reverse(
-            "dataset-submission-list", args=[owner, dataset, submission_set_name]
+        specific_all_path = routes.build_path(
+            "dataset-submission-list", owner, dataset, submission_set_name
         )
-        general_all_path = reverse(
-            "dataset-submission-list", args=[owner, dataset, "submissions"]
+        general_all_path = routes.build_path(
+            "dataset-submission-list", owner, dataset, "submissions"
         )
-        place_instance_path = reverse(
-            "place-detail", args=[owner, dataset, place_model]
+        place_instance_path = routes.build_path(
+            "place-detail", owner, dataset, place_model
         )
-        place_collection_path = reverse("place-list", args=[owner, dataset])
-        dataset_instance_path = reverse("dataset-detail", args=[owner, dataset])
-        dataset_collection_path = reverse("dataset-list", args=[owner])
-        action_collection_path = reverse("action-list", args=[owner, dataset])
+        place_collection_path = routes.build_path("place-list", owner, dataset)
+        dataset_instance_path = routes.build_path("dataset-detail", owner, dataset)
+        dataset_collection_path = routes.build_path("dataset-list", owner)
+        action_collection_path = routes.build_path("action-list", owner, dataset)
 
         prefixes.update(
             [
@@ -640,26 +708,25 @@ class AttachmentCache(Cache):
         )
         prefixes = set()
 
-        specific_instance_path = reverse(
-            "submission-detail",
-            args=[owner, dataset, place, submission_set_name, submission],
+        specific_instance_path = routes.build_path(
+            "submission-detail", owner, dataset, place, submission_set_name, submission
         )
-        general_instance_path = reverse(
-            "submission-detail", args=[owner, dataset, place, "submissions", submission]
+        general_instance_path = routes.build_path(
+            "submission-detail", owner, dataset, place, "submissions", submission
         )
-        specific_collection_path = reverse(
-            "submission-list", args=[owner, dataset, place, submission_set_name]
+        specific_collection_path = routes.build_path(
+            "submission-list", owner, dataset, place, submission_set_name
         )
-        general_collection_path = reverse(
-            "submission-list", args=[owner, dataset, place, "submissions"]
+        general_collection_path = routes.build_path(
+            "submission-list", owner, dataset, place, "submissions"
         )
-        specific_all_path = reverse(
-            "dataset-submission-list", args=[owner, dataset, submission_set_name]
+        specific_all_path = routes.build_path(
+            "dataset-submission-list", owner, dataset, submission_set_name
         )
-        general_all_path = reverse(
-            "dataset-submission-list", args=[owner, dataset, "submissions"]
+        general_all_path = routes.build_path(
+            "dataset-submission-list", owner, dataset, "submissions"
         )
-        action_collection_path = reverse("action-list", args=[owner, dataset])
+        action_collection_path = routes.build_path("action-list", owner, dataset)
 
         prefixes.update(
             [
@@ -681,9 +748,9 @@ class AttachmentCache(Cache):
         )
         prefixes = set()
 
-        instance_path = reverse("place-detail", args=[owner, dataset, place])
-        collection_path = reverse("place-list", args=[owner, dataset])
-        action_collection_path = reverse("action-list", args=[owner, dataset])
+        instance_path = routes.build_path("place-detail", owner, dataset, place)
+        collection_path = routes.build_path("place-list", owner, dataset)
+        action_collection_path = routes.build_path("action-list", owner, dataset)
         prefixes.update([instance_path, collection_path, action_collection_path])
 
         return prefixes
@@ -0,0 +1,73 @@
+"""
+Matching request origins against the origin patterns of a dataset.
+
+A pattern is either a literal origin (e.g., "http://localhost:8000"), or has
+wildcards (e.g., "https://*.mapseed.org" or "localhost:*"). A pattern without
+a scheme matches both HTTP and HTTPS. Rather than trying each of a dataset's
+patterns in turn, an ``OriginMatcher`` looks literal origins up in a dict and
+matches all of the wildcard patterns with one combined regular expression.
+"""
+import re
+
+
+def normalize_pattern(pattern):
+    # No scheme specified; assume all HTTP[S]
+    if pattern != "*" and "://" not in pattern:
+        pattern = "http*://" + pattern
+    return pattern
+
+
+def get_pattern_regex(pattern):
+    """
+    Get the regular expression for an origin pattern, or None if the pattern
+    is a literal origin. The expression must match the whole origin.
+    """
+    pattern = normalize_pattern(pattern)
+    if "*" not in pattern:
+        return None
+    return ".*".join(re.escape(part) for part in pattern.split("*"))
+
+
+def match_pattern(pattern, origin):
+    """
+    Determine whether a given origin matches an origin pattern.
+    """
+    regex = get_pattern_regex(pattern)
+    if regex is None:
+        return normalize_pattern(pattern) == origin
+    return re.fullmatch(regex, origin) is not None
+
+
+class OriginMatcher(object):
+    def __init__(self, origins):
+        self.origins = list(origins)
+        self.exact = {}
+        self.first_regex_index = None
+
+        regexes = []
+        for index, origin in enumerate(self.origins):
+            regex = get_pattern_regex(origin.pattern)
+            if regex is None:
+                self.exact.setdefault(normalize_pattern(origin.pattern), index)
+            else:
+                if self.first_regex_index is None:
+                    self.first_regex_index = index
+                regexes.append("(?P<origin%s>%s)" % (index, regex))
+        self.regex = re.compile("|".join(regexes)) if regexes else None
+
+    def match(self, origin_header):
+        """
+        Get the first of the origins whose pattern matches the origin header,
+        or None if none of them match.
+        """
+        index = self.exact.get(origin_header)
+
+        # Only try the patterns if one of them comes before the exact match
+        if self.regex is not None and (index is None or index > self.first_regex_index):
+            match = self.regex.fullmatch(origin_header)
+            if match is not None:
+                regex_index = int(match.lastgroup[len("origin") :])
+                if index is None or regex_index < index:
+                    index = regex_index
+
+        return None if index is None else self.origins[index]
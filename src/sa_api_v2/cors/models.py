@@ -9,8 +9,6 @@ http://jetfar.com/simple-api-key-generation-in-python/
 license unknown.
 """
 
-import re
-
 from django.db import models
 from django.db.models.signals import post_save
 from django.utils.timezone import now
@@ -18,6 +16,7 @@ from django.utils.timezone import now
 from .. import utils
 from ..models import DataSet, OriginPermission, PlaceEmailTemplate
 from ..models.mixins import CloneableModelMixin
+from .matching import match_pattern
 
 
 class Origin(CloneableModelMixin, models.Model):
@@ -66,22 +65,7 @@ class Origin(CloneableModelMixin, models.Model):
         """
         Determine whether a given origin matches an origin pattern.
         """
-        # Universal
-        if pattern == "*":
-            return True
-
-        # No scheme specified; assume all HTTP[S]
-        if "://" not in pattern:
-            pattern = "http*://" + pattern
-
-        # No wild-cards; literal
-        if "*" not in pattern:
-            return pattern == origin
-
-        # Wildcards; convert to regex
-        else:
-            pattern = pattern.replace(".", r"\.").replace("*", r".*")
-            return re.match(pattern, origin) is not None
+        return match_pattern(pattern, origin)
 
     def clone_related(self, onto):
         for permission in self.permissions.all():
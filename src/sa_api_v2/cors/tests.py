@@ -10,6 +10,7 @@ from nose.tools import (
     assert_equal,
 )
 from sa_api_v2.cors.auth import OriginAuthentication
+from sa_api_v2.cors.matching import OriginMatcher
 from sa_api_v2.cors.models import Origin
 from sa_api_v2.models import DataSet, User
 
@@ -26,6 +27,7 @@ class TestOriginMatching(TestCase):
         assert_false(Origin.match(pattern, "https://github.com"))
         assert_true(Origin.match(pattern, "http://openplans.github.com"))
         assert_false(Origin.match(pattern, "http://openplansngithub.com"))
+        assert_false(Origin.match(pattern, "http://openplans.github.com.evil.net"))
 
     def test_match_ports_with_asterisk(self):
         pattern = "localhost:*"
@@ -42,6 +44,40 @@ class TestOriginMatching(TestCase):
         assert_true(Origin.match(pattern, "https://ishkabibble.com:443"))
 
 
+class TestOriginMatcher(TestCase):
+    def test_matches_the_first_matching_origin(self):
+        origins = [
+            Origin(pattern="http://localhost:8000"),
+            Origin(pattern="*.github.com"),
+            Origin(pattern="http://openplans.github.com"),
+            Origin(pattern="localhost:*"),
+        ]
+        matcher = OriginMatcher(origins)
+
+        assert_equal(matcher.match("http://localhost:8000"), origins[0])
+        assert_equal(matcher.match("https://localhost:8000"), origins[3])
+        assert_equal(matcher.match("http://openplans.github.com"), origins[1])
+        assert_equal(matcher.match("http://github.com"), None)
+        assert_equal(matcher.match("http://openplans.github.com.evil.net"), None)
+
+    def test_agrees_with_origin_match(self):
+        patterns = ["github.com", "*.github.com", "localhost:*", "http://github.com"]
+        headers = [
+            "https://github.com",
+            "ftp://github.com",
+            "http://openplans.github.com",
+            "http://openplansngithub.com",
+            "http://openplans.github.com.evil.net",
+            "http://localhost:8000",
+        ]
+        for pattern in patterns:
+            matcher = OriginMatcher([Origin(pattern=pattern)])
+            for header in headers:
+                assert_equal(
+                    matcher.match(header) is not None, Origin.match(pattern, header)
+                )
+
+
 class TestOriginClientAuth(TestCase):
     def setUp(self):
         Origin.objects.all().delete()
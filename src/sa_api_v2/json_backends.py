@@ -0,0 +1,308 @@
+"""
+Pluggable JSON encoding backends for the API renderers.
+
+The backend is chosen with the ``JSON_RENDERER_BACKEND`` setting, which is the
+import path of one of the backend classes below. Every backend can splice
+pre-encoded JSON into its output, so that values that are already stored as
+JSON, like geometries and data blobs, do not have to be decoded just to be
+encoded again. Serializers set such JSON aside in a ``JSONFragments`` side
+channel rather than putting it in their data.
+"""
+
+import copy
+import json
+import re
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+DEFAULT_JSON_RENDERER_BACKEND = "sa_api_v2.json_backends.StdlibJSONBackend"
+
+
+class JSONFragment(object):
+    """
+    A value that is already encoded as JSON, and should be included in the
+    rendered output verbatim.
+    """
+
+    __slots__ = ("json",)
+
+    def __init__(self, json):
+        self.json = json
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.json)
+
+
+class JSONMembers(JSONFragment):
+    """
+    The members of some already-encoded JSON objects, to be included in the
+    rendered output in place of the key/value pair that this is the value of.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, *objects):
+        members = []
+        for content in objects:
+            content = content.strip()
+            if not (content.startswith("{") and content.endswith("}")):
+                raise ValueError("Expected a JSON object, got %r" % (content,))
+            content = content[1:-1].strip()
+            if content:
+                members.append(content)
+        super(JSONMembers, self).__init__(",".join(members))
+
+
+class JSONFragments(object):
+    """
+    Pre-encoded JSON for parts of some serialized data, kept alongside the
+    data instead of in it. A serializer can set aside the JSON for the value
+    of a key in a dict (e.g., a geometry), or for members to merge into a dict
+    (e.g., a data blob), and leave them out of the dict. Renderers splice the
+    JSON into their output while `placeholders` is in effect. Anything else
+    that needs the whole data, like the response cache, can `resolve` it.
+
+    Fragments are recorded against the dicts themselves, so they only apply
+    to the same dict objects (or to copies registered with `alias`).
+    """
+
+    members_key = "\x00members"
+
+    def __init__(self):
+        # id(dict) -> [dict, {key: JSON}, [JSON object], number of keys the
+        # dict had when members were first added]
+        self._entries = {}
+        self._placed = False
+
+    def __bool__(self):
+        return bool(self._entries)
+
+    def _get_entry(self, obj):
+        entry = self._entries.get(id(obj))
+        if entry is None:
+            entry = self._entries[id(obj)] = [obj, {}, [], None]
+        return entry
+
+    def set_value(self, obj, key, content):
+        """
+        Render `obj[key]` as the given JSON. Until the data is rendered or
+        resolved, `obj[key]` is None.
+        """
+        obj[key] = None
+        self._get_entry(obj)[1][key] = content
+
+    def add_members(self, obj, content):
+        """
+        Merge the members of the given JSON object into `obj`, as
+        `obj.update(json.loads(content))` would at this point. Keys that are
+        set on `obj` afterwards still take precedence.
+        """
+        entry = self._get_entry(obj)
+        if entry[3] is None:
+            entry[3] = len(obj)
+        entry[2].append(content)
+
+    def alias(self, obj, copied):
+        """
+        Apply the fragments of `obj` to a shallow copy of it as well.
+        """
+        entry = self._entries.get(id(obj))
+        if entry is not None and copied is not obj:
+            self._entries[id(copied)] = [copied] + entry[1:]
+
+    def resolve(self, data):
+        """
+        Get a deep copy of the data, with the fragments decoded into it.
+        """
+        memo = {}
+        data = copy.deepcopy(data, memo)
+
+        for obj, values, members, position in self._entries.values():
+            copied = memo.get(id(obj))
+            if copied is None:
+                continue
+
+            for key, content in values.items():
+                copied[key] = json.loads(content)
+
+            if members:
+                later = [(key, copied.pop(key)) for key in list(copied)[position:]]
+                for content in members:
+                    copied.update(json.loads(content))
+                copied.update(later)
+
+        return data
+
+    @contextmanager
+    def placeholders(self):
+        """
+        Put `JSONFragment`s into the data in place of the fragments' values,
+        for the JSON backends to splice in, until the context exits. Nested
+        uses have no further effect.
+        """
+        if self._placed or not self._entries:
+            yield
+            return
+
+        self._placed = True
+        try:
+            for obj, values, members, position in self._entries.values():
+                for key, content in values.items():
+                    obj[key] = JSONFragment(content)
+
+                merged = JSONMembers(*members) if members else None
+                if merged is not None and merged.json:
+                    later = list(obj)[position:]
+                    obj[self.members_key] = merged
+                    for key in later:
+                        obj[key] = obj.pop(key)
+            yield
+        finally:
+            for obj, values, members, position in self._entries.values():
+                for key in values:
+                    obj[key] = None
+                obj.pop(self.members_key, None)
+            self._placed = False
+
+
+class BaseJSONBackend(object):
+    """
+    Encodes data to JSON bytes. Subclasses implement `encode`, and hand any
+    values that they cannot encode natively to `default`, which converts them
+    the same way DRF's JSONEncoder does. This class takes care of splicing any
+    `JSONFragment`s into the result.
+    """
+
+    encoder_class = JSONEncoder
+
+    def __init__(self):
+        self.encoder = self.encoder_class()
+
+    def encode(self, data, default, indent, compact, ensure_ascii, allow_nan):
+        raise NotImplementedError()
+
+    def dumps(
+        self, data, indent=None, compact=True, ensure_ascii=False, allow_nan=False
+    ):
+        fragments = []
+        placeholder_prefix = "__jsonfragment_%s_" % (uuid.uuid4().hex,)
+
+        def default(obj):
+            if isinstance(obj, JSONFragment):
+                fragments.append(obj)
+                return "%s%d__" % (placeholder_prefix, len(fragments) - 1)
+            return self.encoder.default(obj)
+
+        content = self.encode(data, default, indent, compact, ensure_ascii, allow_nan)
+
+        # Replace the (safely unique) placeholder strings with the fragments.
+        # Members replace the whole key/value pair that they are the value of.
+        if fragments:
+            pattern = re.compile(
+                rb'("(?:[^"\\]|\\.)*"\s*:\s*)?"'
+                + placeholder_prefix.encode()
+                + rb'(\d+)__"'
+            )
+
+            def splice(match):
+                fragment = fragments[int(match.group(2))]
+                content = (
+                    fragment.json.encode("utf-8")
+                    .replace(b"\xe2\x80\xa8", b"\\u2028")
+                    .replace(b"\xe2\x80\xa9", b"\\u2029")
+                )
+                if isinstance(fragment, JSONMembers):
+                    if match.group(1) is None:
+                        raise ValueError("JSONMembers must be the value of a dict")
+                    return content
+                return (match.group(1) or b"") + content
+
+            content = pattern.sub(splice, content)
+
+        return content
+
+
+class StdlibJSONBackend(BaseJSONBackend):
+    """
+    Encodes JSON with the standard library, just as DRF's JSONRenderer does.
+    """
+
+    def encode(self, data, default, indent, compact, ensure_ascii, allow_nan):
+        if indent is not None:
+            separators = (",", ": ")
+        else:
+            separators = (",", ":") if compact else (", ", ": ")
+
+        content = json.dumps(
+            data,
+            default=default,
+            indent=indent,
+            ensure_ascii=ensure_ascii,
+            allow_nan=allow_nan,
+            separators=separators,
+        )
+
+        # We always fully escape \u2028 and \u2029 to ensure we output JSON
+        # that is a valid javascript literal (see DRF's JSONRenderer).
+        content = content.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029")
+        return content.encode("utf-8")
+
+
+class OrjsonBackend(StdlibJSONBackend):
+    """
+    Encodes JSON with orjson. Datetimes, decimals, and other values that
+    orjson does not handle natively are converted the same way DRF converts
+    them. Falls back to the standard library for anything orjson refuses
+    (e.g., integers that overflow 64 bits, or a request for ASCII-only
+    output).
+    """
+
+    def __init__(self):
+        if orjson is None:
+            raise ImproperlyConfigured(
+                "The orjson package is required to use %s" % self.__class__.__name__
+            )
+        super(OrjsonBackend, self).__init__()
+
+    def encode(self, data, default, indent, compact, ensure_ascii, allow_nan):
+        if ensure_ascii:
+            return super(OrjsonBackend, self).encode(
+                data, default, indent, compact, ensure_ascii, allow_nan
+            )
+
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if indent is not None:
+            option |= orjson.OPT_INDENT_2
+
+        try:
+            content = orjson.dumps(data, default=default, option=option)
+        except orjson.JSONEncodeError:
+            return super(OrjsonBackend, self).encode(
+                data, default, indent, compact, ensure_ascii, allow_nan
+            )
+
+        return content.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
+
+
+@lru_cache(maxsize=None)
+def load_json_backend(path):
+    return import_string(path)()
+
+
+def get_json_backend():
+    path = getattr(settings, "JSON_RENDERER_BACKEND", DEFAULT_JSON_RENDERER_BACKEND)
+    return load_json_backend(path)
@@ -0,0 +1,91 @@
+from __future__ import print_function
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from sa_api_v2.apikey.models import ApiKey
+from sa_api_v2.cache import cache_buffer
+from sa_api_v2.models import DataSet, Group, User, check_data_permission
+from sa_api_v2.models.data_permissions import any_allow
+from timeit import repeat
+
+
+class Command(BaseCommand):
+    help = """
+    Compares checking data permissions by walking the dataset, client, and
+    group permissions on each check (as check_data_permission used to) and
+    with the compiled permission evaluators. The dataset is created in a
+    transaction that is rolled back afterwards, e.g.:
+
+        ./src/manage.py benchmarkDataPermissions --checks 10000
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checks", type=int, default=10000)
+        parser.add_argument("--groups", type=int, default=5)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def time(self, label, func, repetitions, count):
+        best = min(repeat(func, number=1, repeat=repetitions))
+        print(
+            "%-40s %8.1f ms  %8.2f us/check" % (label, best * 1000, best * 1e6 / count)
+        )
+
+    def handle(self, *args, **options):
+        count = options["checks"]
+        repetitions = options["repeat"]
+        set_names = ["places", "comments", "support", "tags"]
+
+        with transaction.atomic():
+            owner = User.objects.create(username="benchmark-permissions-owner")
+            dataset = DataSet.objects.create(owner=owner, slug="benchmark")
+            key = ApiKey.objects.create(dataset=dataset)
+
+            user = User.objects.create(username="benchmark-permissions-user")
+            for index in range(options["groups"]):
+                group = Group.objects.create(dataset=dataset, name="group-%s" % index)
+                group.submitters.add(user)
+                group.permissions.add_permission(
+                    set_names[index % len(set_names)], True, True, False, False
+                )
+
+            # Load everything the way a request would find it
+            dataset = (
+                DataSet.objects.prefetch_related("permissions", "keys__permissions")
+                .select_related("owner")
+                .get(id=dataset.id)
+            )
+            key = dataset.keys.all()[0]
+            user = User.objects.prefetch_related("_groups__permissions").get(id=user.id)
+
+            def checks():
+                for index in range(count):
+                    yield set_names[index % len(set_names)]
+
+            def walk(set_name):
+                if any_allow(dataset.permissions.all(), "update", set_name):
+                    return True
+                if any_allow(key.permissions.all(), "update", set_name):
+                    return True
+                for group in user._groups.all():
+                    if group.dataset_id == dataset.id and any_allow(
+                        group.permissions.all(), "update", set_name
+                    ):
+                        return True
+                return False
+
+            def with_walk():
+                for set_name in checks():
+                    walk(set_name)
+
+            def with_evaluator():
+                cache_buffer.reset()
+                for set_name in checks():
+                    check_data_permission(user, key, None, "update", dataset, set_name)
+
+            print(
+                "Checking %s permissions with %s groups (best of %s)"
+                % (count, options["groups"], repetitions)
+            )
+            self.time("Walk the permissions", with_walk, repetitions, count)
+            self.time("Compiled evaluator", with_evaluator, repetitions, count)
+
+            transaction.set_rollback(True)
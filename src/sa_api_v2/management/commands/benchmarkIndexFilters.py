@@ -0,0 +1,83 @@
+from __future__ import print_function
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from sa_api_v2.models import DataIndex, DataSet, IndexedValue, SubmittedThing, User
+from functools import reduce
+from timeit import repeat
+import operator
+import ujson as json
+
+
+class Command(BaseCommand):
+    help = """
+    Compares filtering things by several values of an index with a join and
+    an OR of the values (as filter_by_index used to) and with an EXISTS
+    subquery on the composite index. The things are created in a transaction
+    that is rolled back afterwards, e.g.:
+
+        ./src/manage.py benchmarkIndexFilters --things 100000
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--things", type=int, default=100000)
+        parser.add_argument("--values", type=int, default=5)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def time(self, label, func, repetitions):
+        best = min(repeat(func, number=1, repeat=repetitions))
+        print("%-40s %8.1f ms" % (label, best * 1000))
+
+    def create_things(self, dataset, count):
+        batch_size = 5000
+        for start in range(0, count, batch_size):
+            SubmittedThing.objects.bulk_create(
+                [
+                    SubmittedThing(
+                        dataset=dataset,
+                        data=json.dumps(
+                            {"category": "category-%s" % (index % 50,), "rank": index}
+                        ),
+                    )
+                    for index in range(start, min(start + batch_size, count))
+                ]
+            )
+
+    def handle(self, *args, **options):
+        count = options["things"]
+        repetitions = options["repeat"]
+        values = ["category-%s" % (index,) for index in range(options["values"])]
+
+        with transaction.atomic():
+            owner = User.objects.create(username="benchmark-index-filters")
+            dataset = DataSet.objects.create(owner=owner, slug="benchmark")
+
+            print("Creating and indexing %s things..." % (count,))
+            self.create_things(dataset, count)
+            index = DataIndex(dataset=dataset, attr_name="category")
+            index.save(reindex=False)
+            IndexedValue.objects.reindex([index], dataset.things.all())
+
+            def with_join():
+                matches_any_value = reduce(
+                    operator.or_,
+                    [Q(indexed_values__value=value) for value in values],
+                )
+                things = dataset.things.filter(
+                    indexed_values__index__attr_name="category"
+                ).filter(matches_any_value)
+                return list(things.values_list("pk", flat=True))
+
+            def with_exists():
+                things = dataset.things.filter_by_index(index, *values)
+                return list(things.values_list("pk", flat=True))
+
+            print(
+                "Filtering %s things by %s values (best of %s)"
+                % (count, len(values), repetitions)
+            )
+            print("%s things match" % (len(with_exists()),))
+            self.time("Join with OR of values", with_join, repetitions)
+            self.time("EXISTS with value IN", with_exists, repetitions)
+
+            transaction.set_rollback(True)
@@ -0,0 +1,124 @@
+from __future__ import print_function
+from django.core.management.base import BaseCommand
+from django.contrib.gis.geos import Point
+from rest_framework import renderers as drf_renderers
+from sa_api_v2.json_backends import JSONFragments, load_json_backend, orjson
+from sa_api_v2.renderers import GeoJSONRenderer
+from timeit import repeat
+import ujson as json
+
+
+class Command(BaseCommand):
+    help = """
+    Compares the throughput of the JSON renderer backends on a representative
+    feature collection, e.g.:
+
+        ./src/manage.py benchmarkRenderers --features 5000
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--features", type=int, default=5000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def make_feature(self, index, fragments=None):
+        """
+        Make a serialized place. If `fragments` is given, set its geometry and
+        data blob aside there as pre-encoded JSON, as the place serializer
+        does for the JSON renderers.
+        """
+        geometry = Point(-75.16 + index * 1e-5, 39.95 + index * 1e-5)
+        blob = json.dumps(
+            {
+                "name": "Place #%s" % index,
+                "description": "A place with a moderately long description " * 3,
+                "location_type": "landmark",
+                "submitter_name": "Somebody",
+                "rating": index % 5,
+            }
+        )
+        feature = {
+            "id": index,
+            "url": "http://localhost/api/v2/owner/datasets/slug/places/%s" % index,
+            "geometry": geometry.wkt,
+            "dataset": "http://localhost/api/v2/owner/datasets/slug",
+            "attachments": [],
+            "submitter": None,
+            "visible": True,
+            "created_datetime": "2019-12-01T12:34:56.789000+00:00",
+            "updated_datetime": "2019-12-01T12:34:56.789000+00:00",
+            "submission_sets": {"comments": {"name": "comments", "length": 2}},
+            "tags": {"url": "http://localhost/tags", "length": 0},
+        }
+        if fragments is not None:
+            fragments.set_value(feature, "geometry", geometry.json)
+            fragments.add_members(feature, blob)
+        else:
+            feature.update(json.loads(blob))
+        return feature
+
+    def time(self, label, func, repetitions, count):
+        best = min(repeat(func, number=1, repeat=repetitions))
+        print(
+            "%-40s %8.1f ms  %10.0f features/s"
+            % (label, best * 1000, count / best if best else float("inf"))
+        )
+
+    def handle(self, *args, **options):
+        count = options["features"]
+        repetitions = options["repeat"]
+
+        features = [self.make_feature(i) for i in range(count)]
+        fragments = JSONFragments()
+        fragment_features = [self.make_feature(i, fragments) for i in range(count)]
+
+        # The API rendered with DRF's own (stdlib json) renderer before the
+        # encoding backends were made pluggable.
+        drf_renderer = drf_renderers.JSONRenderer()
+        geojson_renderer = GeoJSONRenderer()
+
+        def render_with_drf(data):
+            return drf_renderer.render(
+                {
+                    "type": "FeatureCollection",
+                    "features": [geojson_renderer.get_feature(elem) for elem in data],
+                }
+            )
+
+        print("Rendering %s features (best of %s)" % (count, repetitions))
+        self.time(
+            "DRF JSONRenderer",
+            lambda: render_with_drf(features),
+            repetitions,
+            count,
+        )
+
+        backends = ["sa_api_v2.json_backends.StdlibJSONBackend"]
+        if orjson is not None:
+            backends.append("sa_api_v2.json_backends.OrjsonBackend")
+
+        for path in backends:
+            backend = load_json_backend(path)
+            name = path.rsplit(".", 1)[-1]
+
+            def render(data):
+                return backend.dumps(
+                    {
+                        "type": "FeatureCollection",
+                        "features": [
+                            geojson_renderer.get_feature(elem) for elem in data
+                        ],
+                    }
+                )
+
+            self.time(name, lambda: render(features), repetitions, count)
+
+            def render_with_fragments(data):
+                with fragments.placeholders():
+                    return render(data)
+
+            self.time(
+                name + " + fragments",
+                lambda: render_with_fragments(fragment_features),
+                repetitions,
+                count,
+            )
@@ -0,0 +1,76 @@
+from __future__ import print_function
+from django.core.management.base import BaseCommand
+from django.core.urlresolvers import reverse
+from django.test.client import RequestFactory
+from rest_framework.reverse import reverse as drf_reverse
+from sa_api_v2 import routes
+from timeit import repeat
+
+
+class Command(BaseCommand):
+    help = """
+    Compares building the URLs that each serialized place links to with
+    Django's reverse() and with the prebuilt route templates, e.g.:
+
+        ./src/manage.py benchmarkUrlBuilder --features 5000
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--features", type=int, default=5000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def time(self, label, func, repetitions, count):
+        best = min(repeat(func, number=1, repeat=repetitions))
+        print(
+            "%-40s %8.1f ms  %8.2f us/feature"
+            % (label, best * 1000, best * 1e6 / count)
+        )
+
+    def handle(self, *args, **options):
+        count = options["features"]
+        repetitions = options["repeat"]
+        request = RequestFactory().get("/api/v2/")
+
+        # The URLs in a serialized place: its own, its dataset's, and its
+        # submission sets' and tags'; and the request prefixes that saving a
+        # place clears from the cache.
+        def features():
+            for place_id in range(count):
+                owner, dataset = "owner", "dataset"
+                place_kwargs = {
+                    "owner_username": owner,
+                    "dataset_slug": dataset,
+                    "place_id": place_id,
+                }
+                dataset_kwargs = {"owner_username": owner, "dataset_slug": dataset}
+                comments_kwargs = dict(place_kwargs, submission_set_name="comments")
+                yield place_kwargs, dataset_kwargs, comments_kwargs
+
+        def with_reverse():
+            for place_kwargs, dataset_kwargs, comments_kwargs in features():
+                drf_reverse("place-detail", kwargs=place_kwargs, request=request)
+                drf_reverse("dataset-detail", kwargs=dataset_kwargs, request=request)
+                drf_reverse("submission-list", kwargs=comments_kwargs, request=request)
+                drf_reverse("place-tag-list", kwargs=place_kwargs, request=request)
+                reverse("place-detail", kwargs=place_kwargs)
+                reverse("place-list", kwargs=dataset_kwargs)
+                reverse("dataset-detail", kwargs=dataset_kwargs)
+                reverse("action-list", kwargs=dataset_kwargs)
+
+        def with_routes():
+            for place_kwargs, dataset_kwargs, comments_kwargs in features():
+                routes.build_url("place-detail", place_kwargs, request=request)
+                routes.build_url("dataset-detail", dataset_kwargs, request=request)
+                routes.build_url("submission-list", comments_kwargs, request=request)
+                routes.build_url("place-tag-list", place_kwargs, request=request)
+                routes.build_path("place-detail", **place_kwargs)
+                routes.build_path("place-list", **dataset_kwargs)
+                routes.build_path("dataset-detail", **dataset_kwargs)
+                routes.build_path("action-list", **dataset_kwargs)
+
+        print(
+            "Building 8 URLs for each of %s features (best of %s)"
+            % (count, repetitions)
+        )
+        self.time("reverse()", with_reverse, repetitions, count)
+        self.time("Route templates", with_routes, repetitions, count)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.22 on 2019-12-03 17:21
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import ujson as json
+
+
+def populate_public_data(apps, schema_editor):
+    SubmittedThing = apps.get_model("sa_api_v2", "SubmittedThing")
+
+    things = SubmittedThing.objects.filter(public_data__isnull=True)
+    for thing_id, data in things.values_list("id", "data").iterator():
+        public_data = json.dumps(
+            {
+                key: value
+                for key, value in json.loads(data).items()
+                if not key.startswith("private")
+            }
+        )
+        SubmittedThing.objects.filter(id=thing_id).update(public_data=public_data)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sa_api_v2", "0018_auto_20191126_0014"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="submittedthing",
+            name="public_data",
+            field=models.TextField(editable=False, null=True),
+        ),
+        migrations.RunPython(populate_public_data, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.22 on 2019-12-05 16:48
+from __future__ import unicode_literals
+
+import django.core.files.storage
+from django.db import migrations, models
+import sa_api_v2.models.bulk_data
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sa_api_v2", "0019_submittedthing_public_data"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="datasnapshot",
+            name="csv",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AlterField(
+            model_name="datasnapshot",
+            name="json",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AddField(
+            model_name="datasnapshot",
+            name="csv_file",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=django.core.files.storage.FileSystemStorage(),
+                upload_to=sa_api_v2.models.bulk_data.snapshot_filename,
+            ),
+        ),
+        migrations.AddField(
+            model_name="datasnapshot",
+            name="json_file",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=django.core.files.storage.FileSystemStorage(),
+                upload_to=sa_api_v2.models.bulk_data.snapshot_filename,
+            ),
+        ),
+    ]
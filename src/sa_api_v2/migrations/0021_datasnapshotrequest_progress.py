@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.22 on 2019-12-06 11:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sa_api_v2", "0020_datasnapshot_files"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="datasnapshotrequest",
+            name="shards_completed",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="datasnapshotrequest",
+            name="shards_total",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.22 on 2019-12-09 10:27
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sa_api_v2", "0021_datasnapshotrequest_progress"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="datasnapshotrequest",
+            name="data_version",
+            field=models.CharField(blank=True, default="", max_length=40),
+        ),
+    ]
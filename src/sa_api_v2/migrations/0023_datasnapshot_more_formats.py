@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.22 on 2019-12-10 15:41
+from __future__ import unicode_literals
+
+import django.core.files.storage
+from django.db import migrations, models
+import sa_api_v2.models.bulk_data
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sa_api_v2", "0022_datasnapshotrequest_data_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="datasnapshot",
+            name="gpkg_file",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=django.core.files.storage.FileSystemStorage(),
+                upload_to=sa_api_v2.models.bulk_data.snapshot_filename,
+            ),
+        ),
+        migrations.AddField(
+            model_name="datasnapshot",
+            name="ndjson_file",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=django.core.files.storage.FileSystemStorage(),
+                upload_to=sa_api_v2.models.bulk_data.snapshot_filename,
+            ),
+        ),
+        migrations.AddField(
+            model_name="datasnapshot",
+            name="parquet_file",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=django.core.files.storage.FileSystemStorage(),
+                upload_to=sa_api_v2.models.bulk_data.snapshot_filename,
+            ),
+        ),
+    ]
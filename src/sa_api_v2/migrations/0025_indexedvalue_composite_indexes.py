@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.22 on 2019-12-13 10:18
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sa_api_v2", "0024_typed_indexed_values"),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name="indexedvalue",
+            index_together=set(
+                [
+                    ("index", "value", "thing"),
+                    ("index", "number_value", "thing"),
+                    ("index", "datetime_value", "thing"),
+                ]
+            ),
+        ),
+    ]
@@ -2,6 +2,10 @@ import time
 import uuid
 
 from django.contrib.gis.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .core import AttachmentStorage
 
 
 class DataSnapshotRequest(models.Model):
@@ -12,6 +16,8 @@ class DataSnapshotRequest(models.Model):
     include_private_places = models.BooleanField(default=False)
     include_invisible = models.BooleanField(default=False)
     include_submissions = models.BooleanField(default=False)
+    # Identify the state of the data when it was requested
+    data_version = models.CharField(max_length=40, default="", blank=True)
     # Describe the requester
     requester = models.ForeignKey("User", null=True)
     requested_at = models.DateTimeField(auto_now_add=True)
@@ -19,6 +25,9 @@ class DataSnapshotRequest(models.Model):
     status = models.TextField(default="", blank=True)
     fulfilled_at = models.DateTimeField(null=True)
     guid = models.TextField(unique=True, default="", blank=True)
+    # Describe the progress of a request that is generated in shards
+    shards_total = models.PositiveIntegerField(default=0)
+    shards_completed = models.PositiveIntegerField(default=0)
 
     class Meta:
         app_label = "sa_api_v2"
@@ -27,16 +36,55 @@ class DataSnapshotRequest(models.Model):
     def __str__(self):
         return "Bulk request for %s %s" % (self.dataset, self.submission_set)
 
+    @property
+    def progress(self):
+        """
+        The fraction of the request's shards that have been generated, or
+        None if the request has not been split into shards yet.
+        """
+        if not self.shards_total:
+            return None
+        return min(self.shards_completed / self.shards_total, 1.0)
+
     @staticmethod
     def get_current_time_bucket():
         timestamp = time.time()
         return timestamp - (timestamp % 60)  # Each minute
 
 
+def snapshot_filename(snapshot, filename):
+    return "".join(["snapshots/", filename])
+
+
 class DataSnapshot(models.Model):
+    """
+    The generated content for a snapshot request, in each format. The content
+    is written to the attachment storage as gzip-compressed files (except in
+    the formats that compress their own content). Snapshots generated before
+    that have their content inline in the `json` and `csv` fields instead.
+    """
+
+    FILE_FORMATS = ("json", "csv", "ndjson", "gpkg", "parquet")
+    UNCOMPRESSED_FILE_FORMATS = ("parquet",)
+
     request = models.OneToOneField("DataSnapshotRequest", related_name="fulfillment")
-    json = models.TextField()
-    csv = models.TextField()
+    json = models.TextField(blank=True, default="")
+    csv = models.TextField(blank=True, default="")
+    json_file = models.FileField(
+        upload_to=snapshot_filename, storage=AttachmentStorage(), null=True, blank=True
+    )
+    csv_file = models.FileField(
+        upload_to=snapshot_filename, storage=AttachmentStorage(), null=True, blank=True
+    )
+    ndjson_file = models.FileField(
+        upload_to=snapshot_filename, storage=AttachmentStorage(), null=True, blank=True
+    )
+    gpkg_file = models.FileField(
+        upload_to=snapshot_filename, storage=AttachmentStorage(), null=True, blank=True
+    )
+    parquet_file = models.FileField(
+        upload_to=snapshot_filename, storage=AttachmentStorage(), null=True, blank=True
+    )
 
     @property
     def geojson(self):
@@ -49,3 +97,20 @@ class DataSnapshot(models.Model):
     class Meta:
         app_label = "sa_api_v2"
         db_table = "sa_api_datasnapshot"
+
+    def get_file(self, format):
+        """
+        Get the file with the content in the given format, or None if the
+        content is stored inline or was not generated.
+        """
+        if format == "geojson":
+            format = "json"
+        return getattr(self, format + "_file") or None
+
+
+@receiver(post_delete, sender=DataSnapshot)
+def delete_snapshot_files(sender, instance, using, **kwargs):
+    for format in DataSnapshot.FILE_FORMATS:
+        snapshot_file = instance.get_file(format)
+        if snapshot_file:
+            snapshot_file.delete(save=False)
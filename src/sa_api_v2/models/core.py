@@ -1,8 +1,10 @@
+import hashlib
 import jwt
 import ujson as json
 from django.conf import settings
 from django.contrib.gis.db import models
 from django.contrib.gis.db.models import query
+from django.contrib.gis.db.models.functions import AsGeoJSON, GeoFunc
 from django.core.exceptions import ValidationError
 from django.core.files.storage import get_storage_class
 from django.utils.timezone import now
@@ -20,11 +22,25 @@ from jwt.exceptions import (
 )
 
 from .. import cache, utils
+from ..cors.matching import OriginMatcher
 from .caching import CacheClearingModel
-from .data_indexes import FilterByIndexMixin, IndexedValue
+from .data_indexes import DataIndex, FilterByIndexMixin, IndexedValue
 from .mixins import CloneableModelMixin
 from .profiles import User
 
+JWT_ALGORITHM = "HS256"
+JWT_CACHE_SIZE = 10000
+JWT_CACHE_TIMEOUT = 60 * 60
+
+# Place ids of recently verified JWTs, by the digest of the token and secret
+verified_jwts = utils.ExpiringLRUCache(JWT_CACHE_SIZE, JWT_CACHE_TIMEOUT)
+
+
+def get_jwt_digest(token):
+    if isinstance(token, str):
+        token = token.encode("utf-8")
+    return hashlib.sha256(settings.JWT_SECRET.encode("utf-8") + token).hexdigest()
+
 
 class TimeStampedModel(models.Model):
     created_datetime = models.DateTimeField(default=now, blank=True, db_index=True)
@@ -34,12 +50,41 @@ class TimeStampedModel(models.Model):
         abstract = True
 
 
+def is_private_attr(key):
+    return key.startswith("private")
+
+
+def make_public_data(data):
+    """
+    Get a JSON string of the given data blob with any private attributes
+    removed.
+    """
+    blob_data = json.loads(data)
+    return json.dumps(
+        {key: value for key, value in blob_data.items() if not is_private_attr(key)}
+    )
+
+
 class ModelWithDataBlob(models.Model):
     data = models.TextField(default="{}")
 
+    # The data blob without its private attributes. This is kept up to date
+    # when the model is saved so that public representations of the model do
+    # not need to filter the blob every time they are read.
+    public_data = models.TextField(null=True, editable=False)
+
     class Meta:
         abstract = True
 
+    def save(self, *args, **kwargs):
+        self.public_data = make_public_data(self.data)
+
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "data" in update_fields:
+            kwargs["update_fields"] = set(update_fields) | {"public_data"}
+
+        return super(ModelWithDataBlob, self).save(*args, **kwargs)
+
 
 class SubmittedThingQuerySet(FilterByIndexMixin, query.QuerySet):
     # Custom version of create that passes needed kwargs to save.
@@ -88,16 +133,49 @@ class SubmittedThing(
         app_label = "sa_api_v2"
         db_table = "sa_api_submittedthing"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(SubmittedThing, cls).from_db(db, field_names, values)
+        # Remember the data blob as loaded, to tell whether any indexed
+        # values have changed when the thing is saved.
+        instance._loaded_data = instance.__dict__.get("data")
+        return instance
+
+    def get_indexes(self):
+        return DataSet.get_cached_indexes(self.dataset_id)
+
     def index_values(self, indexes=None):
         if indexes is None:
-            indexes = self.dataset.indexes.all()
+            indexes = self.get_indexes()
 
         if len(indexes) == 0:
             return
 
-        data = json.loads(self.data)
+        IndexedValue.objects.sync_many([(self.id, self.data)], indexes)
+
+    def has_changed_indexed_values(self, indexes):
+        """
+        Whether the values of any of the indexed attributes have changed since
+        the thing was loaded. Things that weren't loaded from the database are
+        assumed to have changed.
+        """
+        loaded_data = getattr(self, "_loaded_data", None)
+        if loaded_data is None:
+            return True
+        if loaded_data == self.data:
+            return False
+
+        old_data = json.loads(loaded_data)
+        new_data = json.loads(self.data)
         for index in indexes:
-            IndexedValue.objects.sync(self, index, data=data)
+            key = index.attr_name
+            if (key in old_data) != (key in new_data):
+                return True
+            if key in old_data:
+                old_value = index.get_indexed_values(old_data[key])
+                if old_value != index.get_indexed_values(new_data[key]):
+                    return True
+        return False
 
     def get_clone_save_kwargs(self):
         return {"silent": True, "reindex": False, "clear_cache": False}
@@ -113,10 +191,18 @@ class SubmittedThing(
         reindex = getattr(self, "reindex", reindex)
         is_new = self.id == None
 
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "data" not in update_fields:
+            reindex = False
+
         ret = super(SubmittedThing, self).save(*args, **kwargs)
 
+        # Only reindex when an indexed attribute has changed.
         if reindex:
-            self.index_values()
+            indexes = self.get_indexes()
+            if indexes and (is_new or self.has_changed_indexed_values(indexes)):
+                self.index_values(indexes)
+        self._loaded_data = self.data
 
         # All submitted things generate an action if not silent.
         if not silent:
@@ -167,26 +253,46 @@ class DataSet(CloneableModelMixin, CacheClearingModel, models.Model):
             self._submissions = Submission.objects.filter(dataset=self)
         return self._submissions
 
-    @utils.memo
     def get_key(self, key_string):
-        for ds_key in self.keys.all():
-            if ds_key.key == key_string:
-                return ds_key
-        return None
+        """
+        Get the dataset's API key with the given key string. The keys are
+        indexed by their strings on the dataset, so the index is cached along
+        with it.
+        """
+        if getattr(self, "_keys_by_string", None) is None:
+            self._keys_by_string = {ds_key.key: ds_key for ds_key in self.keys.all()}
+        return self._keys_by_string.get(key_string)
 
-    @utils.memo
     def get_origin(self, origin_header):
-        for ds_origin in self.origins.all():
-            if ds_origin.match(ds_origin.pattern, origin_header):
-                return ds_origin
-        return None
+        return self.get_origin_matcher().match(origin_header)
+
+    def get_origin_matcher(self):
+        """
+        Get a matcher for the dataset's origins. The matcher is kept on the
+        dataset, so it is cached along with it.
+        """
+        if getattr(self, "_origin_matcher", None) is None:
+            self._origin_matcher = OriginMatcher(self.origins.all())
+        return self._origin_matcher
+
+    @classmethod
+    def get_cached_indexes(cls, dataset_id):
+        """
+        Get the list of the data indexes of the dataset with the given id,
+        from the cache if possible.
+        """
+        return cls.cache.get_indexes(
+            dataset_id, lambda: DataIndex.objects.filter(dataset_id=dataset_id)
+        )
 
-    def reindex(self):
-        things = self.things.all()
-        indexes = self.indexes.all()
+    def get_index_map(self):
+        """
+        Get the dataset's data indexes, by attribute name.
+        """
+        return {index.attr_name: index for index in self.get_cached_indexes(self.pk)}
 
-        for thing in things:
-            thing.index_values(indexes)
+    def reindex(self, progress=None):
+        IndexedValue.objects.reindex(self.indexes.all(), self.things.all(), progress)
 
     def clone_related(self, onto):
         # Clone all the places. Submissions will be cloned as part of the
@@ -286,8 +392,39 @@ class PlaceEmailTemplate(TimeStampedModel):
         return "template id: %s" % (self.id)
 
 
+class SimplifyPreserveTopology(GeoFunc):
+    """
+    Simplifies a geometry to within the given tolerance (in the units of the
+    geometry's spatial reference system) without collapsing or invalidating
+    any of its rings.
+    """
+
+    function = "ST_SimplifyPreserveTopology"
+
+    def __init__(self, expression, tolerance, **extra):
+        extra.setdefault("output_field", models.GeometryField())
+        tolerance = self._handle_param(tolerance, "tolerance", (int, float))
+        super(SimplifyPreserveTopology, self).__init__(expression, tolerance, **extra)
+
+
 class GeoSubmittedThingQuerySet(query.GeoQuerySet, SubmittedThingQuerySet):
-    pass
+    def with_geojson(self, precision=None, simplify=None):
+        """
+        Have the database render each geometry as a GeoJSON string, stored on
+        the `geometry_geojson` attribute of each result. Coordinates are
+        rounded to `precision` decimal places and the geometry is simplified
+        to within the `simplify` tolerance, where given.
+        """
+        geometry = "geometry"
+        if simplify is not None:
+            geometry = SimplifyPreserveTopology(geometry, simplify)
+
+        # PostGIS will output at most 15 decimal places, which is effectively
+        # the full precision of the stored coordinates.
+        if precision is None:
+            precision = 15
+
+        return self.annotate(geometry_geojson=AsGeoJSON(geometry, precision=precision))
 
 
 class GeoSubmittedThingManager(models.GeoManager, SubmittedThingManager):
@@ -316,27 +453,42 @@ class Place(SubmittedThing):
         verbose_name = "place"
 
     def make_jwt(self):
-        return jwt.encode({"place_id": self.id}, settings.JWT_SECRET, algorithm="HS256")
+        token = jwt.encode(
+            {"place_id": self.id}, settings.JWT_SECRET, algorithm=JWT_ALGORITHM
+        )
+        verified_jwts.set(get_jwt_digest(token), self.id)
+        return token
 
     def check_jwt(self, jwt_public):
-        try:
-            payload = jwt.decode(jwt_public, settings.JWT_SECRET, algorithm="RS256")
-            return payload["place_id"] == self.id
-        except (
-            InvalidTokenError,
-            DecodeError,
-            InvalidSignatureError,
-            ExpiredSignatureError,
-            InvalidAudienceError,
-            InvalidIssuedAtError,
-            ImmatureSignatureError,
-            InvalidKeyError,
-            InvalidAlgorithmError,
-            MissingRequiredClaimError,
-        ) as e:
-            # If the JWT decoding fails for any reason (invalid payload,
-            # invalid signature), an exception is thrown.
-            return False
+        digest = get_jwt_digest(jwt_public)
+        place_id = verified_jwts.get(digest)
+
+        if place_id is None:
+            try:
+                payload = jwt.decode(
+                    jwt_public, settings.JWT_SECRET, algorithms=[JWT_ALGORITHM]
+                )
+            except (
+                InvalidTokenError,
+                DecodeError,
+                InvalidSignatureError,
+                ExpiredSignatureError,
+                InvalidAudienceError,
+                InvalidIssuedAtError,
+                ImmatureSignatureError,
+                InvalidKeyError,
+                InvalidAlgorithmError,
+                MissingRequiredClaimError,
+            ) as e:
+                # If the JWT decoding fails for any reason (invalid payload,
+                # invalid signature), an exception is thrown.
+                return False
+
+            place_id = payload.get("place_id")
+            if place_id is not None:
+                verified_jwts.set(digest, place_id)
+
+        return place_id == self.id
 
     def clone_related(self, onto):
         data_overrides = {"place_model": onto, "dataset": onto.dataset}
@@ -1,14 +1,75 @@
-import operator
-from functools import reduce
+import datetime
+import math
 
 import ujson as json
 from django.contrib.gis.db import models
+from django.db import transaction
+from django.db.models import Case, Exists, OuterRef, Value, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
+from .. import cache
 from .mixins import CloneableModelMixin
 
+# The number of things to reindex at a time
+REINDEX_BATCH_SIZE = 1000
+
+# The comparisons that can be made against indexed values
+INDEX_LOOKUPS = ("exact", "gt", "gte", "lt", "lte", "in")
+
+
+def to_number(value):
+    if isinstance(value, bool):
+        raise ValueError("Not a number: %r" % (value,))
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError("Not a finite number: %r" % (value,))
+    return number
+
+
+def to_boolean(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ("true", "t", "yes", "on", "1"):
+        return True
+    if text in ("false", "f", "no", "off", "0"):
+        return False
+    raise ValueError("Not a boolean: %r" % (value,))
+
+
+def to_datetime(value):
+    if not isinstance(value, str):
+        raise ValueError("Not a date or time: %r" % (value,))
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError("Not a date or time: %r" % (value,))
+        parsed = datetime.datetime.combine(date, datetime.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, timezone.utc)
+    return parsed
+
+
+# Functions to convert data values (and query parameters) to each type
+ATTR_TYPE_CONVERTERS = {
+    "string": str,
+    "number": to_number,
+    "boolean": to_boolean,
+    "datetime": to_datetime,
+}
+
 
 class DataIndex(CloneableModelMixin, models.Model):
-    ATTR_TYPE_CHOICES = (("string", "String"),)
+    ATTR_TYPE_CHOICES = (
+        ("string", "String"),
+        ("number", "Number"),
+        ("boolean", "Boolean"),
+        ("datetime", "Date/time"),
+    )
 
     dataset = models.ForeignKey("DataSet", related_name="indexes")
     attr_name = models.CharField(
@@ -27,10 +88,41 @@ class DataIndex(CloneableModelMixin, models.Model):
     def __str__(self):
         return self.attr_name
 
-    def index_things(self):
-        things = self.dataset.things.all()
-        for thing in things:
-            IndexedValue.objects.sync(thing, self)
+    @property
+    def value_field(self):
+        """
+        The IndexedValue field that holds this index's values.
+        """
+        return IndexedValue.VALUE_FIELDS[self.attr_type]
+
+    def to_value(self, value):
+        """
+        Convert a data value to this index's type. Raises ValueError if it
+        can't be.
+        """
+        try:
+            return ATTR_TYPE_CONVERTERS[self.attr_type](value)
+        except TypeError:
+            raise ValueError("Can't convert %r to a %s" % (value, self.attr_type))
+
+    def get_indexed_values(self, value):
+        """
+        Get the values to store in each of the IndexedValue value fields for
+        a data value. The text of the value is always stored, so that values
+        can be matched exactly regardless of the index's type; a value that
+        can't be converted to the index's type is only stored as text.
+        """
+        indexed_values = dict.fromkeys(IndexedValue.VALUE_FIELDS_ORDER)
+        indexed_values["value"] = str(value)
+        if self.attr_type != "string":
+            try:
+                indexed_values[self.value_field] = self.to_value(value)
+            except ValueError:
+                pass
+        return tuple(indexed_values[field] for field in IndexedValue.VALUE_FIELDS_ORDER)
+
+    def index_things(self, progress=None):
+        IndexedValue.objects.reindex([self], self.dataset.things.all(), progress)
 
     def get_clone_save_kwargs(self):
         return {"reindex": False}
@@ -42,47 +134,146 @@ class DataIndex(CloneableModelMixin, models.Model):
         return ret
 
 
+@receiver(post_save, sender=DataIndex)
+@receiver(post_delete, sender=DataIndex)
+def clear_cached_indexes(sender, instance, **kwargs):
+    cache.DataSetCache().clear_indexes(instance.dataset_id)
+
+
 class IndexedValueManager(models.Manager):
     def sync(self, thing, index, data=None):
         if data is None:
-            data = json.loads(thing.data)
+            data = thing.data
+        self.sync_many([(thing.id, data)], [index])
 
-        if index.attr_name in data:
-            # If there is a value, index it.
-            try:
-                value = self.get(thing_id=thing.id, index_id=index.id)
-            except IndexedValue.DoesNotExist:
-                value = IndexedValue(thing_id=thing.id, index_id=index.id)
-
-            new_indexable_value = str(data[index.attr_name])
-            if value.value != new_indexable_value:
-                value.value = new_indexable_value
-                value.save()
-        else:
-            # If there's no value and there was one previously indexed, get
-            # rid of it.
-            self.filter(thing_id=thing.id, index_id=index.id).delete()
+    def sync_many(self, things_data, indexes):
+        """
+        Bring the indexed values of several things up to date with their data,
+        for each of the given indexes, with a fixed number of queries.
+        `things_data` is a list of (thing id, data) pairs, where the data is
+        either a dict or its JSON encoding. Returns the numbers of values
+        created, updated, and deleted.
+        """
+        indexes = list(indexes)
+        if not things_data or not indexes:
+            return 0, 0, 0
+
+        new_values = {}
+        for thing_id, data in things_data:
+            if isinstance(data, str):
+                data = json.loads(data)
+            for index in indexes:
+                if index.attr_name in data:
+                    new_values[(thing_id, index.id)] = index.get_indexed_values(
+                        data[index.attr_name]
+                    )
+
+        old_values = self.filter(
+            thing_id__in=[thing_id for thing_id, _ in things_data],
+            index_id__in=[index.id for index in indexes],
+        ).values_list("id", "thing_id", "index_id", *IndexedValue.VALUE_FIELDS_ORDER)
+
+        updated = {}
+        deleted = []
+        seen = set()
+        for value_id, thing_id, index_id, *old_value in old_values:
+            key = (thing_id, index_id)
+            if key not in new_values or key in seen:
+                # Either there's no value anymore, or this is a duplicate.
+                deleted.append(value_id)
+            elif tuple(old_value) != new_values[key]:
+                updated[value_id] = new_values[key]
+            seen.add(key)
+
+        created = [
+            IndexedValue(
+                thing_id=thing_id,
+                index_id=index_id,
+                **dict(zip(IndexedValue.VALUE_FIELDS_ORDER, values)),
+            )
+            for (thing_id, index_id), values in new_values.items()
+            if (thing_id, index_id) not in seen
+        ]
+
+        with transaction.atomic(savepoint=False):
+            if deleted:
+                self.filter(id__in=deleted).delete()
+            if updated:
+                field_updates = {}
+                for position, field in enumerate(IndexedValue.VALUE_FIELDS_ORDER):
+                    field_updates[field] = Case(
+                        *[
+                            When(id=value_id, then=Value(values[position]))
+                            for value_id, values in updated.items()
+                        ],
+                        output_field=IndexedValue._meta.get_field(field),
+                    )
+                self.filter(id__in=list(updated)).update(**field_updates)
+            if created:
+                self.bulk_create(created)
+
+        return len(created), len(updated), len(deleted)
+
+    def reindex(self, indexes, things, progress=None, batch_size=REINDEX_BATCH_SIZE):
+        """
+        Rebuild the indexed values of all the things in a queryset, for each
+        of the given indexes, a batch of things at a time. If a progress
+        callback is given, it is called after each batch with the number of
+        things indexed so far and the total number of things.
+        """
+        indexes = list(indexes)
+        if not indexes:
+            return
+
+        things = things.order_by("pk")
+        total = things.count() if progress is not None else None
+        done = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                things.filter(pk__gt=last_pk).values_list("pk", "data")[:batch_size]
+            )
+            if not batch:
+                break
+
+            self.sync_many(batch, indexes)
+
+            done += len(batch)
+            last_pk = batch[-1][0]
+            if progress is not None:
+                progress(done, total)
 
 
 class IndexedValue(models.Model):
     index = models.ForeignKey("DataIndex", related_name="values")
     thing = models.ForeignKey("SubmittedThing", related_name="indexed_values")
 
+    # The text of the value, whatever the index's type, and the value in the
+    # field for the index's type (so that, e.g., less than compares numbers
+    # as numbers)
     value = models.CharField(max_length=100, null=True, db_index=True)
-    # TODO: This might be better as:
-    #
-    #   * string_value
-    #   * number_value
-    #   * boolean_value
-    #   * datetime_value
-    #
-    #   So that we can use the appropriate comparisons for each (i.e., less
-    #   than operates differently on strings than on numbers)
+    number_value = models.FloatField(null=True, db_index=True)
+    boolean_value = models.NullBooleanField(db_index=True)
+    datetime_value = models.DateTimeField(null=True, db_index=True)
+
+    VALUE_FIELDS = {
+        "string": "value",
+        "number": "number_value",
+        "boolean": "boolean_value",
+        "datetime": "datetime_value",
+    }
+    VALUE_FIELDS_ORDER = ("value", "number_value", "boolean_value", "datetime_value")
 
     objects = IndexedValueManager()
 
     class Meta:
         app_label = "sa_api_v2"
+        # Filters look up the things with given values for an index.
+        index_together = [
+            ("index", "value", "thing"),
+            ("index", "number_value", "thing"),
+            ("index", "datetime_value", "thing"),
+        ]
 
     def get(self):
         data = json.loads(self.thing.data)
@@ -100,10 +291,51 @@ class FilterByIndexMixin(object):
     Mixin for model managers of indexed models.
     """
 
-    def filter_by_index(self, key, *values):
-        matches_any_values_clause = reduce(
-            operator.or_, [models.Q(indexed_values__value=value) for value in values]
+    def filter_by_matching_values(self, **value_filters):
+        """
+        Filter to the things that have an indexed value matching the given
+        filters. The match is checked with an EXISTS subquery, rather than a
+        join, so that each thing is returned at most once.
+        """
+        matching_values = IndexedValue.objects.filter(
+            thing_id=OuterRef("pk"), **value_filters
+        )
+        queryset = self.all()
+        annotation = "matches_index_%s" % (len(queryset.query.annotations),)
+        return queryset.annotate(**{annotation: Exists(matching_values)}).filter(
+            **{annotation: True}
         )
-        return self.filter(indexed_values__index__attr_name=key).filter(
-            matches_any_values_clause
+
+    def filter_by_index(self, key, *values):
+        """
+        Filter to the things whose value for the index matches any of the
+        given values exactly. The index can be given either as a DataIndex,
+        or by its attribute name.
+        """
+        if isinstance(key, DataIndex):
+            index_filter = {"index_id": key.id}
+        else:
+            index_filter = {"index__attr_name": key}
+        return self.filter_by_matching_values(
+            value__in=[str(value) for value in values], **index_filter
         )
+
+    def filter_by_index_lookup(self, index, lookup, *values):
+        """
+        Filter to the things whose value for the index compares to each of
+        the given query parameter values with the lookup (one of
+        INDEX_LOOKUPS). The values are converted to the index's type; for the
+        "in" lookup, each is a comma-separated list. Raises ValueError if a
+        value can't be converted.
+        """
+        field = index.value_field
+        queryset = self
+        for value in values:
+            if lookup == "in":
+                operand = [index.to_value(item) for item in value.split(",")]
+            else:
+                operand = index.to_value(value)
+            queryset = queryset.filter_by_matching_values(
+                index_id=index.id, **{"%s__%s" % (field, lookup): operand}
+            )
+        return queryset
@@ -1,7 +1,10 @@
+import hashlib
+from collections import defaultdict, namedtuple
 from django.contrib.gis.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
-from .. import utils
+from .. import cache, utils
 from .core import CacheClearingModel, DataSet, Place
 from .mixins import CloneableModelMixin
 
@@ -182,6 +185,16 @@ class OriginPermission(DataPermission):
         return "submitters %s" % (self.abilities(),)
 
 
+@receiver(post_save, sender=GroupPermission)
+@receiver(post_delete, sender=GroupPermission)
+def clear_cached_group_permission_users(sender, instance, **kwargs):
+    """
+    Clear the cached users in a group when the group's permissions change,
+    since the permissions are cached along with them.
+    """
+    cache.UserCache.clear_users(instance.group.submitters.values_list("id", flat=True))
+
+
 def create_data_permissions(sender, instance, created, **kwargs):
     """
     Create a default permission instance for a new dataset.
@@ -220,13 +233,184 @@ def any_allow(permissions, do_action, resource, protected=False):
     return False
 
 
+# The parts of a data permission that any_allow looks at, in a form that is
+# small to pickle into the cache.
+PermissionRule = namedtuple(
+    "PermissionRule",
+    (
+        "submission_set",
+        "can_create",
+        "can_retrieve",
+        "can_update",
+        "can_destroy",
+        "can_access_protected",
+    ),
+)
+
+
+class DataPermissionEvaluator(object):
+    """
+    A set of data permission rules, with a lookup table of whether they allow
+    each (action, resource, protected) combination. The table is filled in as
+    each combination is first checked, so that checking it again, for the same
+    request or any later request that uses the cached evaluator, is a single
+    dictionary lookup.
+    """
+
+    def __init__(self, rules=()):
+        self.rules = tuple(rules)
+        self.table = {}
+
+    @classmethod
+    def from_permissions(cls, permissions):
+        return cls(
+            PermissionRule(
+                *[getattr(permission, name) for name in PermissionRule._fields]
+            )
+            for permission in permissions
+        )
+
+    def __or__(self, other):
+        return DataPermissionEvaluator(self.rules + other.rules)
+
+    @property
+    def fingerprint(self):
+        """
+        A digest of the rules that allow anything, regardless of their order
+        or repetition. Evaluators with the same fingerprint allow the same
+        things.
+        """
+        if not hasattr(self, "_fingerprint"):
+            rules = sorted(set(rule for rule in self.rules if any(rule[1:5])))
+            self._fingerprint = hashlib.sha1(repr(rules).encode("utf-8")).hexdigest()
+        return self._fingerprint
+
+    def allows(self, do_action, resource, protected=False):
+        key = (do_action, resource, protected)
+        try:
+            return self.table[key]
+        except KeyError:
+            allowed = self.table[key] = bool(
+                any_allow(self.rules, do_action, resource, protected)
+            )
+            return allowed
+
+
+class CompiledDataPermissions(object):
+    """
+    All of the permissions that apply to a dataset: the dataset's own, its
+    API keys' and origins', and its groups'. Evaluators that combine the
+    dataset permissions with those of a particular client and set of groups
+    are built when they are first needed, and kept along with the rest.
+    """
+
+    def __init__(self, dataset_id):
+        self.dataset_evaluator = DataPermissionEvaluator.from_permissions(
+            DataSetPermission.objects.filter(dataset_id=dataset_id)
+        )
+
+        clients = defaultdict(list)
+        for permission in KeyPermission.objects.filter(key__dataset_id=dataset_id):
+            clients[("apikey", permission.key_id)].append(permission)
+        for permission in OriginPermission.objects.filter(
+            origin__dataset_id=dataset_id
+        ):
+            clients[("origin", permission.origin_id)].append(permission)
+        self.client_evaluators = {
+            client_key: DataPermissionEvaluator.from_permissions(permissions)
+            for client_key, permissions in clients.items()
+        }
+
+        groups = defaultdict(list)
+        for permission in GroupPermission.objects.filter(group__dataset_id=dataset_id):
+            groups[permission.group_id].append(permission)
+        self.group_evaluators = {
+            group_id: DataPermissionEvaluator.from_permissions(permissions)
+            for group_id, permissions in groups.items()
+        }
+
+        self.evaluators = {}
+
+    def get_evaluator(self, client_key=None, group_ids=()):
+        key = (client_key, group_ids)
+        try:
+            return self.evaluators[key]
+        except KeyError:
+            pass
+
+        evaluator = self.dataset_evaluator
+        if client_key in self.client_evaluators:
+            evaluator = evaluator | self.client_evaluators[client_key]
+        for group_id in group_ids:
+            if group_id in self.group_evaluators:
+                evaluator = evaluator | self.group_evaluators[group_id]
+
+        self.evaluators[key] = evaluator
+        return evaluator
+
+
+def get_data_permission_evaluator(user, client, dataset):
+    """
+    Get the evaluator for the permissions that the given user has on the
+    dataset in the context of the given client. The dataset's permissions are
+    compiled once and kept in the dataset cache until any of them change.
+    """
+    client_key = None
+    if client is not None and getattr(client, "dataset_id", None) == dataset.id:
+        client_key = (client._meta.model_name, client.pk)
+
+    group_ids = ()
+    if user is not None and user.is_authenticated():
+        group_ids = tuple(
+            sorted(
+                group.id
+                for group in user._groups.all()
+                if group.dataset_id == dataset.id
+            )
+        )
+
+    compiled = DataSet.cache.get_compiled_permissions(
+        dataset.id, lambda: CompiledDataPermissions(dataset.id)
+    )
+    return compiled.get_evaluator(client_key, group_ids)
+
+
+# The parts of a place that the place permission checks look at.
+PlaceMeta = namedtuple("PlaceMeta", ("submitter_id", "private"))
+
+
+def get_places_meta(place_ids):
+    """
+    Get the PlaceMeta for each of the places with the given ids, by id, in a
+    single query. Places that do not exist are left out.
+    """
+    return {
+        place_id: PlaceMeta(submitter_id, private)
+        for place_id, submitter_id, private in Place.objects.filter(
+            id__in=place_ids
+        ).values_list("id", "submitter_id", "private")
+    }
+
+
 def check_data_permission(
-    user, client, place_id, do_action, dataset, resource, protected=False
+    user,
+    client,
+    place_id,
+    do_action,
+    dataset,
+    resource,
+    protected=False,
+    place_meta=None,
 ):
     """
     Check whether the given user has permission on the resource in
     the context of the given client (e.g., an API key or an origin). Specify
     whether the permission is for protected data.
+
+    If the check is for a particular place, the place_meta can be anything
+    with the place's submitter_id and private flag, such as the place itself
+    or a PlaceMeta from get_places_meta; otherwise it is looked up by the
+    place_id when it is needed.
     """
     if do_action not in ("retrieve", "create", "update", "destroy"):
         raise ValueError
@@ -247,39 +431,24 @@ def check_data_permission(
     if user and dataset and user.id == dataset.owner_id:
         return True
 
-    # Start with the dataset permission
-    if dataset and any_allow(dataset.permissions.all(), do_action, resource, protected):
+    # Then check the dataset, client, and group permissions
+    if dataset and get_data_permission_evaluator(user, client, dataset).allows(
+        do_action, resource, protected
+    ):
         return True
 
-    # Then the client permission
-    if client is not None:
-        if client.dataset == dataset and any_allow(
-            client.permissions.all(), do_action, resource, protected
-        ):
-            return True
-
-    # Next, check the user's groups
-    if user is not None and user.is_authenticated():
-        for group in user._groups.all():
-            if (
-                dataset
-                and group.dataset_id == dataset.id
-                and any_allow(group.permissions.all(), do_action, resource, protected)
-            ):
-                return True
-
     # Finally, check place permissions:
     # 1) If user is the place's submitter and trying to Update/Delete the place, then allow
     # 2) if the place is private, and user doesn't have protected privileges (checked above), and user isn't the
     # submitter, then don't allow
-    if place_id is not None and user is not None and user.is_authenticated:
-        target_place = Place.objects.get(id=place_id)
-        submitter = getattr(target_place, "submitter", None)
-        place_submitter_id = getattr(submitter, "id", None)
-        user_id = getattr(user, "id", None)
-        if place_submitter_id == user_id:
+    if place_id is not None and user is not None and user.is_authenticated():
+        if place_meta is None:
+            place_meta = next(iter(get_places_meta([place_id]).values()), None)
+            if place_meta is None:
+                return False
+        if place_meta.submitter_id == user.id:
             return True
-        if target_place.private:
+        if place_meta.private:
             return False
 
     return False
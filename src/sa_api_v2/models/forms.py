@@ -1,11 +1,12 @@
 import logging
+from itertools import chain
 
 from django.contrib.gis.db import models
 from django.core.exceptions import ValidationError
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
 
-from .core import DataSet
+from .core import DataSet, is_private_attr
 from .flavors import Flavor
 from .profiles import Group
 
@@ -35,6 +36,8 @@ __all__ = [
     "TextAreaField",
     "CheckboxField",
     "RELATED_MODULES",
+    "FORM_FIELD_MODULES",
+    "get_known_data_keys",
 ]
 
 RELATED_MODULES = [
@@ -51,6 +54,18 @@ RELATED_MODULES = [
     "submitbuttonmodule",
 ]
 
+# The related modules that collect data
+FORM_FIELD_MODULES = [
+    "radiofield",
+    "numberfield",
+    "filefield",
+    "datefield",
+    "checkboxfield",
+    "textfield",
+    "addressfield",
+    "textareafield",
+]
+
 
 class Form(models.Model):
     label = models.CharField(max_length=127)
@@ -892,3 +907,30 @@ class RadioOption(FormFieldOption):
 
     class Meta(FormFieldOption.Meta):
         db_table = "ms_api_form_module_option_radio"
+
+
+def get_known_data_keys(dataset, include_private=False):
+    """
+    Get the data attribute keys that we know the things in a dataset may
+    have, from the fields on the dataset's form and from its data indexes.
+    """
+    modules = chain(
+        OrderedModule.objects.filter(stage__form__dataset=dataset).select_related(
+            *FORM_FIELD_MODULES
+        ),
+        NestedOrderedModule.objects.filter(
+            group__orderedmodule__stage__form__dataset=dataset
+        ).select_related(*FORM_FIELD_MODULES),
+    )
+
+    keys = set(index.attr_name for index in dataset.indexes.all())
+    for module in modules:
+        for field_name in FORM_FIELD_MODULES:
+            field = getattr(module, field_name)
+            if field is not None:
+                keys.add(field.key)
+
+    if not include_private:
+        keys = set(key for key in keys if not is_private_attr(key))
+
+    return keys
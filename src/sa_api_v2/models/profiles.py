@@ -1,10 +1,21 @@
 from django.contrib.auth.models import AbstractUser, UserManager
 from django.contrib.gis.db import models
+from django.db.models import prefetch_related_objects
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
 
 from .. import cache, utils
 from ..models.mixins import CloneableModelMixin
 from .caching import CacheClearingModel
 
+# Everything about a user that is needed to check their permissions and to
+# serialize them, which is cached along with the user (see CachedModelBackend).
+USER_GROUP_RELATIONS = (
+    "_groups__permissions",
+    "_groups__dataset__owner",
+)
+USER_PRINCIPAL_RELATIONS = USER_GROUP_RELATIONS + ("social_auth",)
+
 
 class ShareaboutsUserManager(UserManager):
     def get_queryset(self):
@@ -14,6 +25,9 @@ class ShareaboutsUserManager(UserManager):
             .prefetch_related("_groups")
         )
 
+    def with_principal_relations(self):
+        return self.get_queryset().prefetch_related(*USER_PRINCIPAL_RELATIONS)
+
     def get_twitter_access_token(self):
         from django.conf import settings
         import requests
@@ -123,7 +137,12 @@ class User(CacheClearingModel, AbstractUser):
 
     @utils.memo
     def get_groups(self):
-        return self._groups.all().prefetch_related("permissions")
+        """
+        Get the user's groups, with their permissions and datasets. Anything
+        that the user was not loaded with is loaded in one query per relation.
+        """
+        prefetch_related_objects([self], *USER_GROUP_RELATIONS)
+        return self._groups.all()
 
     class Meta:
         app_label = "sa_api_v2"
@@ -160,3 +179,34 @@ class Group(CloneableModelMixin, models.Model):
 
         for submitter in self.submitters.all():
             onto.submitters.add(submitter)
+
+
+@receiver(m2m_changed, sender=Group.submitters.through)
+def clear_cached_group_submitters(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Clear the cached users whose groups change, since their groups are cached
+    along with them.
+    """
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+
+    if reverse:
+        user_ids = [instance.pk]
+    elif action == "pre_clear":
+        user_ids = instance.submitters.values_list("id", flat=True)
+    else:
+        user_ids = pk_set
+    cache.UserCache.clear_users(user_ids)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def clear_cached_group_users(sender, instance, created=False, **kwargs):
+    if not created:
+        cache.UserCache.clear_users(instance.submitters.values_list("id", flat=True))
+
+
+@receiver(post_save, sender="social_django.UserSocialAuth")
+@receiver(post_delete, sender="social_django.UserSocialAuth")
+def clear_cached_social_auth_user(sender, instance, **kwargs):
+    cache.UserCache.clear_users([instance.user_id])
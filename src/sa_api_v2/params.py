@@ -12,6 +12,8 @@ INCLUDE_TAGS_PARAM = "include_tags"
 NEAR_PARAM = "near"
 DISTANCE_PARAM = "distance_lt"
 BBOX_PARAM = "bounds"
+PRECISION_PARAM = "precision"
+SIMPLIFY_PARAM = "simplify"
 FORMAT_PARAM = "format"
 TEXTSEARCH_PARAM = "search"
 JWT_PARAM = "token"
@@ -1,7 +1,19 @@
+import abc
+import csv
+import os
+import pyarrow
+import pyarrow.parquet
+import sqlite3
+import struct
+import tempfile
 import ujson as json
-from rest_framework.renderers import JSONRenderer
+from itertools import chain, islice
+from django.conf import settings
+from rest_framework import renderers
+from rest_framework_csv.misc import Echo
 from rest_framework_csv.renderers import CSVRenderer
 from django.contrib.gis.geos import GEOSGeometry
+from .json_backends import JSONFragments, get_json_backend
 
 
 class PaginatedCSVRenderer(CSVRenderer):
@@ -13,6 +25,494 @@ class PaginatedCSVRenderer(CSVRenderer):
         )
 
 
+class StreamingCSVRenderer(PaginatedCSVRenderer):
+    """
+    Renderer which can write CSV incrementally, one row at a time, so that a
+    large collection need not be held in memory all at once (see `stream`).
+
+    Since rows are written before all of them have been seen, the header is
+    decided up front, from a set of known keys (e.g., the dataset's form
+    fields) and a bounded sample of the first rows. Columns are always in
+    sorted order, as with the CSVRenderer.
+    """
+
+    header_sample_size = 1000
+
+    def get_header(self, sample, known_keys=()):
+        header_fields = set()
+        for item in self.flatten_data(sample):
+            header_fields.update(item.keys())
+        return self.complete_header(header_fields, known_keys)
+
+    def complete_header(self, header_fields, known_keys=()):
+        """
+        Get the header for rows with the given (flattened) fields, along with
+        the known keys.
+        """
+        header_fields = set(header_fields)
+
+        # Known keys may have been flattened into several columns in the
+        # sample (e.g., lists of checkbox values); only add the ones that
+        # weren't.
+        for key in known_keys:
+            prefix = key + self.level_sep
+            if not any(field.startswith(prefix) for field in header_fields):
+                header_fields.add(key)
+
+        return sorted(header_fields)
+
+    def stream(self, rows, known_keys=(), renderer_context=None):
+        """
+        Generate the encoded lines of CSV for the given iterable of rows.
+        """
+        renderer_context = renderer_context or {}
+        rows = iter(rows)
+        sample = list(islice(rows, self.header_sample_size))
+        header = renderer_context.get("header", self.header) or self.get_header(
+            sample, known_keys
+        )
+        yield from self.stream_rows(chain(sample, rows), header, renderer_context)
+
+    def stream_rows(self, rows, header, renderer_context=None, include_header=True):
+        """
+        Generate the encoded lines of CSV for the given iterable of rows, with
+        the given columns, and (unless include_header is False) the header
+        line first.
+        """
+        if not header:
+            return
+
+        renderer_context = renderer_context or {}
+        writer_opts = renderer_context.get("writer_opts", self.writer_opts or {})
+        labels = renderer_context.get("labels", self.labels)
+        encoding = renderer_context.get("encoding", settings.DEFAULT_CHARSET)
+
+        writer = csv.writer(Echo(), **writer_opts)
+        table = self.tablize(rows, header=header, labels=labels)
+        if not include_header:
+            table = islice(table, 1, None)
+        for row in table:
+            yield writer.writerow(row).encode(encoding)
+
+
+class TabularFileRenderer(StreamingCSVRenderer, metaclass=abc.ABCMeta):
+    """
+    Base for renderers of binary tabular file formats, which have the same
+    columns as the CSV, except that the geometry gets a column of its own
+    type. The data blobs are schemaless, so every other value is written as
+    text, just as it appears in the CSV.
+
+    Rows are written to a temporary file in batches as they come, and the
+    finished file is only produced at the end. `stream` yields an empty chunk
+    for each row that it takes, so that it can be consumed in step with the
+    streaming formats. Files written with the same columns can be merged into
+    one (see `merge_files`).
+    """
+
+    geometry_field = "geometry"
+    batch_size = 500
+    chunk_size = 64 * 1024
+
+    @abc.abstractmethod
+    def open_writer(self, path, header, has_geometry):
+        """
+        Create the file at the given path, and return a writer for it.
+        """
+
+    @abc.abstractmethod
+    def write_batch(self, writer, header, geometries, records):
+        """
+        Write rows, given as the WKB of their geometries (or None) and lists
+        of their values in the order of the header.
+        """
+
+    @abc.abstractmethod
+    def append_file(self, writer, header, path, part_header, part_has_geometry):
+        """
+        Write the rows of the file at the given path, which was written by
+        this renderer with the given columns. Any of the writer's columns that
+        the file doesn't have are left empty.
+        """
+
+    @abc.abstractmethod
+    def close_writer(self, writer):
+        """
+        Finish writing the file.
+        """
+
+    def get_columns(self, header):
+        return [field for field in header if field != self.geometry_field]
+
+    def format_value(self, value):
+        return None if value is None else str(value)
+
+    def get_wkb(self, geometry):
+        if not geometry:
+            return None
+        if isinstance(geometry, dict):
+            geometry = json.dumps(geometry)
+        if not isinstance(geometry, GEOSGeometry):
+            geometry = GEOSGeometry(geometry)
+        return bytes(geometry.wkb)
+
+    def stream(self, rows, known_keys=(), renderer_context=None):
+        """
+        Generate the encoded file for the given iterable of rows.
+        """
+        rows = iter(rows)
+        sample = list(islice(rows, self.header_sample_size))
+        has_geometry = any(self.geometry_field in row for row in sample)
+        header = self.get_header(sample, known_keys)
+        yield from self.stream_file(chain(sample, rows), header, has_geometry)
+
+    def stream_file(self, rows, header, has_geometry):
+        """
+        Generate the encoded file for the given iterable of rows, with the
+        columns of the given CSV header.
+        """
+        header = self.get_columns(header)
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "snapshot." + self.format)
+            writer = self.open_writer(path, header, has_geometry)
+
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    self.write_rows(writer, header, batch)
+                    batch = []
+                yield b""
+            self.write_rows(writer, header, batch)
+            self.close_writer(writer)
+            del writer
+
+            with open(path, "rb") as rendered:
+                for chunk in iter(lambda: rendered.read(self.chunk_size), b""):
+                    yield chunk
+
+    def merge_files(self, path, parts, header, has_geometry):
+        """
+        Write a file at the given path with the columns of the given CSV
+        header, and the rows of each of the parts, in order. The parts are
+        (path, header, has_geometry) tuples for files that were written by
+        this renderer with any subset of the columns.
+        """
+        header = self.get_columns(header)
+        writer = self.open_writer(path, header, has_geometry)
+        for part_path, part_header, part_has_geometry in parts:
+            self.append_file(
+                writer,
+                header,
+                part_path,
+                self.get_columns(part_header),
+                part_has_geometry,
+            )
+        self.close_writer(writer)
+
+    def write_rows(self, writer, header, rows):
+        if not rows:
+            return
+        geometries = [self.get_wkb(row.get(self.geometry_field)) for row in rows]
+        records = [
+            [self.format_value(item.get(key)) for key in header]
+            for item in self.flatten_data(
+                {key: value for key, value in row.items() if key != self.geometry_field}
+                for row in rows
+            )
+        ]
+        self.write_batch(writer, header, geometries, records)
+
+
+# The tables that every GeoPackage has, and the spatial reference systems
+# that it must define (see http://www.geopackage.org/spec/).
+GEOPACKAGE_SCHEMA = """
+PRAGMA application_id = 1196444487;
+PRAGMA user_version = 10200;
+CREATE TABLE gpkg_spatial_ref_sys (
+    srs_name TEXT NOT NULL,
+    srs_id INTEGER NOT NULL PRIMARY KEY,
+    organization TEXT NOT NULL,
+    organization_coordsys_id INTEGER NOT NULL,
+    definition TEXT NOT NULL,
+    description TEXT
+);
+CREATE TABLE gpkg_contents (
+    table_name TEXT NOT NULL PRIMARY KEY,
+    data_type TEXT NOT NULL,
+    identifier TEXT UNIQUE,
+    description TEXT DEFAULT '',
+    last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+    min_x DOUBLE,
+    min_y DOUBLE,
+    max_x DOUBLE,
+    max_y DOUBLE,
+    srs_id INTEGER REFERENCES gpkg_spatial_ref_sys(srs_id)
+);
+CREATE TABLE gpkg_geometry_columns (
+    table_name TEXT NOT NULL UNIQUE REFERENCES gpkg_contents(table_name),
+    column_name TEXT NOT NULL,
+    geometry_type_name TEXT NOT NULL,
+    srs_id INTEGER NOT NULL REFERENCES gpkg_spatial_ref_sys(srs_id),
+    z TINYINT NOT NULL,
+    m TINYINT NOT NULL,
+    PRIMARY KEY (table_name, column_name)
+);
+INSERT INTO gpkg_spatial_ref_sys VALUES (
+    'Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', NULL
+);
+INSERT INTO gpkg_spatial_ref_sys VALUES (
+    'Undefined geographic SRS', 0, 'NONE', 0, 'undefined', NULL
+);
+INSERT INTO gpkg_spatial_ref_sys VALUES (
+    'WGS 84 geodetic', 4326, 'EPSG', 4326,
+    'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,'
+    || 'AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,'
+    || 'AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,'
+    || 'AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4326"]]',
+    NULL
+);
+"""
+
+
+def quote_identifier(name):
+    return '"%s"' % (name.replace('"', '""'),)
+
+
+class GeoPackageRenderer(TabularFileRenderer):
+    """
+    Renderer which writes a GeoPackage with a single table. A GeoPackage is
+    an SQLite database, so it is written with the sqlite3 module.
+    """
+
+    media_type = "application/geopackage+sqlite3"
+    format = "gpkg"
+    table_name = "snapshot"
+    srs_id = 4326
+
+    def open_writer(self, path, header, has_geometry):
+        connection = sqlite3.connect(path)
+        connection.executescript(GEOPACKAGE_SCHEMA)
+
+        columns = ["fid INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL"]
+        if has_geometry:
+            columns.append("%s GEOMETRY" % (quote_identifier(self.geometry_field),))
+        columns.extend("%s TEXT" % (quote_identifier(field),) for field in header)
+        connection.execute(
+            "CREATE TABLE %s (%s)"
+            % (quote_identifier(self.table_name), ", ".join(columns))
+        )
+
+        if has_geometry:
+            connection.execute(
+                "INSERT INTO gpkg_contents (table_name, data_type, identifier, srs_id)"
+                " VALUES (?, 'features', ?, ?)",
+                (self.table_name, self.table_name, self.srs_id),
+            )
+            connection.execute(
+                "INSERT INTO gpkg_geometry_columns VALUES (?, ?, 'GEOMETRY', ?, 0, 0)",
+                (self.table_name, self.geometry_field, self.srs_id),
+            )
+        else:
+            connection.execute(
+                "INSERT INTO gpkg_contents (table_name, data_type, identifier)"
+                " VALUES (?, 'attributes', ?)",
+                (self.table_name, self.table_name),
+            )
+        return connection, has_geometry
+
+    def get_geometry_blob(self, wkb):
+        """
+        Wrap WKB in a GeoPackage geometry header: the magic number, version 0,
+        flags for little-endian with no envelope, and the SRS id.
+        """
+        if wkb is None:
+            return None
+        return b"GP\x00\x01" + struct.pack("<i", self.srs_id) + wkb
+
+    def write_batch(self, writer, header, geometries, records):
+        connection, has_geometry = writer
+        columns = list(header)
+        if has_geometry:
+            columns.insert(0, self.geometry_field)
+            records = [
+                [self.get_geometry_blob(wkb)] + record
+                for wkb, record in zip(geometries, records)
+            ]
+        if not columns:
+            records = [[] for record in records]
+            statement = "INSERT INTO %s DEFAULT VALUES" % (
+                quote_identifier(self.table_name),
+            )
+        else:
+            statement = "INSERT INTO %s (%s) VALUES (%s)" % (
+                quote_identifier(self.table_name),
+                ", ".join(quote_identifier(column) for column in columns),
+                ", ".join("?" for column in columns),
+            )
+        with connection:
+            connection.executemany(statement, records)
+
+    def append_file(self, writer, header, path, part_header, part_has_geometry):
+        connection, has_geometry = writer
+        part_columns = set(part_header)
+        if part_has_geometry:
+            part_columns.add(self.geometry_field)
+
+        columns = list(header)
+        if has_geometry:
+            columns.insert(0, self.geometry_field)
+        quoted_columns = [quote_identifier(column) for column in columns]
+        selected_columns = [
+            quote_identifier(column) if column in part_columns else "NULL"
+            for column in columns
+        ]
+        table = quote_identifier(self.table_name)
+
+        # The rows get new feature ids, in the same order.
+        connection.execute("ATTACH DATABASE ? AS part", (path,))
+        with connection:
+            connection.execute(
+                "INSERT INTO main.%s (%s) SELECT %s FROM part.%s ORDER BY fid"
+                % (
+                    table,
+                    ", ".join(quoted_columns) or "fid",
+                    ", ".join(selected_columns) or "NULL",
+                    table,
+                )
+            )
+        connection.execute("DETACH DATABASE part")
+
+    def close_writer(self, writer):
+        connection, has_geometry = writer
+        connection.close()
+
+
+class ParquetRenderer(TabularFileRenderer):
+    """
+    Renderer which writes Parquet, with any geometries encoded as WKB in a
+    GeoParquet geometry column.
+    """
+
+    media_type = "application/vnd.apache.parquet"
+    format = "parquet"
+
+    def open_writer(self, path, header, has_geometry):
+        fields = [pyarrow.field(field, pyarrow.string()) for field in header]
+        metadata = None
+        if has_geometry:
+            fields.append(pyarrow.field(self.geometry_field, pyarrow.binary()))
+            metadata = {
+                "geo": json.dumps(
+                    {
+                        "version": "1.0.0",
+                        "primary_column": self.geometry_field,
+                        "columns": {
+                            self.geometry_field: {
+                                "encoding": "WKB",
+                                "geometry_types": [],
+                            }
+                        },
+                    }
+                )
+            }
+        schema = pyarrow.schema(fields, metadata=metadata)
+        return pyarrow.parquet.ParquetWriter(path, schema)
+
+    def write_batch(self, writer, header, geometries, records):
+        columns = [
+            pyarrow.array([record[index] for record in records], pyarrow.string())
+            for index in range(len(header))
+        ]
+        if self.geometry_field in writer.schema.names:
+            columns.append(pyarrow.array(geometries, pyarrow.binary()))
+        writer.write_table(pyarrow.Table.from_arrays(columns, schema=writer.schema))
+
+    def append_file(self, writer, header, path, part_header, part_has_geometry):
+        part = pyarrow.parquet.ParquetFile(path)
+        for index in range(part.num_row_groups):
+            table = part.read_row_group(index)
+            columns = [
+                (
+                    table.column(field.name)
+                    if field.name in table.column_names
+                    else pyarrow.nulls(table.num_rows, field.type)
+                )
+                for field in writer.schema
+            ]
+            writer.write_table(pyarrow.Table.from_arrays(columns, schema=writer.schema))
+
+    def close_writer(self, writer):
+        writer.close()
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """
+    Renderer which serializes to JSON using the encoding backend configured
+    in the JSON_RENDERER_BACKEND setting. Any pre-encoded JSON that the view's
+    serializers set aside for the data is included in the output as-is.
+    """
+
+    supports_json_fragments = True
+
+    def get_json_fragments(self, renderer_context):
+        """
+        Get the pre-encoded JSON that the view's serializers set aside for the
+        data (see `OwnedResourceMixin.get_json_fragments`).
+        """
+        view = (renderer_context or {}).get("view", None)
+        get_json_fragments = getattr(view, "get_json_fragments", None)
+        fragments = get_json_fragments() if get_json_fragments else None
+        return fragments if fragments is not None else JSONFragments()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return bytes()
+
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+
+        with self.get_json_fragments(renderer_context).placeholders():
+            return get_json_backend().dumps(
+                data,
+                indent=indent,
+                compact=self.compact,
+                ensure_ascii=self.ensure_ascii,
+                allow_nan=not self.strict,
+            )
+
+    # What goes before, between, and after the items of a streamed list
+    list_prefix = b"["
+    list_separator = b","
+    list_suffix = b"]"
+
+    def stream(self, items, renderer_context=None):
+        """
+        Generate the encoded JSON for the given iterable of items as a list,
+        one item at a time.
+        """
+        yield self.list_prefix
+        yield from self.stream_items(items, renderer_context)
+        yield self.list_suffix
+
+    def stream_items(self, items, renderer_context=None):
+        """
+        Generate the encoded items of a streamed list, with the separators
+        between them but without the list's prefix and suffix, so that a list
+        can be streamed in several parts.
+        """
+        backend = get_json_backend()
+        separator = b""
+        with self.get_json_fragments(renderer_context).placeholders():
+            for item in items:
+                yield separator + backend.dumps(
+                    item,
+                    compact=self.compact,
+                    ensure_ascii=self.ensure_ascii,
+                    allow_nan=not self.strict,
+                )
+                separator = self.list_separator
+
+
 class GeoJSONRenderer(JSONRenderer):
     """
     Renderer which serializes to GeoJSON
@@ -23,6 +523,9 @@ class GeoJSONRenderer(JSONRenderer):
     geometry_field = "geometry"
     id_field = "id"
 
+    list_prefix = b'{"type":"FeatureCollection","features":['
+    list_suffix = b"]}"
+
     def render(self, data, media_type=None, renderer_context=None):
         """
         Renders *data* into a GeoJSON feature.
@@ -34,25 +537,36 @@ class GeoJSONRenderer(JSONRenderer):
                 data, media_type, renderer_context
             )
 
-        # Assume everything else is a successful geometry.
-        if isinstance(data, list):
-            new_data = {
-                "type": "FeatureCollection",
-                "features": [(self.get_feature(elem) or elem) for elem in data],
-            }
-        elif isinstance(data, dict) and data.get("type") == "FeatureCollection":
-            new_data = data.copy()
-            new_data["features"] = [
-                (self.get_feature(elem) or elem) for elem in data["features"]
-            ]
-        elif data is None:
-            new_data = None
-        else:
-            new_data = self.get_feature(data) or data
+        # Put any pre-encoded JSON in place before building the features,
+        # since they are built from copies of the data.
+        with self.get_json_fragments(renderer_context).placeholders():
+            # Assume everything else is a successful geometry.
+            if isinstance(data, list):
+                new_data = {
+                    "type": "FeatureCollection",
+                    "features": [(self.get_feature(elem) or elem) for elem in data],
+                }
+            elif isinstance(data, dict) and data.get("type") == "FeatureCollection":
+                new_data = data.copy()
+                new_data["features"] = [
+                    (self.get_feature(elem) or elem) for elem in data["features"]
+                ]
+            elif data is None:
+                new_data = None
+            else:
+                new_data = self.get_feature(data) or data
 
-        return super(GeoJSONRenderer, self).render(
-            new_data, media_type, renderer_context
-        )
+            return super(GeoJSONRenderer, self).render(
+                new_data, media_type, renderer_context
+            )
+
+    def stream_items(self, items, renderer_context=None):
+        """
+        Generate the encoded features of a streamed feature collection for the
+        given iterable of items.
+        """
+        features = ((self.get_feature(item) or item) for item in items)
+        return super(GeoJSONRenderer, self).stream_items(features, renderer_context)
 
     def get_feature(self, data):
         if "geometry" not in data:
@@ -79,6 +593,51 @@ class GeoJSONRenderer(JSONRenderer):
         return feature
 
 
+class NDJSONRenderer(JSONRenderer):
+    """
+    Renderer which serializes a list as newline-delimited JSON, one item per
+    line.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+    list_prefix = list_separator = list_suffix = b""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, list):
+            return super(NDJSONRenderer, self).render(
+                data, accepted_media_type, renderer_context
+            )
+        return b"".join(self.stream(data, renderer_context))
+
+    def stream_items(self, items, renderer_context=None):
+        """
+        Generate the encoded lines of JSON for the given iterable of items.
+        """
+        backend = get_json_backend()
+        with self.get_json_fragments(renderer_context).placeholders():
+            for item in items:
+                yield backend.dumps(
+                    item,
+                    compact=self.compact,
+                    ensure_ascii=self.ensure_ascii,
+                    allow_nan=not self.strict,
+                ) + b"\n"
+
+
+class GeoJSONSeqRenderer(NDJSONRenderer):
+    """
+    Renderer which serializes a list as newline-delimited GeoJSON features
+    (which GDAL reads as GeoJSONSeq).
+    """
+
+    def stream_items(self, items, renderer_context=None):
+        get_feature = GeoJSONRenderer().get_feature
+        features = ((get_feature(item) or item) for item in items)
+        return super(GeoJSONSeqRenderer, self).stream_items(features, renderer_context)
+
+
 class NullJSONRenderer(JSONRenderer):
     """
     Renderer JSON with a simple None value as null
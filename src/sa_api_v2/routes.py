@@ -0,0 +1,181 @@
+"""
+Prebuilt URL templates for the API routes.
+
+Django's ``reverse()`` tries every pattern registered under a name against
+its regular expression, which adds up when a serializer builds several URLs
+for each of thousands of features, or when the cache collects the request
+prefixes to invalidate. The routes below are plain string templates instead.
+Their arguments are quoted the same way ``reverse()`` quotes them, and the
+``sa_api_v2.E001`` system check makes sure that every template still resolves
+to the route of the same name in ``sa_api_v2.urls``.
+"""
+import re
+from functools import lru_cache
+from urllib.parse import quote, unquote
+
+from django.core import checks
+from django.core.urlresolvers import Resolver404, get_script_prefix, resolve, reverse
+
+# The characters that reverse() leaves unquoted (the "pchar" set from RFC
+# 3986), less "/", which can never appear inside a single URL argument.
+SAFE_ARG_CHARACTERS = "!$&'()*+,;=~:@"
+
+DATASET_PATH = "/{owner_username}/datasets/{dataset_slug}"
+PLACE_PATH = DATASET_PATH + "/places/{place_id}"
+
+ROUTE_TEMPLATES = {
+    "user-detail": "/{owner_username}",
+    "dataset-list": "/{owner_username}/datasets",
+    "dataset-detail": DATASET_PATH,
+    "dataset-submission-list": DATASET_PATH + "/{submission_set_name}",
+    "action-list": DATASET_PATH + "/actions",
+    "tag-list": DATASET_PATH + "/tags",
+    "tag-detail": DATASET_PATH + "/tags/{tag_id}",
+    "place-list": DATASET_PATH + "/places",
+    "place-detail": PLACE_PATH,
+    "place-tag-list": PLACE_PATH + "/tags",
+    "place-tag-detail": PLACE_PATH + "/tags/{place_tag_id}",
+    "submission-list": PLACE_PATH + "/{submission_set_name}",
+    "submission-detail": PLACE_PATH + "/{submission_set_name}/{submission_id}",
+    "attachment-detail": PLACE_PATH + "/attachments/{attachment_id}",
+}
+
+
+@lru_cache(maxsize=4096)
+def _quote_text(text):
+    return quote(text, safe=SAFE_ARG_CHARACTERS)
+
+
+def quote_arg(value):
+    """
+    Quote a single URL argument. Most arguments are ids, or one of a handful
+    of usernames, dataset slugs, and submission set names, so the quoted text
+    is memoized.
+    """
+    if type(value) is int:
+        return str(value)
+    return _quote_text(str(value))
+
+
+@lru_cache(maxsize=None)
+def get_api_root():
+    """
+    The path to the API root, without a trailing slash (e.g., "/api/v2").
+    """
+    return reverse("api-root").rstrip("/")
+
+
+class Route(object):
+    def __init__(self, name, template):
+        self.name = name
+        self.template = template
+        self.arg_names = tuple(re.findall(r"\{(\w+)\}", template))
+
+    def __repr__(self):
+        return "<Route %s: %s>" % (self.name, self.template)
+
+    def format(self, *args, **kwargs):
+        """
+        Fill the template with the quoted arguments, which can be given either
+        positionally, in the order they appear in the URL, or by name.
+        """
+        if args:
+            if len(args) != len(self.arg_names):
+                raise TypeError(
+                    "The %s route takes %s arguments (%s given)"
+                    % (self.name, len(self.arg_names), len(args))
+                )
+            kwargs = dict(zip(self.arg_names, args))
+        return self.template.format_map(
+            {name: quote_arg(kwargs[name]) for name in self.arg_names}
+        )
+
+
+ROUTES = {name: Route(name, template) for name, template in ROUTE_TEMPLATES.items()}
+
+
+def get_route(name):
+    try:
+        return ROUTES[name]
+    except KeyError:
+        raise ValueError("No API route named {} formatted.".format(name))
+
+
+def build_path(name, *args, **kwargs):
+    """
+    Build the path to the named API route, just as ``reverse(name, args=args)``
+    or ``reverse(name, kwargs=kwargs)`` would.
+    """
+    return get_api_root() + get_route(name).format(*args, **kwargs)
+
+
+def get_request_url_root(request):
+    """
+    The absolute URL of the API root for the given request. It is remembered
+    on the request, since looking up the host validates it against the allowed
+    hosts each time.
+    """
+    root = getattr(request, "_api_url_root", None)
+    if root is None:
+        root = "{}://{}{}".format(request.scheme, request.get_host(), get_api_root())
+        request._api_url_root = root
+    return root
+
+
+def build_url(name, kwargs, request=None, format=None):
+    """
+    Build the URL to the named API route. The URL is absolute if a request is
+    given, and has the format appended as an extension if one is given.
+    """
+    root = get_request_url_root(request) if request else get_api_root()
+    url = root + get_route(name).format(**kwargs)
+    if format is not None:
+        url += "." + format
+    return url
+
+
+def _sample_arg(arg_name):
+    if arg_name.endswith("_id"):
+        return 12
+    # Include characters that need quoting, and characters that must not be.
+    return "sample %s+é" % (arg_name.replace("_", "-"),)
+
+
+@checks.register(checks.Tags.urls)
+def check_route_templates(app_configs=None, **kwargs):
+    """
+    Check that each route template builds URLs that resolve back to the route
+    of the same name, with the same arguments.
+    """
+    errors = []
+    script_prefix_length = len(get_script_prefix()) - 1
+
+    for name, route in sorted(ROUTES.items()):
+        sample_kwargs = {
+            arg_name: _sample_arg(arg_name) for arg_name in route.arg_names
+        }
+        path = build_path(name, **sample_kwargs)
+
+        try:
+            match = resolve(unquote(path[script_prefix_length:]))
+        except Resolver404:
+            match = None
+
+        expected_kwargs = {key: str(value) for key, value in sample_kwargs.items()}
+        if (
+            match is None
+            or match.url_name != name
+            or {key: value for key, value in match.kwargs.items() if value is not None}
+            != expected_kwargs
+        ):
+            errors.append(
+                checks.Error(
+                    "The URL template for the %r route does not match the URL "
+                    "patterns." % (name,),
+                    hint="%r resolved to %r." % (path, match),
+                    obj=route,
+                    id="sa_api_v2.E001",
+                )
+            )
+
+    return errors
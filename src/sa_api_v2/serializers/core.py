@@ -46,6 +46,7 @@ from .. import apikey
 from .. import cors
 from .. import models
 from ..models import check_data_permission
+from ..renderers import GeoJSONRenderer
 from ..params import (
     INCLUDE_PRIVATE_FIELDS_PARAM,
     INCLUDE_INVISIBLE_PARAM,
@@ -54,6 +55,7 @@ from ..params import (
 )
 
 import logging
+import ujson as json
 
 logger = logging.getLogger(__name__)
 
@@ -406,18 +408,50 @@ class BasePlaceSerializer(SubmittedThingSerializer, serializers.ModelSerializer)
     def submitter_to_native(self, obj):
         return SimpleUserSerializer(obj.submitter).data if obj.submitter else None
 
+    def geometry_to_native(self, obj):
+        # If the database has already rendered the geometry (e.g., with
+        # reduced precision or simplified), use that as-is.
+        geometry_geojson = getattr(obj, "geometry_geojson", None)
+        if geometry_geojson:
+            return json.loads(geometry_geojson)
+
+        # = GeometryField(format='wkt')
+        return str(obj.geometry or "POINT(0 0)")
+
+    def geometry_to_json(self, obj):
+        """
+        Get the place's geometry as GeoJSON, if it can be had without decoding
+        anything: the database's rendering of it, or, when the renderer would
+        convert it to GeoJSON anyway, GEOS's. Otherwise, return None.
+        """
+        geometry_geojson = getattr(obj, "geometry_geojson", None)
+        if geometry_geojson:
+            return geometry_geojson
+
+        request = self.context.get("request", None)
+        renderer = getattr(request, "accepted_renderer", None)
+        if obj.geometry and isinstance(renderer, GeoJSONRenderer):
+            return obj.geometry.json
+
+        return None
+
     def to_representation(self, obj):
         obj = self.ensure_obj(obj)
         fields = self.get_fields()
 
         request = self.context.get("request", None)
 
+        # Hand the renderer the geometry as GeoJSON, if it can be included in
+        # the output as-is.
+        fragments = self.get_json_fragments()
+        geometry_json = self.geometry_to_json(obj) if fragments is not None else None
+
         dataset_field = fields["dataset"]
         data = {
             "id": obj.pk,  # = serializers.PrimaryKeyRelatedField(read_only=True)
-            "geometry": str(
-                obj.geometry or "POINT(0 0)"
-            ),  # = GeometryField(format='wkt')
+            "geometry": (
+                self.geometry_to_native(obj) if geometry_json is None else None
+            ),
             "dataset": dataset_field.get_url(obj.dataset, request,),
             "attachments": self.attachments_to_native(
                 obj
@@ -449,7 +483,10 @@ class BasePlaceSerializer(SubmittedThingSerializer, serializers.ModelSerializer)
                 obj, request=request, format=self.context.get("format", None)
             )
 
-        data = self.explode_data_blob(data)
+        if geometry_json is not None:
+            fragments.set_value(data, "geometry", geometry_json)
+
+        data = self.explode_data_blob(data, obj)
 
         # data = super(PlaceSerializer, self).to_representation(obj)
 
@@ -553,7 +590,7 @@ class BaseSubmissionSerializer(SubmittedThingSerializer, serializers.ModelSerial
 
     class Meta:
         model = models.Submission
-        exclude = ("set_name",)
+        exclude = ("set_name", "public_data")
 
 
 class SimpleSubmissionSerializer(BaseSubmissionSerializer):
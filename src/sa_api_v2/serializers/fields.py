@@ -1,10 +1,8 @@
 import ujson as json
-from django.utils.http import urlquote_plus
-from rest_framework.reverse import reverse
 from django.contrib.gis.geos import GEOSGeometry
 from django.core.exceptions import ValidationError
 from rest_framework import serializers
-from .. import models
+from .. import models, routes
 
 ###############################################################################
 #
@@ -84,37 +82,9 @@ def api_reverse(view_name, kwargs={}, request=None, format=None):
     """
     A special case of URL reversal where we know we're getting an API URL. This
     can be much faster than Django's built-in general purpose regex resolver.
-
+    See sa_api_v2.routes for the route templates.
     """
-    if request:
-        url = "{}://{}/api/v2".format(request.scheme, request.get_host())
-    else:
-        url = "/api/v2"
-
-    route_template_strings = {
-        "submission-detail": "/{owner_username}/datasets/{dataset_slug}/places/{place_id}/{submission_set_name}/{submission_id}",
-        "submission-list": "/{owner_username}/datasets/{dataset_slug}/places/{place_id}/{submission_set_name}",
-        "place-detail": "/{owner_username}/datasets/{dataset_slug}/places/{place_id}",
-        "place-list": "/{owner_username}/datasets/{dataset_slug}/places",
-        "place-tag-list": "/{owner_username}/datasets/{dataset_slug}/places/{place_id}/tags",
-        "dataset-detail": "/{owner_username}/datasets/{dataset_slug}",
-        "user-detail": "/{owner_username}",
-        "dataset-submission-list": "/{owner_username}/datasets/{dataset_slug}/{submission_set_name}",
-        "attachment-detail": "/{owner_username}/datasets/{dataset_slug}/places/{place_id}/attachments/{attachment_id}",
-    }
-
-    try:
-        route_template_string = route_template_strings[view_name]
-    except KeyError:
-        raise ValueError("No API route named {} formatted.".format(view_name))
-
-    url_params = dict([(key, urlquote_plus(val)) for key, val in kwargs.items()])
-    url += route_template_string.format(**url_params)
-
-    if format is not None:
-        url += "." + format
-
-    return url
+    return routes.build_url(view_name, kwargs, request=request, format=format)
 
 
 class ShareaboutsRelatedField(
@@ -164,7 +134,7 @@ class DataSetHyperlinkedField(serializers.HyperlinkedRelatedField):
             "owner_username": obj.owner.username,
             "dataset_slug": obj.slug,
         }
-        return reverse(self.view_name, kwargs=url_kwargs, request=request)
+        return api_reverse(self.view_name, kwargs=url_kwargs, request=request)
 
 
 class DataSetRelatedField(ShareaboutsRelatedField):
@@ -176,7 +146,7 @@ class DataSetRelatedField(ShareaboutsRelatedField):
             "owner_username": obj.owner.username,
             "dataset_slug": obj.slug,
         }
-        return reverse(self.view_name, kwargs=url_kwargs, request=request)
+        return api_reverse(self.view_name, kwargs=url_kwargs, request=request)
 
     def get_object(self, view_name, view_args, view_kwargs):
         lookup_kwargs = {
@@ -230,7 +200,7 @@ class TagRelatedField(serializers.HyperlinkedRelatedField):
             "dataset_slug": obj.dataset.slug,
             "tag_id": obj.pk,
         }
-        return reverse(
+        return api_reverse(
             self.view_name, kwargs=url_kwargs, request=request, format=format
         )
 
@@ -330,7 +300,7 @@ class TagIdentityField(serializers.HyperlinkedIdentityField):
             "dataset_slug": obj.dataset.slug,
             "tag_id": obj.pk,
         }
-        return reverse(view_name, kwargs=url_kwargs, request=request, format=format)
+        return api_reverse(view_name, kwargs=url_kwargs, request=request, format=format)
 
 
 class PlaceTagListIdentityField(ShareaboutsIdentityField):
@@ -354,10 +324,10 @@ class PlaceTagIdentityField(serializers.HyperlinkedIdentityField):
         url_kwargs = {
             "owner_username": obj.tag.dataset.owner.get_username(),
             "dataset_slug": obj.tag.dataset.slug,
-            "place_id": obj.place.id,
+            "place_id": obj.place_id,
             "place_tag_id": obj.pk,
         }
-        return reverse(view_name, kwargs=url_kwargs, request=request, format=format)
+        return api_reverse(view_name, kwargs=url_kwargs, request=request, format=format)
 
 
 class DataSetIdentityField(ShareaboutsIdentityField):
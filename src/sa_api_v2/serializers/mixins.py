@@ -3,6 +3,7 @@ from rest_framework import serializers, fields
 from collections import OrderedDict
 from rest_framework.relations import PKOnlyObject
 from rest_framework.fields import SkipField
+from ..models import is_private_attr
 from ..params import INCLUDE_PRIVATE_FIELDS_PARAM
 
 ###############################################################################
@@ -96,15 +97,49 @@ class DataBlobProcessor(EmptyModelSerializer):
 
         return attrs
 
-    def explode_data_blob(self, data):
+    def get_json_fragments(self):
+        """
+        Get the side channel through which pre-encoded JSON can be passed to
+        the view's renderer, or None if there isn't one (e.g., when rendering
+        CSV, or when serializing outside of a view).
+        """
+        view = self.context.get("view", None)
+        get_json_fragments = getattr(view, "get_json_fragments", None)
+        return get_json_fragments() if get_json_fragments else None
+
+    @property
+    def data(self):
+        data = super(DataBlobProcessor, self).data
+
+        # Serializer.data is a copy of the representation, so any JSON set
+        # aside for the representation has to apply to the copy too.
+        fragments = self.get_json_fragments()
+        if fragments is not None and hasattr(self, "_data"):
+            fragments.alias(self._data, data)
+        return data
+
+    def explode_data_blob(self, data, obj=None):
         blob = data.pop("data")
+        include_private = self.is_flag_on(INCLUDE_PRIVATE_FIELDS_PARAM)
+
+        # If the user did not ask for private data, and the object already
+        # has a public version of its blob, use that as-is. When the renderer
+        # can take it, pass the stored JSON along without decoding it.
+        public_blob = getattr(obj, "public_data", None)
+        if not include_private and public_blob is not None:
+            fragments = self.get_json_fragments()
+            if fragments is not None:
+                fragments.add_members(data, public_blob)
+            else:
+                data.update(json.loads(public_blob))
+            return data
 
         blob_data = json.loads(blob)
 
         # Did the user not ask for private data? Remove it!
-        if not self.is_flag_on(INCLUDE_PRIVATE_FIELDS_PARAM):
+        if not include_private:
             for key in list(blob_data.keys()):
-                if key.startswith("private"):
+                if is_private_attr(key):
                     del blob_data[key]
 
         data.update(blob_data)
@@ -114,7 +149,7 @@ class DataBlobProcessor(EmptyModelSerializer):
         obj = self.ensure_obj(obj)
         # data = super(DataBlobProcessor, self).to_representation(obj, None, None)
         data = super(DataBlobProcessor, self).to_representation(obj)
-        self.explode_data_blob(data)
+        self.explode_data_blob(data, obj)
         return data
 
 
@@ -1,19 +1,56 @@
+import csv
+import gzip
+import hashlib
+import io
+import os
+import pickle
 import requests
+import shutil
+import tempfile
 import ujson as json
-from celery import shared_task
+import uuid
+import zlib
+from celery import chord, shared_task
 from celery.result import AsyncResult
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.core import cache as django_cache
+from django.core.files import File
 from django.db import transaction
+from django.db.models import Count, F, Max
 from django.test.client import RequestFactory
 from django.utils.timezone import now
-from itertools import chain
+from itertools import count, tee, zip_longest
 from social_django.models import UserSocialAuth
-from .models import DataSnapshotRequest, DataSnapshot, DataSet, User
+from .models import (
+    Attachment,
+    AttachmentStorage,
+    DataSnapshotRequest,
+    DataSnapshot,
+    DataSet,
+    IndexedValue,
+    PlaceTag,
+    Submission,
+    User,
+    get_known_data_keys,
+)
+from .apikey.models import ApiKey
 from .serializers import (
     SimplePlaceSerializer,
     SimpleSubmissionSerializer,
     SimpleDataSetSerializer,
 )
-from .renderers import CSVRenderer, JSONRenderer, GeoJSONRenderer
+from .renderers import (
+    StreamingCSVRenderer,
+    JSONRenderer,
+    GeoJSONRenderer,
+    NDJSONRenderer,
+    GeoJSONSeqRenderer,
+    GeoPackageRenderer,
+    ParquetRenderer,
+    TabularFileRenderer,
+)
 
 import logging
 
@@ -25,18 +62,136 @@ log = logging.getLogger(__name__)
 #
 
 
-def generate_bulk_content(dataset, submission_set_name, **flags):
-    renderer_classes = {
-        "csv": CSVRenderer,
-        "json": GeoJSONRenderer if submission_set_name == "places" else JSONRenderer,
-    }
+# The number of places or submissions to serialize at a time
+SNAPSHOT_BATCH_SIZE = 500
+
+# The number of places or submissions to serialize in each parallel task
+SNAPSHOT_SHARD_SIZE = 5000
+
+# The size of the chunks to read snapshot files in
+SNAPSHOT_CHUNK_SIZE = 64 * 1024
 
+
+def get_bulk_queryset(dataset, submission_set_name, **flags):
     if submission_set_name == "places":
-        submissions = dataset.places.all()
-        serializer = SimplePlaceSerializer(submissions, many=True)
+        queryset = (
+            dataset.places.all()
+            .select_related("dataset", "dataset__owner", "submitter")
+            .prefetch_related(
+                "submitter__social_auth", "submissions", "attachments", "tags"
+            )
+        )
+        if flags.get("include_submissions"):
+            queryset = queryset.prefetch_related(
+                "submissions__submitter",
+                "submissions__submitter__social_auth",
+                "submissions__attachments",
+            )
     else:
-        submissions = dataset.submissions.filter(set_name=submission_set_name)
-        serializer = SimpleSubmissionSerializer(submissions, many=True)
+        queryset = (
+            dataset.submissions.filter(set_name=submission_set_name)
+            .select_related("dataset", "dataset__owner", "submitter")
+            .prefetch_related("submitter__social_auth", "attachments")
+        )
+    return queryset.order_by("pk")
+
+
+def get_related_querysets(submission_set_name, things):
+    """
+    Get querysets of the ids of the things (given as a list of ids or as a
+    queryset) that each kind of related object belongs to, for the related
+    objects that go into the things' serialized forms.
+    """
+    related_querysets = [
+        Attachment.objects.filter(thing_id__in=things).values_list("thing_id"),
+    ]
+    if submission_set_name == "places":
+        related_querysets += [
+            Submission.objects.filter(place_model_id__in=things).values_list(
+                "place_model_id"
+            ),
+            PlaceTag.objects.filter(place_id__in=things).values_list("place_id"),
+        ]
+    return related_querysets
+
+
+def get_related_versions(submission_set_name, thing_ids):
+    """
+    Get a mapping from each thing id to a summary of the related objects that
+    go into its serialized form, i.e. the latest update and the number of
+    each kind of related object. Any change to those objects (short of an
+    update with a backdated timestamp) changes the summary.
+    """
+    related_querysets = get_related_querysets(submission_set_name, thing_ids)
+
+    versions = defaultdict(tuple)
+    for kind, related_queryset in enumerate(related_querysets):
+        counts = related_queryset.order_by().annotate(
+            latest=Max("updated_datetime"), count=Count("id")
+        )
+        for thing_id, latest, thing_count in counts:
+            versions[thing_id] += ((kind, latest, thing_count),)
+    return versions
+
+
+def get_permissions_version(dataset):
+    """
+    Which submission sets are summarized depends on the dataset's
+    permissions, so they are part of the version of all the serialized data.
+    """
+    return tuple(
+        dataset.permissions.values_list(
+            "submission_set", "can_retrieve", "can_access_protected", "priority"
+        ).order_by("priority", "pk")
+    )
+
+
+def get_data_version(dataset, submission_set_name, **flags):
+    """
+    Get a digest of the state of all the data that goes into a snapshot: the
+    latest update and the number of the places or submissions, and of each
+    kind of related object, along with the dataset's permissions. Snapshots
+    of the same data version have the same content.
+    """
+    queryset = get_bulk_queryset(dataset, submission_set_name, **flags).order_by()
+    thing_ids = queryset.values("pk")
+
+    summaries = [queryset.aggregate(latest=Max("updated_datetime"), count=Count("id"))]
+    for related_queryset in get_related_querysets(submission_set_name, thing_ids):
+        summaries.append(
+            related_queryset.order_by().aggregate(
+                latest=Max("updated_datetime"), count=Count("id")
+            )
+        )
+
+    version = [(summary["latest"], summary["count"]) for summary in summaries]
+    version.append(get_permissions_version(dataset))
+    return hashlib.sha1(repr(version).encode("utf-8")).hexdigest()
+
+
+def iter_bulk_data(
+    dataset, submission_set_name, batch_size=SNAPSHOT_BATCH_SIZE, pk_range=None, **flags
+):
+    """
+    Generate the serialized places or submissions for a snapshot (optionally,
+    only those with ids in an inclusive range), fetching and serializing a
+    batch of them at a time.
+
+    Each serialized item is kept in the cache along with the version of the
+    item (its last update, and those of its related objects) that it was
+    serialized from. Only the items that are new or have changed since the
+    last snapshot are serialized again; items that have been deleted simply
+    aren't visited. Changes to submitters' profiles are picked up when the
+    cached items expire (see SNAPSHOT_CHUNK_CACHE_TIMEOUT).
+    """
+    serializer_class = (
+        SimplePlaceSerializer
+        if submission_set_name == "places"
+        else SimpleSubmissionSerializer
+    )
+    queryset = get_bulk_queryset(dataset, submission_set_name, **flags)
+    if pk_range is not None:
+        queryset = queryset.filter(pk__gte=pk_range[0], pk__lte=pk_range[1])
 
     # Construct a request for the serializer context
     r_data = {}
@@ -46,46 +201,480 @@ def generate_bulk_content(dataset, submission_set_name, **flags):
     r = RequestFactory().get("", data=r_data)
     r.get_dataset = lambda: dataset
 
-    # Render the data in each format
-    serializer.context["request"] = r
-    data = serializer.data
+    permissions_version = get_permissions_version(dataset)
+
+    timeout = getattr(settings, "SNAPSHOT_CHUNK_CACHE_TIMEOUT", None)
+    last_pk = 0
+    while True:
+        batch_versions = list(
+            queryset.filter(pk__gt=last_pk)
+            .values_list("pk", "updated_datetime")
+            .order_by("pk")[:batch_size]
+        )
+        if not batch_versions:
+            return
+
+        thing_ids = [thing_id for thing_id, _ in batch_versions]
+        related_versions = get_related_versions(submission_set_name, thing_ids)
+        versions = {
+            thing_id: (updated_datetime, related_versions[thing_id])
+            + permissions_version
+            for thing_id, updated_datetime in batch_versions
+        }
+        keys = {
+            thing_id: dataset.cache.get_bulk_data_chunk_key(
+                dataset.pk, submission_set_name, thing_id, **flags
+            )
+            for thing_id in thing_ids
+        }
+
+        # Use the cached items that are still current...
+        cached_chunks = django_cache.cache.get_many(list(keys.values()))
+        items = {}
+        for thing_id in thing_ids:
+            version, item = cached_chunks.get(keys[thing_id], (None, None))
+            if version == versions[thing_id]:
+                items[thing_id] = item
+
+        # ...and serialize the rest.
+        stale_ids = [thing_id for thing_id in thing_ids if thing_id not in items]
+        if stale_ids:
+            things = list(queryset.filter(pk__in=stale_ids))
+            serializer = serializer_class(things, many=True, context={"request": r})
+            new_chunks = {}
+            for thing, item in zip(things, serializer.data):
+                items[thing.pk] = item
+                new_chunks[keys[thing.pk]] = (versions[thing.pk], item)
+            django_cache.cache.set_many(new_chunks, timeout)
+
+        log.debug(
+            "Reused %s of %s serialized items for the snapshot"
+            % (len(thing_ids) - len(stale_ids), len(thing_ids))
+        )
+
+        # Things may have been deleted since the batch was listed.
+        for thing_id in thing_ids:
+            if thing_id in items:
+                yield items[thing_id]
+        last_pk = thing_ids[-1]
+
+
+def get_bulk_renderers(submission_set_name):
+    """
+    Get the renderer for each format of a snapshot.
+    """
+    if submission_set_name == "places":
+        json_renderer, ndjson_renderer = GeoJSONRenderer(), GeoJSONSeqRenderer()
+    else:
+        json_renderer, ndjson_renderer = JSONRenderer(), NDJSONRenderer()
+    return {
+        "json": json_renderer,
+        "ndjson": ndjson_renderer,
+        "csv": StreamingCSVRenderer(),
+        "gpkg": GeoPackageRenderer(),
+        "parquet": ParquetRenderer(),
+    }
+
+
+def is_compressed_format(format):
+    return format not in DataSnapshot.UNCOMPRESSED_FILE_FORMATS
+
+
+def get_bulk_file_extension(format):
+    return "." + format + (".gz" if is_compressed_format(format) else "")
+
+
+def compress_chunks(chunks):
+    """
+    Generate a gzip member with the content of the given chunks, a chunk at a
+    time.
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        yield compressor.compress(chunk)
+    yield compressor.flush()
+
+
+def spool_bulk_items(items, spool, columns):
+    """
+    Pass the serialized items through, while pickling them to the spool file
+    and noting their flattened fields, and whether any of them has a
+    geometry, in `columns`.
+    """
+    renderer = StreamingCSVRenderer()
+    for item in items:
+        pickle.dump(item, spool, pickle.HIGHEST_PROTOCOL)
+        for flat_item in renderer.flatten_data([item]):
+            columns["fields"].update(flat_item.keys())
+        if TabularFileRenderer.geometry_field in item:
+            columns["has_geometry"] = True
+        yield item
+
+
+def read_bulk_spool(spool):
+    spool.seek(0)
+    while True:
+        try:
+            yield pickle.load(spool)
+        except EOFError:
+            return
+
+
+def generate_bulk_content(items, submission_set_name, header=None, has_geometry=False):
+    """
+    Generate a part of a snapshot's content from the given serialized items, in
+    each format, as iterables of compressed chunks (see `merge_bulk_content`
+    for how the parts are put together). The list formats leave out the
+    prefix and suffix of the list, and the tabular formats are written as
+    files of their own. Without a header, only the formats that don't have
+    columns are generated.
+
+    The formats share a single pass over the items, so they should be consumed
+    in step with each other (as `write_bulk_content` does) to keep the number
+    of serialized items held in memory bounded.
+    """
+    renderers = {
+        format: renderer
+        for format, renderer in get_bulk_renderers(submission_set_name).items()
+        if (header is not None) == isinstance(renderer, StreamingCSVRenderer)
+    }
+    formats = sorted(renderers)
     content = {}
-    for format, renderer_class in list(renderer_classes.items()):
-        renderer = renderer_class()
-        content[format] = renderer.render(data)
+    for format, format_items in zip(formats, tee(items, len(formats))):
+        renderer = renderers[format]
+        if isinstance(renderer, TabularFileRenderer):
+            chunks = renderer.stream_file(format_items, header, has_geometry)
+        elif isinstance(renderer, StreamingCSVRenderer):
+            chunks = renderer.stream_rows(format_items, header, include_header=False)
+        else:
+            chunks = renderer.stream_items(format_items)
+        content[format] = (
+            compress_chunks(chunks) if is_compressed_format(format) else chunks
+        )
     return content
 
 
+def read_part_file(part_name, storage):
+    with storage.open(part_name, "rb") as part_file:
+        yield from iter(lambda: part_file.read(SNAPSHOT_CHUNK_SIZE), b"")
+
+
+def concatenate_list_parts(prefix, separator, suffix, part_names, storage):
+    """
+    Generate a list format's compressed content from the compressed parts, with
+    gzip members for the prefix and suffix around them and the separators
+    between them. A file of concatenated gzip members decompresses to the
+    concatenation of their contents.
+    """
+    if prefix:
+        yield gzip.compress(prefix)
+    for index, part_name in enumerate(part_names):
+        if index and separator:
+            yield gzip.compress(separator)
+        yield from read_part_file(part_name, storage)
+    if suffix:
+        yield gzip.compress(suffix)
+
+
+def concatenate_csv_parts(renderer, header, parts, storage):
+    """
+    Generate the compressed CSV content from the compressed parts, after the
+    header line. The parts that were written with other columns than the
+    header's (because their things don't have all of the snapshot's data
+    keys) are rewritten with the header's columns.
+    """
+    header_line = b"".join(renderer.stream_rows([], header))
+    if header_line:
+        yield gzip.compress(header_line)
+    for part in parts:
+        part_name = part["files"]["csv"]
+        if part["header"] == header:
+            yield from read_part_file(part_name, storage)
+            continue
+
+        with storage.open(part_name, "rb") as part_file:
+            lines = io.TextIOWrapper(
+                gzip.GzipFile(fileobj=part_file),
+                encoding=settings.DEFAULT_CHARSET,
+                newline="",
+            )
+            rows = (dict(zip(part["header"], row)) for row in csv.reader(lines))
+            yield from compress_chunks(
+                renderer.stream_rows(rows, header, include_header=False)
+            )
+
+
+def merge_tabular_parts(renderer, header, has_geometry, parts, storage):
+    """
+    Generate a tabular format's content from the parts, by merging the part
+    files into one.
+    """
+    compressed = is_compressed_format(renderer.format)
+    with tempfile.TemporaryDirectory() as tempdir:
+        part_files = []
+        for index, part in enumerate(parts):
+            part_path = os.path.join(tempdir, "%s.%s" % (index, renderer.format))
+            with storage.open(part["files"][renderer.format], "rb") as part_file, open(
+                part_path, "wb"
+            ) as local_file:
+                if compressed:
+                    part_file = gzip.GzipFile(fileobj=part_file)
+                shutil.copyfileobj(part_file, local_file)
+            part_files.append((part_path, part["header"], part["has_geometry"]))
+
+        path = os.path.join(tempdir, "snapshot." + renderer.format)
+        renderer.merge_files(path, part_files, header, has_geometry)
+        with open(path, "rb") as merged_file:
+            chunks = iter(lambda: merged_file.read(SNAPSHOT_CHUNK_SIZE), b"")
+            yield from (compress_chunks(chunks) if compressed else chunks)
+
+
+def merge_bulk_content(submission_set_name, known_keys, parts, storage):
+    """
+    Generate the content of a snapshot in each format from the parts that its
+    shards stored (see `store_bulk_data_shard`), as iterables of compressed
+    chunks. The CSV and tabular formats have a column for each of the data
+    keys of any of the things, along with the known keys. Parts with no items
+    are left out.
+    """
+    parts = [part for part in parts if part["count"]]
+    csv_renderer = StreamingCSVRenderer()
+    header = csv_renderer.complete_header(
+        set().union(*(part["fields"] for part in parts)), known_keys
+    )
+    has_geometry = any(part["has_geometry"] for part in parts)
+
+    renderers = get_bulk_renderers(submission_set_name)
+    content = {}
+    for format, renderer in renderers.items():
+        if isinstance(renderer, TabularFileRenderer):
+            content[format] = merge_tabular_parts(
+                renderer, header, has_geometry, parts, storage
+            )
+        elif isinstance(renderer, StreamingCSVRenderer):
+            content[format] = concatenate_csv_parts(renderer, header, parts, storage)
+        else:
+            content[format] = concatenate_list_parts(
+                renderer.list_prefix,
+                renderer.list_separator,
+                renderer.list_suffix,
+                [part["files"][format] for part in parts],
+                storage,
+            )
+    return content
+
+
+@contextmanager
+def write_bulk_content(content):
+    """
+    Write each format of the generated content to a temporary file, and
+    provide the files by format, ready to be saved.
+    """
+    formats = sorted(content)
+    with ExitStack() as stack:
+        files = {
+            format: stack.enter_context(tempfile.TemporaryFile()) for format in formats
+        }
+
+        # Write the formats in step, chunk by chunk.
+        for chunks in zip_longest(*[content[format] for format in formats]):
+            for format, chunk in zip(formats, chunks):
+                if chunk:
+                    files[format].write(chunk)
+
+        for format in formats:
+            files[format].seek(0)
+        yield {format: File(files[format]) for format in formats}
+
+
+def get_bulk_data_flags(datarequest):
+    return {
+        "include_submissions": datarequest.include_submissions,
+        "include_private_fields": datarequest.include_private_fields,
+        "include_private_places": datarequest.include_private_places,
+        "include_invisible": datarequest.include_invisible,
+    }
+
+
+def get_shard_ranges(queryset, shard_size):
+    """
+    Split the ids of the things in the queryset into inclusive ranges with
+    (up to) the given number of things in each.
+    """
+    pks = list(queryset.order_by("pk").values_list("pk", flat=True).iterator())
+    return [
+        (pks[start], pks[min(start + shard_size, len(pks)) - 1])
+        for start in range(0, len(pks), shard_size)
+    ]
+
+
+def fail_bulk_data_request(request_id):
+    DataSnapshotRequest.objects.filter(pk=request_id).update(status="failure")
+
+
 @shared_task
 def store_bulk_data(request_id):
+    """
+    Generate and store a snapshot for the request. The places or submissions
+    are split into shards by id, and each shard is written to the storage in
+    parallel by a `store_bulk_data_shard` task. Then `write_bulk_data` puts
+    the shards' parts together into the snapshot files.
+    """
     task_id = store_bulk_data.request.id
     log.info("Creating a snapshot request with task id %s" % (task_id,))
 
     datarequest = DataSnapshotRequest.objects.get(pk=request_id)
+    flags = get_bulk_data_flags(datarequest)
+    queryset = get_bulk_queryset(
+        datarequest.dataset, datarequest.submission_set, **flags
+    )
+    shard_ranges = get_shard_ranges(queryset, SNAPSHOT_SHARD_SIZE)
+
     datarequest.guid = task_id
+    datarequest.shards_total = len(shard_ranges)
+    datarequest.shards_completed = 0
     datarequest.save()
 
-    # Generate the content
-    content = generate_bulk_content(
-        datarequest.dataset,
-        datarequest.submission_set,
-        include_submissions=datarequest.include_submissions,
-        include_private_fields=datarequest.include_private_fields,
-        include_private_places=datarequest.include_private_places,
-        include_invisible=datarequest.include_invisible,
-    )
+    # Small snapshots are not worth the overhead of the extra tasks.
+    if len(shard_ranges) <= 1:
+        parts = [
+            store_bulk_data_shard(request_id, shard_range)
+            for shard_range in shard_ranges
+        ]
+        write_bulk_data(parts, request_id)
+    else:
+        chord(
+            store_bulk_data_shard.s(request_id, shard_range)
+            for shard_range in shard_ranges
+        )(write_bulk_data.s(request_id))
+
+    return task_id
+
 
-    # Store the information
-    bulk_data = DataSnapshot(
-        request=datarequest, csv=content["csv"], json=content["json"]
+@shared_task
+def store_bulk_data_shard(request_id, shard_range):
+    """
+    Write the part of a snapshot with the things in one shard to the
+    snapshot storage, in each format, and count the shard towards the
+    snapshot request's progress. Returns the number of things in the part,
+    the names of its files, and the columns of its CSV and tabular files.
+
+    The items are spooled to a temporary file as the list formats are
+    written, so that the other formats can be written with the columns of
+    all of the items.
+    """
+    storage = AttachmentStorage()
+    try:
+        datarequest = DataSnapshotRequest.objects.select_related("dataset").get(
+            pk=request_id
+        )
+        flags = get_bulk_data_flags(datarequest)
+        known_keys = get_known_data_keys(
+            datarequest.dataset, include_private=flags["include_private_fields"]
+        )
+        name = "snapshots/parts/%s/%s" % (
+            datarequest.guid or uuid.uuid4().hex,
+            shard_range[0],
+        )
+
+        # Count the items as they go by; the parts with no items are left
+        # out of the snapshot.
+        counter = count()
+        items = (
+            item
+            for item, _ in zip(
+                iter_bulk_data(
+                    datarequest.dataset,
+                    datarequest.submission_set,
+                    pk_range=shard_range,
+                    **flags
+                ),
+                counter,
+            )
+        )
+
+        part_files = {}
+        columns = {"fields": set(), "has_geometry": False}
+        with tempfile.TemporaryFile() as spool:
+            content = generate_bulk_content(
+                spool_bulk_items(items, spool, columns), datarequest.submission_set
+            )
+            with write_bulk_content(content) as files:
+                for format in files:
+                    part_files[format] = storage.save(
+                        name + get_bulk_file_extension(format), files[format]
+                    )
+
+            header = StreamingCSVRenderer().complete_header(
+                columns["fields"], known_keys
+            )
+            content = generate_bulk_content(
+                read_bulk_spool(spool),
+                datarequest.submission_set,
+                header,
+                columns["has_geometry"],
+            )
+            with write_bulk_content(content) as files:
+                for format in files:
+                    part_files[format] = storage.save(
+                        name + get_bulk_file_extension(format), files[format]
+                    )
+
+        part = {
+            "count": next(counter),
+            "files": part_files,
+            "fields": sorted(columns["fields"]),
+            "header": header,
+            "has_geometry": columns["has_geometry"],
+        }
+    except Exception:
+        fail_bulk_data_request(request_id)
+        raise
+
+    DataSnapshotRequest.objects.filter(pk=request_id).update(
+        shards_completed=F("shards_completed") + 1
     )
-    bulk_data.save()
+    return part
+
+
+@shared_task
+def write_bulk_data(parts, request_id):
+    """
+    Put the parts that the shards stored together into the snapshot files for
+    the request, and mark the request as fulfilled. The parts are deleted
+    afterwards.
+    """
+    storage = AttachmentStorage()
+    try:
+        datarequest = DataSnapshotRequest.objects.get(pk=request_id)
+        snapshot = DataSnapshot(request=datarequest)
+        known_keys = get_known_data_keys(
+            datarequest.dataset, include_private=datarequest.include_private_fields
+        )
+        content = merge_bulk_content(
+            datarequest.submission_set, known_keys, parts, storage
+        )
+
+        name = datarequest.guid or uuid.uuid4().hex
+        with write_bulk_content(content) as files:
+            for format in files:
+                getattr(snapshot, format + "_file").save(
+                    name + get_bulk_file_extension(format), files[format], save=False
+                )
+        snapshot.save()
+    except Exception:
+        fail_bulk_data_request(request_id)
+        raise
+    finally:
+        for part in parts:
+            for part_name in part["files"].values():
+                storage.delete(part_name)
 
     datarequest.fulfilled_at = now()
+    datarequest.shards_completed = datarequest.shards_total
+    datarequest.status = "success"
     datarequest.save()
 
-    return task_id
-
 
 @shared_task
 def bulk_data_status_update(uuid):
@@ -99,6 +688,40 @@ def bulk_data_status_update(uuid):
     datarequest.save()
 
 
+# =========================================================
+# Indexing data
+#
+
+
+@shared_task(bind=True)
+def reindex_dataset(self, dataset_id, index_ids=None):
+    """
+    Rebuild the indexed values of a dataset's things, for all of its indexes
+    or only the given ones. The progress is reported in the task's state.
+    """
+    dataset = DataSet.objects.get(pk=dataset_id)
+    indexes = dataset.indexes.all()
+    if index_ids is not None:
+        indexes = indexes.filter(pk__in=index_ids)
+
+    def report_progress(done, total):
+        log.info("Reindexed %s of %s things in dataset %s" % (done, total, dataset))
+        if self.request.id:
+            self.update_state(state="PROGRESS", meta={"done": done, "total": total})
+
+    IndexedValue.objects.reindex(indexes, dataset.things.all(), report_progress)
+
+
+@shared_task
+def flush_api_key_usage():
+    """
+    Write the recorded API key usage to the keys. This runs periodically;
+    see API_KEY_USAGE_FLUSH_INTERVAL.
+    """
+    count = ApiKey.flush_usage()
+    log.debug("Flushed the usage of %s API keys" % (count,))
+
+
 @shared_task
 def clone_related_dataset_data(orig_dataset_id, new_dataset_id):
     qs = (
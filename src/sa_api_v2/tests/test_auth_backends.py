@@ -0,0 +1,55 @@
+from django.core.cache import cache as django_cache
+from django.test import TestCase
+from ..auth_backends import CachedModelBackend
+from ..cache import cache_buffer
+from ..models import DataSet, Group, User
+from ..serializers import FullUserSerializer
+
+
+class CachedModelBackendTests(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        cache_buffer.reset()
+
+        owner = User.objects.create(username="owner")
+        self.dataset = DataSet.objects.create(owner=owner, slug="data")
+        self.user = User.objects.create(username="user")
+        self.group = Group.objects.create(dataset=self.dataset, name="editors")
+        self.group.submitters.add(self.user)
+        self.group.permissions.add_permission("comments", True, True, True, True)
+
+    def tearDown(self):
+        User.objects.all().delete()
+        django_cache.clear()
+        cache_buffer.reset()
+
+    def test_cached_user_includes_groups_and_social_auth(self):
+        backend = CachedModelBackend()
+        backend.get_user(self.user.id)
+
+        with self.assertNumQueries(0):
+            user = backend.get_user(self.user.id)
+            [group.name for group in user._groups.all()]
+            list(user.social_auth.all())
+            serializer = FullUserSerializer(user, context={"request": None})
+            groups = serializer.fields["groups"].to_representation(user.get_groups())
+
+        self.assertEqual(groups[0]["name"], "editors")
+
+    def test_cached_user_is_cleared_when_groups_change(self):
+        backend = CachedModelBackend()
+        backend.get_user(self.user.id)
+
+        other_group = Group.objects.create(dataset=self.dataset, name="judges")
+        other_group.submitters.add(self.user)
+        user = backend.get_user(self.user.id)
+        self.assertEqual(
+            sorted(group.name for group in user._groups.all()), ["editors", "judges"]
+        )
+
+        permission = self.group.permissions.get()
+        permission.can_update = False
+        permission.save()
+        user = backend.get_user(self.user.id)
+        group = [group for group in user._groups.all() if group.name == "editors"][0]
+        self.assertFalse(group.permissions.all()[0].can_update)
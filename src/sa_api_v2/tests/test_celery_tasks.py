@@ -1,6 +1,27 @@
+import csv
+import gzip
+import io
+import json
+import pyarrow.parquet
+import sqlite3
+import tempfile
+from django.core.cache import cache as django_cache
 from django.test import TestCase
-from ..models import DataSet, User
-from ..tasks import load_dataset_archive
+from django.test.client import RequestFactory
+from ..models import (
+    AttachmentStorage,
+    DataSet,
+    DataSnapshot,
+    DataSnapshotRequest,
+    Place,
+    Submission,
+    User,
+)
+from ..tasks import load_dataset_archive, store_bulk_data
+from ..apikey.models import ApiKey
+from ..renderers import StreamingCSVRenderer
+from ..serializers import SimplePlaceSerializer
+from ..views.bulk_data_views import DataSnapshotInstanceView
 from mock import patch
 
 from .. import tasks
@@ -42,3 +63,268 @@ class BulkDataLoadTests(TestCase):
 
         ds = DataSet.objects.get(id=self.ds.id)
         self.assertEqual(ds.places.count(), 2)
+
+
+class BulkDataSnapshotTests(TestCase):
+    def setUp(self):
+        self.ds = DataSet.objects.create(
+            owner=User.objects.create(username="snapshotuser"), slug="snapshots"
+        )
+        for color in ("red", "green", "blue"):
+            Place.objects.create(
+                dataset=self.ds,
+                geometry="POINT(2 3)",
+                data=json.dumps({"color": color}),
+            )
+
+        self.datarequest = DataSnapshotRequest.objects.create(
+            dataset=self.ds, submission_set="places", status="pending"
+        )
+
+    def tearDown(self):
+        # Deleting the requests also deletes the snapshot files.
+        DataSnapshotRequest.objects.all().delete()
+        User.objects.all().delete()
+        django_cache.clear()
+
+    def read_snapshot_file(self, snapshot_file):
+        with gzip.GzipFile(fileobj=snapshot_file.open("rb")) as decompressed:
+            return decompressed.read().decode("utf-8")
+
+    def test_stores_compressed_snapshot_files(self):
+        # Use a small batch size to check that the batches are stitched
+        # together.
+        with patch.object(tasks, "SNAPSHOT_BATCH_SIZE", 2):
+            store_bulk_data.apply(args=(self.datarequest.pk,))
+
+        snapshot = DataSnapshot.objects.get(request=self.datarequest)
+        self.assertEqual(snapshot.json, "")
+
+        data = json.loads(self.read_snapshot_file(snapshot.get_file("json")))
+        self.assertEqual(data["type"], "FeatureCollection")
+        self.assertEqual(
+            [feature["properties"]["color"] for feature in data["features"]],
+            ["red", "green", "blue"],
+        )
+
+        rows = self.read_snapshot_file(snapshot.get_file("csv")).splitlines()
+        self.assertEqual(len(rows), 4)
+        self.assertIn("color", rows[0].split(","))
+
+        lines = self.read_snapshot_file(snapshot.get_file("ndjson")).splitlines()
+        self.assertEqual(
+            [json.loads(line)["properties"]["color"] for line in lines],
+            ["red", "green", "blue"],
+        )
+
+    def test_stores_tabular_snapshot_files(self):
+        store_bulk_data.apply(args=(self.datarequest.pk,))
+        snapshot = DataSnapshot.objects.get(request=self.datarequest)
+
+        # GeoPackages are compressed like the text formats...
+        gpkg_file = snapshot.get_file("gpkg")
+        self.assertTrue(gpkg_file.name.endswith(".gpkg.gz"))
+        with tempfile.NamedTemporaryFile(suffix=".gpkg") as gpkg:
+            with gzip.GzipFile(fileobj=gpkg_file.open("rb")) as decompressed:
+                gpkg.write(decompressed.read())
+            gpkg.flush()
+            connection = sqlite3.connect(gpkg.name)
+            try:
+                colors = connection.execute(
+                    "SELECT color FROM snapshot ORDER BY fid"
+                ).fetchall()
+            finally:
+                connection.close()
+        self.assertEqual(colors, [("red",), ("green",), ("blue",)])
+
+        # ...but Parquet files compress their own content, so are stored as-is.
+        parquet_file = snapshot.get_file("parquet")
+        self.assertTrue(parquet_file.name.endswith(".parquet"))
+        table = pyarrow.parquet.read_table(parquet_file.open("rb"))
+        self.assertEqual(table.to_pydict()["color"], ["red", "green", "blue"])
+
+        request = RequestFactory().get("", HTTP_ACCEPT_ENCODING="gzip")
+        response = DataSnapshotInstanceView().stream_snapshot_file(
+            request, snapshot.get_file("parquet"), "application/vnd.apache.parquet"
+        )
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_reserializes_only_changed_places(self):
+        list(tasks.iter_bulk_data(self.ds, "places"))
+
+        red, green, blue = Place.objects.filter(dataset=self.ds).order_by("pk")
+        green.data = json.dumps({"color": "yellow"})
+        green.save()
+        blue.delete()
+
+        with patch.object(
+            SimplePlaceSerializer,
+            "to_representation",
+            autospec=True,
+            side_effect=SimplePlaceSerializer.to_representation,
+        ) as to_representation:
+            items = list(tasks.iter_bulk_data(self.ds, "places"))
+
+        self.assertEqual([item["color"] for item in items], ["red", "yellow"])
+        self.assertEqual(to_representation.call_count, 1)
+
+    def test_generates_large_snapshots_in_shards(self):
+        with patch.object(tasks, "SNAPSHOT_SHARD_SIZE", 2), patch.object(
+            tasks, "chord"
+        ) as chord:
+            store_bulk_data.apply(args=(self.datarequest.pk,))
+
+        shard_signatures = list(chord.call_args[0][0])
+        self.assertEqual(len(shard_signatures), 2)
+        self.datarequest.refresh_from_db()
+        self.assertEqual(self.datarequest.shards_total, 2)
+        self.assertEqual(self.datarequest.progress, 0)
+        self.assertEqual(self.datarequest.status, "pending")
+
+        # Run the shards and the merge the way the chord would.
+        parts = [
+            tasks.store_bulk_data_shard(*signature.args)
+            for signature in shard_signatures
+        ]
+        self.assertEqual([part["count"] for part in parts], [2, 1])
+        self.datarequest.refresh_from_db()
+        self.assertEqual(self.datarequest.progress, 1)
+
+        merge_signature = chord.return_value.call_args[0][0]
+        tasks.write_bulk_data(parts, *merge_signature.args)
+        self.datarequest.refresh_from_db()
+        self.assertEqual(self.datarequest.status, "success")
+        self.assertIsNotNone(self.datarequest.fulfilled_at)
+
+        snapshot = DataSnapshot.objects.get(request=self.datarequest)
+        data = json.loads(self.read_snapshot_file(snapshot.get_file("json")))
+        self.assertEqual(
+            [feature["properties"]["color"] for feature in data["features"]],
+            ["red", "green", "blue"],
+        )
+
+        rows = self.read_snapshot_file(snapshot.get_file("csv")).splitlines()
+        self.assertEqual(len(rows), 4)
+        self.assertIn("color", rows[0].split(","))
+
+        parquet_file = snapshot.get_file("parquet")
+        table = pyarrow.parquet.read_table(parquet_file.open("rb"))
+        self.assertEqual(table.to_pydict()["color"], ["red", "green", "blue"])
+
+        # The parts are cleaned up once they've been put together.
+        storage = AttachmentStorage()
+        for part in parts:
+            for part_name in part["files"].values():
+                self.assertFalse(storage.exists(part_name))
+
+    def test_snapshot_columns_include_the_keys_of_every_thing(self):
+        # A key that first shows up after the first things, in a later shard
+        Place.objects.create(
+            dataset=self.ds,
+            geometry="POINT(2 3)",
+            data=json.dumps({"color": "purple", "size": "big"}),
+        )
+        with patch.object(StreamingCSVRenderer, "header_sample_size", 2), patch.object(
+            tasks, "SNAPSHOT_SHARD_SIZE", 2
+        ), patch.object(tasks, "chord") as chord:
+            store_bulk_data.apply(args=(self.datarequest.pk,))
+            parts = [
+                tasks.store_bulk_data_shard(*signature.args)
+                for signature in chord.call_args[0][0]
+            ]
+            merge_signature = chord.return_value.call_args[0][0]
+            tasks.write_bulk_data(parts, *merge_signature.args)
+
+        snapshot = DataSnapshot.objects.get(request=self.datarequest)
+        csv_content = self.read_snapshot_file(snapshot.get_file("csv"))
+        rows = list(csv.DictReader(io.StringIO(csv_content)))
+        self.assertEqual(
+            [row["color"] for row in rows], ["red", "green", "blue", "purple"]
+        )
+        self.assertEqual([row["size"] for row in rows], ["", "", "", "big"])
+
+        parquet_file = snapshot.get_file("parquet")
+        table = pyarrow.parquet.read_table(parquet_file.open("rb"))
+        self.assertEqual(table.to_pydict()["size"], [None, None, None, "big"])
+
+    def test_data_version_changes_with_data(self):
+        version = tasks.get_data_version(self.ds, "places")
+        self.assertEqual(tasks.get_data_version(self.ds, "places"), version)
+
+        place = Place.objects.filter(dataset=self.ds).first()
+        Submission.objects.create(
+            dataset=self.ds, place_model=place, set_name="comments", data="{}"
+        )
+        new_version = tasks.get_data_version(self.ds, "places")
+        self.assertNotEqual(new_version, version)
+
+        place.delete()
+        self.assertNotEqual(tasks.get_data_version(self.ds, "places"), new_version)
+
+    def test_streams_snapshot_files(self):
+        store_bulk_data.apply(args=(self.datarequest.pk,))
+        snapshot = DataSnapshot.objects.get(request=self.datarequest)
+        view = DataSnapshotInstanceView()
+
+        # Clients that don't accept gzip get the decompressed content.
+        request = RequestFactory().get("")
+        response = view.stream_snapshot_file(
+            request, snapshot.get_file("csv"), "text/csv"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        content = b"".join(response.streaming_content).decode("utf-8")
+        self.assertEqual(content, self.read_snapshot_file(snapshot.get_file("csv")))
+
+        # Clients that do may also request a range of the compressed file.
+        request = RequestFactory().get(
+            "", HTTP_ACCEPT_ENCODING="gzip", HTTP_RANGE="bytes=0-9"
+        )
+        response = view.stream_snapshot_file(
+            request, snapshot.get_file("csv"), "text/csv"
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(len(b"".join(response.streaming_content)), 10)
+
+
+class ApiKeyUsageTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create(username="newuser")
+        self.dataset = DataSet.objects.create(owner=owner, slug="newdataset")
+        self.key = ApiKey.objects.create(dataset=self.dataset)
+        self.other_key = ApiKey.objects.create(dataset=self.dataset)
+        django_cache.clear()
+
+    def tearDown(self):
+        User.objects.all().delete()
+        django_cache.clear()
+
+    def test_usage_is_flushed_to_the_keys(self):
+        self.key.login("10.0.0.1")
+        self.key.login("10.0.0.2")
+
+        # Logging in doesn't write to the database...
+        self.assertEqual(ApiKey.objects.get(id=self.key.id).logged_ip, None)
+
+        # ...and the first flush leaves the usage for the next one, in case
+        # a request is still recording it...
+        self.assertEqual(ApiKey.flush_usage(), 0)
+        self.key.login("10.0.0.3")
+
+        # ...which writes the latest usage of the keys that were used, in a
+        # single update.
+        with self.assertNumQueries(1):
+            tasks.flush_api_key_usage.apply()
+        self.assertEqual(ApiKey.objects.get(id=self.key.id).logged_ip, "10.0.0.3")
+        self.assertEqual(ApiKey.objects.get(id=self.other_key.id).logged_ip, None)
+
+        # The usage is only written once...
+        self.assertEqual(ApiKey.flush_usage(), 0)
+        self.assertEqual(ApiKey.flush_usage(), 0)
+
+        # ...until the key is used again.
+        self.key.login("10.0.0.4")
+        self.assertEqual(ApiKey.flush_usage(), 0)
+        self.assertEqual(ApiKey.flush_usage(), 1)
+        self.assertEqual(ApiKey.objects.get(id=self.key.id).logged_ip, "10.0.0.4")
@@ -1,8 +1,10 @@
 import json
+import jwt
+from django.conf import settings
 from django.test import TestCase
 from django.core.cache import cache
 
-# from mock import patch
+# from mock import Mock, patch
 # from nose.tools import (istest, assert_equal, assert_not_equal, assert_in,
 #                         assert_raises)
 from django.core.exceptions import ValidationError
@@ -27,17 +29,21 @@ from ..models import (
     Submission,
     DataSetPermission,
     check_data_permission,
+    get_data_permission_evaluator,
+    get_places_meta,
     DataIndex,
     IndexedValue,
 )
+from ..models.core import verified_jwts
 from ..apikey.models import ApiKey
+from ..views.permissions import IsAllowedByDataPermissions
 
 # from ..views import SubmissionCollectionView
 # from ..views import raise_error_if_not_authenticated
 # from ..views import ApiKeyCollectionView
 # from ..views import OwnerPasswordView
 # import json
-from mock import patch
+from mock import Mock, patch
 
 # ./src/manage.py test -s sa_api_v2.tests.test_models:TestFormModel.test_fails_with_multiple_relations_on_form_module
 
@@ -81,6 +87,65 @@ class TestSubmittedThing(TestCase):
         qs = Action.objects.all()
         self.assertEqual(qs.count(), 1)
 
+    def test_save_keeps_public_data_without_private_attributes(self):
+        st = SubmittedThing(dataset=self.dataset)
+        st.data = '{"key": "value", "private-key": "secret"}'
+        st.save()
+        self.assertEqual(json.loads(st.public_data), {"key": "value"})
+
+        st.data = '{"key": "changed", "private-key": "secret"}'
+        st.save(update_fields=["data"])
+        st = SubmittedThing.objects.get(pk=st.pk)
+        self.assertEqual(json.loads(st.public_data), {"key": "changed"})
+
+
+class TestPlaceJWT(TestCase):
+    def setUp(self):
+        verified_jwts.clear()
+        self.owner = User.objects.create(username="myuser")
+        self.dataset = DataSet.objects.create(slug="data", owner_id=self.owner.id)
+        self.place = Place.objects.create(
+            dataset=self.dataset, geometry="POINT(2 3)", data="{}"
+        )
+
+    def tearDown(self):
+        verified_jwts.clear()
+        User.objects.all().delete()
+
+    def test_check_jwt_decodes_each_token_once(self):
+        token = jwt.encode(
+            {"place_id": self.place.id}, settings.JWT_SECRET, algorithm="HS256"
+        ).decode()
+
+        with patch("jwt.decode", wraps=jwt.decode) as decode:
+            self.assertTrue(self.place.check_jwt(token))
+            self.assertTrue(self.place.check_jwt(token))
+        self.assertEqual(decode.call_count, 1)
+
+        other_place = Place.objects.create(
+            dataset=self.dataset, geometry="POINT(2 3)", data="{}"
+        )
+        self.assertFalse(other_place.check_jwt(token))
+
+    def test_check_jwt_does_not_decode_tokens_it_made(self):
+        token = self.place.make_jwt().decode()
+        with patch("jwt.decode") as decode:
+            self.assertTrue(self.place.check_jwt(token))
+        self.assertFalse(decode.called)
+
+    def test_check_jwt_rejects_other_secrets_and_algorithms(self):
+        wrong_secret = jwt.encode(
+            {"place_id": self.place.id}, "not-the-secret", algorithm="HS256"
+        ).decode()
+        wrong_algorithm = jwt.encode(
+            {"place_id": self.place.id}, settings.JWT_SECRET, algorithm="HS512"
+        ).decode()
+        unsigned = jwt.encode({"place_id": self.place.id}, None, algorithm="none")
+
+        self.assertFalse(self.place.check_jwt(wrong_secret))
+        self.assertFalse(self.place.check_jwt(wrong_algorithm))
+        self.assertFalse(self.place.check_jwt(unsigned))
+
 
 class TestDataIndexes(TestCase):
     def setUp(self):
@@ -224,6 +289,101 @@ class TestDataIndexes(TestCase):
         # Delete should have cascaded to indexed values.
         self.assertEqual(IndexedValue.objects.all().count(), num_indexed_values - 1)
 
+    def test_things_are_only_reindexed_when_indexed_values_change(self):
+        self.dataset.indexes.add(DataIndex(attr_name="index"), bulk=False)
+
+        st = SubmittedThing(dataset=self.dataset)
+        st.data = '{"index": "value1", "freetext": "Unindexed"}'
+        st.save()
+        st = SubmittedThing.objects.get(pk=st.pk)
+
+        with patch.object(IndexedValue.objects, "sync_many") as sync_many:
+            st.visible = False
+            st.save()
+            st.data = '{"index": "value1", "freetext": "Still unindexed"}'
+            st.save()
+            self.assertEqual(sync_many.call_count, 0)
+
+            st.data = '{"index": "value2", "freetext": "Still unindexed"}'
+            st.save()
+            self.assertEqual(sync_many.call_count, 1)
+
+    def test_filter_by_index_returns_each_thing_once(self):
+        st = SubmittedThing(dataset=self.dataset)
+        st.data = '{"index": "value1"}'
+        st.save(reindex=False)
+
+        index = DataIndex(attr_name="index", dataset=self.dataset)
+        index.save(reindex=False)
+        IndexedValue.objects.create(value="value1", thing=st, index=index)
+        IndexedValue.objects.create(value="value2", thing=st, index=index)
+
+        qs = self.dataset.things.filter_by_index(index, "value1", "value2")
+        self.assertEqual(list(qs.values_list("pk", flat=True)), [st.pk])
+
+        qs = self.dataset.things.filter_by_index("index", "value2", "value3")
+        self.assertEqual(list(qs.values_list("pk", flat=True)), [st.pk])
+
+    def test_reindex_syncs_values_in_batches(self):
+        things = []
+        for value in ("a", "b", "c", None, "e"):
+            st = SubmittedThing(dataset=self.dataset)
+            st.data = json.dumps({} if value is None else {"index": value})
+            st.save(reindex=False)
+            things.append(st)
+
+        index = DataIndex(attr_name="index", dataset=self.dataset)
+        index.save(reindex=False)
+
+        # Start with a stale value, a duplicate, and a value for a thing that
+        # no longer has one.
+        IndexedValue.objects.create(value="old", thing=things[0], index=index)
+        IndexedValue.objects.create(value="b", thing=things[1], index=index)
+        IndexedValue.objects.create(value="b", thing=things[1], index=index)
+        IndexedValue.objects.create(value="d", thing=things[3], index=index)
+
+        progress = []
+        IndexedValue.objects.reindex(
+            [index],
+            self.dataset.things.all(),
+            progress=lambda done, total: progress.append((done, total)),
+            batch_size=2,
+        )
+
+        self.assertEqual(progress, [(2, 5), (4, 5), (5, 5)])
+        self.assertEqual(
+            sorted(
+                IndexedValue.objects.filter(index=index).values_list(
+                    "thing_id", "value"
+                )
+            ),
+            [
+                (things[0].id, "a"),
+                (things[1].id, "b"),
+                (things[2].id, "c"),
+                (things[4].id, "e"),
+            ],
+        )
+
+    def test_sync_many_uses_a_fixed_number_of_queries(self):
+        index1 = DataIndex(attr_name="index1", dataset=self.dataset)
+        index1.save(reindex=False)
+        index2 = DataIndex(attr_name="index2", dataset=self.dataset)
+        index2.save(reindex=False)
+
+        things_data = []
+        for i in range(10):
+            st = SubmittedThing(dataset=self.dataset)
+            st.data = json.dumps({"index1": i, "index2": str(i)})
+            st.save(reindex=False)
+            things_data.append((st.id, st.data))
+
+        # One query to read the existing values, and one to create the new
+        # ones.
+        with self.assertNumQueries(2):
+            counts = IndexedValue.objects.sync_many(things_data, [index1, index2])
+        self.assertEqual(counts, (20, 0, 0))
+
 
 class CloningTests(TestCase):
     def clear_objects(self):
@@ -664,6 +824,89 @@ class DataPermissionTests(TestCase):
             check_data_permission(user, None, place_id, "retrieve", dataset, "comments")
             self.assertEqual(any_allow.call_args[0][2], "comments")
 
+    def test_permissions_are_compiled_once_per_dataset(self):
+        owner = User.objects.create(username="myowner")
+        user = User.objects.create(username="myuser")
+        dataset = DataSet.objects.create(slug="data", owner_id=owner.id)
+        key = ApiKey.objects.create(key="abc", dataset=dataset)
+        group = Group.objects.create(dataset=dataset, name="editors")
+        group.submitters.add(user)
+        group.permissions.add_permission("comments", True, True, True, True)
+
+        user = User.objects.prefetch_related("_groups").get(id=user.id)
+        check_data_permission(user, key, None, "retrieve", dataset, "comments")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                check_data_permission(user, key, None, "update", dataset, "comments"),
+                True,
+            )
+            self.assertEqual(
+                check_data_permission(user, key, None, "update", dataset, "places"),
+                False,
+            )
+
+        # Changing a permission recompiles the dataset's permissions
+        permission = group.permissions.get()
+        permission.can_update = False
+        permission.save()
+        self.assertEqual(
+            check_data_permission(user, key, None, "update", dataset, "comments"),
+            False,
+        )
+
+    def test_equivalent_permissions_have_the_same_fingerprint(self):
+        owner = User.objects.create(username="myowner")
+        editor = User.objects.create(username="myeditor")
+        reviewer = User.objects.create(username="myreviewer")
+        visitor = User.objects.create(username="myvisitor")
+        dataset = DataSet.objects.create(slug="data", owner_id=owner.id)
+        key = ApiKey.objects.create(key="abc", dataset=dataset)
+
+        editors = Group.objects.create(dataset=dataset, name="editors")
+        editors.submitters.add(editor)
+        editors.permissions.add_permission("comments", True, True, True, False)
+        reviewers = Group.objects.create(dataset=dataset, name="reviewers")
+        reviewers.submitters.add(reviewer)
+        reviewers.permissions.add_permission("comments", True, True, True, False)
+        reviewers.permissions.add_permission("places", False, False, False, False)
+
+        def get_fingerprint(user, client):
+            user = User.objects.prefetch_related("_groups").get(id=user.id)
+            return get_data_permission_evaluator(user, client, dataset).fingerprint
+
+        self.assertEqual(get_fingerprint(editor, None), get_fingerprint(reviewer, None))
+        self.assertNotEqual(
+            get_fingerprint(editor, None), get_fingerprint(visitor, None)
+        )
+
+        key_permission = key.permissions.get()
+        key_permission.can_access_protected = True
+        key_permission.save()
+        self.assertNotEqual(get_fingerprint(editor, key), get_fingerprint(editor, None))
+
+    def test_user_groups_are_loaded_in_constant_queries(self):
+        owner = User.objects.create(username="myowner")
+        user = User.objects.create(username="myuser")
+        for slug in ("data1", "data2"):
+            dataset = DataSet.objects.create(slug=slug, owner_id=owner.id)
+            for name in ("editors", "reviewers"):
+                group = Group.objects.create(dataset=dataset, name=name)
+                group.submitters.add(user)
+                group.permissions.add_permission("comments", True, True, True, True)
+
+        # The user is loaded with its groups; then there is one query for each
+        # of the groups' permissions, their datasets and the datasets' owners
+        user = User.objects.get(id=user.id)
+        with self.assertNumQueries(3):
+            groups = user.get_groups()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(len(groups), 4)
+            for group in groups:
+                self.assertEqual(len(group.permissions.all()), 1)
+                self.assertEqual(group.dataset.owner.username, "myowner")
+
     def test_place_permissions_allow_all_actions_by_submitter(self):
         owner = User.objects.create(username="myowner")
         submitter = User.objects.create(username="mysubmitter")
@@ -702,6 +945,78 @@ class DataPermissionTests(TestCase):
             True,
         )
 
+    def test_place_permissions_use_preloaded_place_meta(self):
+        owner = User.objects.create(username="myowner")
+        submitter = User.objects.create(username="mysubmitter")
+        dataset = DataSet.objects.create(slug="data", owner_id=owner.id)
+        place = Place.objects.create(
+            dataset_id=dataset.id, geometry="POINT(0 0)", submitter_id=submitter.id
+        )
+        anonymous_place = Place.objects.create(
+            dataset_id=dataset.id, geometry="POINT(1 0)"
+        )
+        places_meta = get_places_meta([place.id, anonymous_place.id])
+
+        # Load the submitter with its groups, as users are loaded for requests,
+        # and compile the dataset's permissions.
+        submitter = User.objects.get(id=submitter.id)
+        check_data_permission(submitter, None, None, "update", dataset, "places")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                check_data_permission(
+                    submitter,
+                    None,
+                    place.id,
+                    "update",
+                    dataset,
+                    "places",
+                    place_meta=places_meta[place.id],
+                ),
+                True,
+            )
+
+        # Anonymous users are not the submitters of anonymous places
+        self.assertEqual(
+            check_data_permission(
+                AnonymousUser(), None, anonymous_place.id, "update", dataset, "places"
+            ),
+            False,
+        )
+
+    def test_bulk_requests_need_permission_for_every_item(self):
+        owner = User.objects.create(username="myowner")
+        submitter = User.objects.create(username="mysubmitter")
+        dataset = DataSet.objects.create(slug="data", owner_id=owner.id)
+        place = Place.objects.create(
+            dataset_id=dataset.id, geometry="POINT(0 0)", submitter_id=submitter.id
+        )
+
+        # Get rid of the dataset permissions
+        dataset.permissions.all().delete()
+
+        def has_permission(data):
+            request = Mock(
+                method="POST",
+                user=submitter,
+                client=None,
+                GET={},
+                data=data,
+                allowed_username=None,
+                get_dataset=lambda: dataset,
+            )
+            return IsAllowedByDataPermissions().has_permission(request, Mock(spec=[]))
+
+        self.assertEqual(has_permission([{"id": place.id}]), True)
+        self.assertEqual(has_permission([{"id": str(place.id)}]), True)
+
+        # Naming their own place does not let the submitter create new ones
+        self.assertEqual(
+            has_permission([{"id": place.id}, {"geometry": "POINT(1 0)"}]), False
+        )
+        self.assertEqual(has_permission([{"geometry": "POINT(1 0)"}]), False)
+        self.assertEqual(has_permission([]), False)
+
     def test_auth_required_restricts_anonymous_posting(self):
         owner = User.objects.create(username="myowner")
         submitter = User.objects.create(username="mysubmitter")
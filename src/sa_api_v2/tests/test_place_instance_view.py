@@ -346,6 +346,37 @@ class TestPlaceInstanceView(APITestMixin, TestCase):
         a = self.place.attachments.all()[0]
         self.assertEqual(a.file.read(), b'This is test content in a "file"')
 
+    def test_GET_response_includes_the_stored_public_data_verbatim(self):
+        request = self.factory.get(self.path)
+        response = self.view(request, **self.request_kwargs)
+
+        # The public projection of the blob is spliced in as it was stored,
+        # rather than decoded and encoded again.
+        public_data = Place.objects.get(pk=self.place.pk).public_data
+        members = public_data.strip()[1:-1].strip()
+        self.assertIn(members.encode("utf-8"), response.rendered_content)
+        self.assertNotIn(b"private-secrets", response.rendered_content)
+
+    def test_GET_response_is_cached_as_plain_data(self):
+        request = self.factory.get(self.path)
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        # Create a dummy view instance so that we can call get_cache_key
+        temp_view = PlaceInstanceView()
+        temp_view.request = request
+
+        # The stored geometry and data blob are spliced into the rendered
+        # response, but the cache gets them decoded.
+        cache_key = temp_view.get_cache_key(request)
+        cached_data, _, _ = django_cache.get(cache_key)
+        self.assertEqual(cached_data["name"], "K-Mart")
+        self.assertNotIn("private-secrets", cached_data)
+        self.assertEqual(
+            cached_data["geometry"], {"type": "Point", "coordinates": [2.0, 3.0]}
+        )
+        self.assertEqual(data["geometry"], cached_data["geometry"])
+
     def test_new_attachment_clears_GET_cache(self):
         request = self.factory.get(self.path)
         response = self.view(request, **self.request_kwargs)
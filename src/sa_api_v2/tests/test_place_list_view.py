@@ -18,7 +18,7 @@ from ..models import (
     DataIndex,
 )
 from .test_views import APITestMixin
-from ..apikey.auth import KEY_HEADER
+from ..apikey.auth import KEY_HEADER, ApiKeyAuthentication
 from ..apikey.models import ApiKey
 from ..views import PlaceListView
 from ..params import (
@@ -205,19 +205,30 @@ class TestPlaceListView(APITestMixin, TestCase):
         )
 
     def test_GET_csv_response(self):
+        DataIndex.objects.create(dataset=self.dataset, attr_name="color")
+
         request = self.factory.get(self.path + "?format=csv")
         response = self.view(request, **self.request_kwargs)
 
-        rows = list(csv.reader(StringIO(response.rendered_content.decode())))
+        # Check that the response is streamed
+        self.assertTrue(response.streaming)
+
+        content = b"".join(response.streaming_content).decode()
+        rows = list(csv.reader(StringIO(content)))
         headers = rows[0]
 
         # Check that the request was successful
         self.assertStatusCode(response, 200)
 
-        # Check that it's got good headers
+        # Check that it's got good headers, in order
         self.assertIn("dataset", headers)
         self.assertIn("geometry", headers)
         self.assertIn("name", headers)
+        self.assertEqual(headers, sorted(headers))
+
+        # Check that indexed attributes get a column even when no place has
+        # a value for them
+        self.assertIn("color", headers)
 
         # Check that we have the right number of rows
         self.assertEqual(len(rows), 2)
@@ -345,6 +356,27 @@ class TestPlaceListView(APITestMixin, TestCase):
         self.assertStatusCode(response, 200)
         self.assertEqual(len(data["features"]), 0)
 
+    def test_GET_filtered_by_boolean_field_response(self):
+        def get_response(query):
+            request = self.factory.get(self.path + "?" + query)
+            return self.view(request, **self.request_kwargs)
+
+        # The usual spellings of booleans are accepted...
+        for value in ("true", "True", "1", "yes", "on"):
+            response = get_response("visible=" + value)
+            self.assertStatusCode(response, 200)
+            data = json.loads(response.rendered_content)
+            self.assertEqual(len(data["features"]), 1)
+
+        response = get_response("visible=false")
+        self.assertStatusCode(response, 200)
+        data = json.loads(response.rendered_content)
+        self.assertEqual(len(data["features"]), 0)
+
+        # ...but anything else is an invalid query.
+        response = get_response("visible=maybe")
+        self.assertStatusCode(response, 400)
+
     def test_GET_indexed_response(self):
         Place.objects.create(
             dataset=self.dataset,
@@ -385,6 +417,42 @@ class TestPlaceListView(APITestMixin, TestCase):
         data = json.loads(response.rendered_content)
         self.assertEqual(len(data["features"]), 2)
 
+    def test_GET_typed_index_comparison_response(self):
+        places = [(1, "2019-01-05"), (2, "2019-06-01"), (10, None), ("lots", None)]
+        for count, seen in places:
+            data = {"count": count}
+            if seen:
+                data["seen"] = seen
+            Place.objects.create(
+                dataset=self.dataset, geometry="POINT(0 0)", data=json.dumps(data)
+            )
+
+        self.dataset.indexes.add(
+            DataIndex(attr_name="count", attr_type="number"), bulk=False
+        )
+        self.dataset.indexes.add(
+            DataIndex(attr_name="seen", attr_type="datetime"), bulk=False
+        )
+
+        def get_counts(query):
+            request = self.factory.get(self.path + "?" + query)
+            response = self.view(request, **self.request_kwargs)
+            self.assertStatusCode(response, 200)
+            data = json.loads(response.rendered_content)
+            return sorted(
+                feature["properties"]["count"] for feature in data["features"]
+            )
+
+        # Numbers are compared as numbers, not as text
+        self.assertEqual(get_counts("count__gt=1"), [2, 10])
+        self.assertEqual(get_counts("count__gte=2&count__lt=10"), [2])
+        self.assertEqual(get_counts("count__in=1,10"), [1, 10])
+        self.assertEqual(get_counts("seen__gte=2019-02-01"), [2])
+
+        request = self.factory.get(self.path + "?count__gt=many")
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 400)
+
     def test_GET_unindexed_response(self):
         Place.objects.create(
             dataset=self.dataset,
@@ -418,6 +486,57 @@ class TestPlaceListView(APITestMixin, TestCase):
             self.assertEqual(len(data["features"]), 0)
             self.assertEqual(patched_filter.call_count, 0)
 
+    def test_GET_filtered_by_several_attributes_response(self):
+        Place.objects.create(
+            dataset=self.dataset,
+            geometry="POINT(0 0)",
+            data=json.dumps({"foo": "bar", "color": "red", "name": 1}),
+        ),
+        Place.objects.create(
+            dataset=self.dataset,
+            geometry="POINT(1 0)",
+            data=json.dumps({"foo": "red", "color": "bar", "name": 2}),
+        ),
+        Place.objects.create(
+            dataset=self.dataset,
+            geometry="POINT(2 0)",
+            data=json.dumps({"foo": "bar", "color": "blue", "name": 3}),
+        ),
+
+        def get_names(query):
+            request = self.factory.get(self.path + "?" + query)
+            response = self.view(request, **self.request_kwargs)
+            self.assertStatusCode(response, 200)
+            data = json.loads(response.rendered_content)
+            return sorted(feature["properties"]["name"] for feature in data["features"])
+
+        # Each parameter is only matched against its own values
+        self.assertEqual(get_names("foo=bar&color=red"), [1])
+        self.assertEqual(get_names("foo=bar&color=red&color=blue"), [1, 3])
+
+        self.dataset.indexes.add(DataIndex(attr_name="foo"), bulk=False)
+        self.assertEqual(get_names("foo=bar&color=red"), [1])
+        self.assertEqual(get_names("foo=red&color=bar"), [2])
+
+    def test_GET_public_data_skips_client_authentication(self):
+        with patch.object(
+            ApiKeyAuthentication, "authenticate", return_value=None
+        ) as authenticate, patch.object(ApiKey, "login") as login:
+            # Anonymous reads of public data don't need the API key (though
+            # its usage is recorded)...
+            request = self.factory.get(self.path)
+            request.META[KEY_HEADER] = self.apikey.key
+            response = self.view(request, **self.request_kwargs)
+            self.assertStatusCode(response, 200)
+            self.assertEqual(authenticate.call_count, 0)
+            login.assert_called_once_with(request.META["REMOTE_ADDR"])
+
+            # ...but reads of private data do.
+            request = self.factory.get(self.path + "?include_private_places")
+            request.META[KEY_HEADER] = self.apikey.key
+            self.view(request, **self.request_kwargs)
+            self.assertEqual(authenticate.call_count, 1)
+
     def test_GET_paginated_response(self):
         # Create a view with pagination configuration set, for consistency
         class OverridePlaceListView(PlaceListView):
@@ -502,6 +621,42 @@ class TestPlaceListView(APITestMixin, TestCase):
         )
         self.assertIn("distance", data["features"][0]["properties"])
 
+    def test_GET_response_with_precision_and_simplify(self):
+        Place.objects.create(
+            dataset=self.dataset,
+            geometry="LINESTRING(0 0, 1.123456789 0.0000001, 2.987654321 0)",
+            data=json.dumps({"new_place": "yes", "name": 1}),
+        )
+
+        request = self.factory.get(self.path + "?new_place=yes&precision=3")
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        # Check that the coordinates have been rounded
+        self.assertStatusCode(response, 200)
+        self.assertEqual(len(data["features"]), 1)
+        self.assertEqual(
+            data["features"][0]["geometry"],
+            {"type": "LineString", "coordinates": [[0, 0], [1.123, 0], [2.988, 0]]},
+        )
+
+        request = self.factory.get(self.path + "?new_place=yes&simplify=0.01")
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        # Check that the nearly-collinear middle vertex has been dropped
+        self.assertStatusCode(response, 200)
+        self.assertEqual(
+            data["features"][0]["geometry"],
+            {"type": "LineString", "coordinates": [[0, 0], [2.987654321, 0]]},
+        )
+
+        # Check that invalid values are rejected
+        for query in ("precision=high", "precision=-1", "simplify=fast"):
+            request = self.factory.get(self.path + "?" + query)
+            response = self.view(request, **self.request_kwargs)
+            self.assertStatusCode(response, 400)
+
     def test_GET_response_with_private_data(self):
         #
         # View should not return private data normally
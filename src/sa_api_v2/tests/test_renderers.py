@@ -2,7 +2,22 @@
 
 from django.test import TestCase
 from nose.tools import istest
-from sa_api_v2.renderers import GeoJSONRenderer
+from django.test.utils import override_settings
+from django.contrib.gis.geos import GEOSGeometry
+from mock import Mock
+from sa_api_v2.json_backends import JSONFragments
+from sa_api_v2.renderers import (
+    GeoJSONRenderer,
+    GeoPackageRenderer,
+    JSONRenderer,
+    ParquetRenderer,
+)
+import datetime
+import json
+import os
+import pyarrow.parquet
+import sqlite3
+import tempfile
 
 
 class TestGeoJSONRenderer(TestCase):
@@ -29,6 +44,134 @@ class TestGeoJSONRenderer(TestCase):
         self.assertEqual(result, b"")
 
 
+class TestJSONRenderer(TestCase):
+    backends = [
+        "sa_api_v2.json_backends.StdlibJSONBackend",
+        "sa_api_v2.json_backends.OrjsonBackend",
+    ]
+
+    def test_backends_render_the_same_data(self):
+        data = {
+            "id": 1,
+            "geometry": {"type": "Point", "coordinates": [2, 3]},
+            "name": "\u2028",
+            "created_datetime": datetime.datetime(2019, 12, 1, 12, 34, 56),
+            "tags": [1, 2],
+        }
+
+        for backend in self.backends:
+            with override_settings(JSON_RENDERER_BACKEND=backend):
+                result = JSONRenderer().render(data)
+
+            self.assertNotIn("\u2028".encode("utf-8"), result)
+            self.assertEqual(
+                json.loads(result.decode("utf-8")),
+                {
+                    "id": 1,
+                    "geometry": {"type": "Point", "coordinates": [2, 3]},
+                    "name": "\u2028",
+                    "created_datetime": "2019-12-01T12:34:56",
+                    "tags": [1, 2],
+                },
+            )
+
+
+    def test_fragments_from_the_view_are_included_verbatim(self):
+        place = {"id": 1, "geometry": None, "name": "K-Mart"}
+        fragments = JSONFragments()
+        fragments.set_value(
+            place, "geometry", '{"type": "Point", "coordinates": [2, 3]}'
+        )
+        fragments.add_members(place, '{"type": "ATM", "id": "blob"}')
+        place["submission_sets"] = {}
+
+        view = Mock(**{"get_json_fragments.return_value": fragments})
+        renderer_context = {"view": view}
+
+        for backend in self.backends:
+            with override_settings(JSON_RENDERER_BACKEND=backend):
+                result = GeoJSONRenderer().render([place], None, renderer_context)
+
+            geometry = b'"geometry":{"type": "Point", "coordinates": [2, 3]}'
+            self.assertIn(geometry, result)
+            self.assertEqual(
+                json.loads(result.decode("utf-8"))["features"][0]["properties"],
+                {"id": "blob", "name": "K-Mart", "type": "ATM", "submission_sets": {}},
+            )
+
+        # The data itself is left alone, and can be resolved for other uses.
+        self.assertEqual(
+            place, {"id": 1, "geometry": None, "name": "K-Mart", "submission_sets": {}}
+        )
+        self.assertEqual(
+            fragments.resolve([place]),
+            [
+                {
+                    "id": "blob",
+                    "geometry": {"type": "Point", "coordinates": [2, 3]},
+                    "name": "K-Mart",
+                    "type": "ATM",
+                    "submission_sets": {},
+                }
+            ],
+        )
+
+
+class TestTabularFileRenderers(TestCase):
+    rows = [
+        {"id": 1, "geometry": "POINT (2 3)", "name": "K-Mart", "tags": ["a", "b"]},
+        {"id": 2, "geometry": None, "name": "Target"},
+    ]
+
+    def render(self, renderer, path):
+        with open(path, "wb") as rendered:
+            for chunk in renderer.stream(self.rows, known_keys=["color"]):
+                rendered.write(chunk)
+
+    def test_geopackage(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "snapshot.gpkg")
+            self.render(GeoPackageRenderer(), path)
+
+            connection = sqlite3.connect(path)
+            try:
+                application_id = connection.execute("PRAGMA application_id").fetchone()
+                geometry_column = connection.execute(
+                    "SELECT table_name, column_name, srs_id FROM gpkg_geometry_columns"
+                ).fetchall()
+                rows = connection.execute(
+                    'SELECT geometry, id, name, "tags.0", color FROM snapshot'
+                    " ORDER BY fid"
+                ).fetchall()
+            finally:
+                connection.close()
+
+        self.assertEqual(application_id, (0x47504B47,))
+        self.assertEqual(geometry_column, [("snapshot", "geometry", 4326)])
+
+        geometry = rows[0][0]
+        self.assertEqual(geometry[:2], b"GP")
+        self.assertEqual(GEOSGeometry(memoryview(geometry[8:])).coords, (2.0, 3.0))
+        self.assertEqual(rows[0][1:], ("1", "K-Mart", "a", None))
+        self.assertEqual(rows[1], (None, "2", "Target", None, None))
+
+    def test_parquet(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "snapshot.parquet")
+            self.render(ParquetRenderer(), path)
+            table = pyarrow.parquet.read_table(path)
+
+        self.assertIn(b"geo", table.schema.metadata)
+        columns = table.to_pydict()
+        self.assertEqual(columns["id"], ["1", "2"])
+        self.assertEqual(columns["name"], ["K-Mart", "Target"])
+        self.assertEqual(columns["color"], [None, None])
+        self.assertEqual(
+            GEOSGeometry(memoryview(columns["geometry"][0])).coords, (2.0, 3.0)
+        )
+        self.assertIsNone(columns["geometry"][1])
+
+
 # class TestCSVRenderer (TestCase):
 
 #     def test_tablize_a_list_with_no_elements(self):
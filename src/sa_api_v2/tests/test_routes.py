@@ -0,0 +1,58 @@
+# -*- coding:utf-8 -*-
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.test.client import RequestFactory
+from nose.tools import assert_equal, assert_raises
+from sa_api_v2 import routes
+
+
+class TestRoutes(TestCase):
+    def test_route_templates_match_url_patterns(self):
+        assert_equal(routes.check_route_templates(), [])
+
+    def test_build_path_matches_reverse(self):
+        for args in [
+            ("owner", "dataset", 12),
+            ("some owner", "data+set", 12),
+            ("ówner", "dätaset:1", 12),
+        ]:
+            assert_equal(
+                routes.build_path("place-detail", *args),
+                reverse("place-detail", args=args),
+            )
+            assert_equal(
+                routes.build_path("dataset-detail", *args[:2]),
+                reverse("dataset-detail", args=args[:2]),
+            )
+
+    def test_build_path_with_kwargs(self):
+        path = routes.build_path(
+            "submission-list",
+            owner_username="owner",
+            dataset_slug="dataset",
+            place_id=12,
+            submission_set_name="comments",
+        )
+        assert_equal(path, "/api/v2/owner/datasets/dataset/places/12/comments")
+
+    def test_build_path_with_wrong_number_of_args(self):
+        with assert_raises(TypeError):
+            routes.build_path("place-detail", "owner", "dataset")
+
+    def test_build_url(self):
+        request = RequestFactory().get("")
+        kwargs = {"owner_username": "owner", "dataset_slug": "dataset"}
+
+        assert_equal(
+            routes.build_url("place-list", kwargs, request=request),
+            "http://testserver/api/v2/owner/datasets/dataset/places",
+        )
+        assert_equal(
+            routes.build_url("place-list", kwargs, format="csv"),
+            "/api/v2/owner/datasets/dataset/places.csv",
+        )
+
+    def test_unknown_route(self):
+        with assert_raises(ValueError):
+            routes.build_url("no-such-route", {})
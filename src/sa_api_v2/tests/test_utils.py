@@ -26,6 +26,18 @@ class TestToDistance(TestCase):
         assert_equal(d, D(mi=123.45))
 
 
+class TestToBool(TestCase):
+    def test_common_spellings_are_accepted(self):
+        for string in ("true", "True", "t", "yes", "on", "1"):
+            assert_equal(utils.to_bool(string), True)
+        for string in ("false", "FALSE", "f", "no", "off", "0"):
+            assert_equal(utils.to_bool(string), False)
+
+    def test_other_strings_are_invalid(self):
+        with self.assertRaises(ValueError):
+            utils.to_bool("maybe")
+
+
 class TestBuildRelativeURL(TestCase):
     def test_relative_path_with_leading_slash(self):
         url = utils.build_relative_url("http://ex.co/pictures/silly/abc.png", "/home")
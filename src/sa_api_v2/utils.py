@@ -1,5 +1,7 @@
 import re
+import threading
 import time
+from collections import OrderedDict
 from django.contrib.gis.geos import GEOSGeometry, Point
 from django.contrib.gis.measure import D
 from functools import wraps
@@ -51,6 +53,19 @@ def to_geom(string):
     return geom
 
 
+def to_bool(string):
+    """
+    Given a string, convert it to a boolean. The common spellings (e.g.,
+    "true", "yes", "on", "1", and their opposites) are accepted, in any case.
+    """
+    value = string.strip().lower()
+    if value in ("true", "t", "yes", "y", "on", "1"):
+        return True
+    if value in ("false", "f", "no", "n", "off", "0"):
+        return False
+    raise ValueError("%r is not a valid boolean." % (string,))
+
+
 def memo(f):
     """
     A memoization decorator. Borrowed and modified from
@@ -130,3 +145,41 @@ def build_relative_url(original_url, relative_path):
         full_path = relative_path
 
     return urljoin(parsed_url.scheme + "://" + parsed_url.netloc, full_path)
+
+
+class ExpiringLRUCache(object):
+    """
+    A thread-safe, in-process cache that holds on to at most maxsize of the
+    most recently used values, each for at most timeout seconds.
+    """
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value, expires = self.items[key]
+            except KeyError:
+                return default
+
+            if expires < time.monotonic():
+                del self.items[key]
+                return default
+
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = (value, time.monotonic() + self.timeout)
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
@@ -2,13 +2,15 @@ from django.conf import settings
 from django.contrib.auth import views as auth_views
 from django.contrib.gis.geos import GEOSGeometry, Point, Polygon
 from django.core import cache as django_cache
+from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
-from django.db.models import Count, Q
+from django.db.models import BooleanField, Count, NullBooleanField, Q
 from django.http import (
     Http404,
     HttpResponse,
     HttpResponseBadRequest,
     HttpResponseRedirect,
+    StreamingHttpResponse,
 )
 from django.shortcuts import get_object_or_404
 from django.test.client import RequestFactory
@@ -29,12 +31,11 @@ from oauth2_provider.contrib.rest_framework import (
 )
 from rest_framework.parsers import JSONParser, FormParser, MultiPartParser
 from rest_framework.response import Response
-from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.request import Request
 from rest_framework.exceptions import APIException
 from rest_framework_bulk import generics as bulk_generics
 from social_django import views as social_views
-from mock import patch
 from .. import apikey
 from .. import cors
 from .. import models
@@ -42,10 +43,12 @@ from .. import serializers
 from .. import utils
 from .. import renderers
 from .. import parsers
+from .. import routes
 from ..cors.auth import OriginAuthentication
-from ..apikey.auth import ApiKeyAuthentication
+from ..apikey.auth import ApiKeyAuthentication, record_api_key_usage
 from .email_templates import EmailTemplateMixin
 from .. import tasks
+from ..json_backends import JSONFragments
 from .content_negotiation import ShareaboutsContentNegotiation
 from ..cache import cache_buffer
 from ..params import (
@@ -56,6 +59,8 @@ from ..params import (
     NEAR_PARAM,
     DISTANCE_PARAM,
     BBOX_PARAM,
+    PRECISION_PARAM,
+    SIMPLIFY_PARAM,
     TEXTSEARCH_PARAM,
     FORMAT_PARAM,
     PAGE_PARAM,
@@ -141,7 +146,7 @@ class ShareaboutsAPIRequest(Request):
         """
         if not hasattr(self, "_client_auth"):
             self._authenticate_client()
-        return self._auth
+        return self._client_auth
 
     @client_auth.setter
     def client_auth(self, value):
@@ -172,6 +177,11 @@ class ShareaboutsAPIRequest(Request):
         in turn.
         Returns a three-tuple of (authenticator, client, client_authtoken).
         """
+        if self._is_public_read():
+            record_api_key_usage(self)
+            self._client_not_authenticated()
+            return
+
         for authenticator in self.client_authenticators:
             try:
                 client_auth_tuple = authenticator.authenticate(self)
@@ -186,6 +196,33 @@ class ShareaboutsAPIRequest(Request):
 
         self._client_not_authenticated()
 
+    def _is_public_read(self):
+        """
+        Check whether the request is an anonymous read of public data, from a
+        dataset that lets anyone retrieve anything. A client could not grant
+        any more than that, so there is no need to authenticate it by its API
+        key or origin (though the key's usage is still recorded).
+        """
+        if self.method not in ("GET", "HEAD"):
+            return False
+
+        protected_params = (
+            INCLUDE_INVISIBLE_PARAM,
+            INCLUDE_PRIVATE_FIELDS_PARAM,
+            INCLUDE_PRIVATE_PLACES_PARAM,
+        )
+        if any(param in self.query_params for param in protected_params):
+            return False
+
+        get_dataset = getattr(self._request, "get_dataset", None)
+        if get_dataset is None or self.user.is_authenticated():
+            return False
+
+        dataset = get_dataset()
+        return dataset is not None and models.get_data_permission_evaluator(
+            None, None, dataset
+        ).allows("retrieve", "*")
+
     def _client_not_authenticated(self):
         """
         Generate a three-tuple of (authenticator, client, authtoken), representing
@@ -253,6 +290,8 @@ class FilteredResourceMixin(object):
                 DISTANCE_PARAM,
                 TEXTSEARCH_PARAM,
                 BBOX_PARAM,
+                PRECISION_PARAM,
+                SIMPLIFY_PARAM,
                 CALLBACK_PARAM(self),
             ]
         )
@@ -263,34 +302,93 @@ class FilteredResourceMixin(object):
             queryset = queryset.filter(data__icontains=textsearch_filter)
 
         # Then filter by attributes
-        values = list(self.request.GET.values())
-        for key in self.request.GET.keys():
-            if key not in special_filters:
-                # Filter quickly for indexed values
-                if self.get_dataset().indexes.filter(attr_name=key).exists():
-                    queryset = queryset.filter_by_index(key, *values)
-
-                # Filter slowly for other values
-                else:
-                    excluded = []
-                    for obj in queryset:
-                        if hasattr(obj, key):
-                            if getattr(obj, key) not in values:
-                                queryset = queryset.exclude(pk=obj.pk)
-                        else:
-                            # Is it in the data blob?
-                            data = json.loads(obj.data)
-                            if key not in data or data[key] not in values:
-                                excluded.append(obj.pk)
-                    queryset = queryset.exclude(pk__in=excluded)
+        data_filters = {}
+        for strategy, key, values, extra in self.get_filter_plan(
+            queryset.model, special_filters
+        ):
+            # Filter on comparisons (e.g., "attr__gt") with typed indexes
+            if strategy == "index_lookup":
+                index, lookup = extra
+                try:
+                    queryset = queryset.filter_by_index_lookup(index, lookup, *values)
+                except ValueError:
+                    raise QueryError(
+                        detail='Invalid %s for "%s": %r'
+                        % (index.attr_type, key, values)
+                    )
+
+            # Filter quickly for indexed values
+            elif strategy == "index":
+                queryset = queryset.filter_by_index(extra, *values)
+
+            # Filter on model fields in the database
+            elif strategy == "field":
+                try:
+                    if isinstance(extra, (BooleanField, NullBooleanField)):
+                        values = [utils.to_bool(value) for value in values]
+                    queryset = queryset.filter(**{key + "__in": values})
+                except (ValidationError, ValueError):
+                    raise QueryError(
+                        detail='Invalid value for "%s": %r' % (key, values)
+                    )
+
+            # Filter slowly for other values
+            else:
+                data_filters[key] = values
+
+        if data_filters:
+            # Check all of the data blob filters in one pass over the things.
+            excluded = []
+            for pk, data in queryset.values_list("pk", "data"):
+                data = json.loads(data)
+                for key, values in data_filters.items():
+                    if key not in data or data[key] not in values:
+                        excluded.append(pk)
+                        break
+            queryset = queryset.exclude(pk__in=excluded)
 
         return queryset
 
+    def get_filter_plan(self, model, special_filters=()):
+        """
+        Decide how to filter on each of the query parameters, without going
+        to the database. Returns a list of (strategy, key, values, extra)
+        tuples, where the strategy is one of:
+
+        * "index_lookup" -- a comparison (e.g., "attr__gt") on an indexed
+          attribute; extra is the (index, lookup) pair
+        * "index" -- an exact match on an indexed attribute; extra is the
+          index
+        * "field" -- an exact match on a model field; extra is the field
+        * "data" -- an exact match on an unindexed attribute in the data blob
+        """
+        dataset = self.get_dataset()
+        index_map = dataset.get_index_map() if dataset is not None else {}
+        fields = {field.name: field for field in model._meta.concrete_fields}
+
+        plan = []
+        for key, values in self.request.GET.lists():
+            if key in special_filters:
+                continue
+
+            attr_name, _, lookup = key.rpartition("__")
+            if attr_name in index_map and lookup in models.INDEX_LOOKUPS:
+                plan.append(
+                    ("index_lookup", key, values, (index_map[attr_name], lookup))
+                )
+            elif key in index_map:
+                plan.append(("index", key, values, index_map[key]))
+            elif key in fields:
+                plan.append(("field", key, values, fields[key]))
+            else:
+                plan.append(("data", key, values, None))
+        return plan
+
 
 class LocatedResourceMixin(object):
     """
     A view mixin that orders queryset results by distance from a geometry, if
-    requested.
+    requested, and controls how the result geometries are output.
     """
 
     def locate_queryset(self, queryset):
@@ -335,6 +433,44 @@ class LocatedResourceMixin(object):
 
         return queryset
 
+    def shape_queryset(self, queryset):
+        """
+        Have the database output the geometries in the queryset with limited
+        coordinate precision and/or simplified, if requested. This only applies
+        when reading.
+        """
+        if self.request.method.upper() not in permissions.SAFE_METHODS:
+            return queryset
+
+        precision = simplify = None
+
+        if PRECISION_PARAM in self.request.GET:
+            try:
+                precision = int(self.request.GET[PRECISION_PARAM])
+                if not 0 <= precision <= 15:
+                    raise ValueError(precision)
+            except ValueError:
+                raise QueryError(
+                    detail='Invalid parameter for "%s": %r'
+                    % (PRECISION_PARAM, self.request.GET[PRECISION_PARAM])
+                )
+
+        if SIMPLIFY_PARAM in self.request.GET:
+            try:
+                simplify = float(self.request.GET[SIMPLIFY_PARAM])
+                if not 0 <= simplify < float("inf"):
+                    raise ValueError(simplify)
+            except ValueError:
+                raise QueryError(
+                    detail='Invalid parameter for "%s": %r'
+                    % (SIMPLIFY_PARAM, self.request.GET[SIMPLIFY_PARAM])
+                )
+
+        if precision is None and simplify is None:
+            return queryset
+
+        return queryset.with_geojson(precision=precision, simplify=simplify)
+
 
 class OwnedResourceMixin(ClientAuthenticationMixin, CorsEnabledMixin):
     """
@@ -350,7 +486,7 @@ class OwnedResourceMixin(ClientAuthenticationMixin, CorsEnabledMixin):
     """
 
     renderer_classes = (
-        JSONRenderer,
+        renderers.JSONRenderer,
         BrowsableAPIRenderer,
         renderers.PaginatedCSVRenderer,
     )
@@ -377,6 +513,21 @@ class OwnedResourceMixin(ClientAuthenticationMixin, CorsEnabledMixin):
 
         return super(OwnedResourceMixin, self).dispatch(request, *args, **kwargs)
 
+    def get_json_fragments(self):
+        """
+        Get the side channel through which serializers pass pre-encoded JSON
+        (e.g., stored geometries and data blobs) straight to the renderer, or
+        None if the accepted renderer can't include it in its output as-is
+        (e.g., the CSV renderer).
+        """
+        if not hasattr(self, "_json_fragments"):
+            renderer = getattr(self.request, "accepted_renderer", None)
+            if getattr(renderer, "supports_json_fragments", False):
+                self._json_fragments = JSONFragments()
+            else:
+                self._json_fragments = None
+        return self._json_fragments
+
     def get_submitter(self):
         user = self.request.user
         return user if user.is_authenticated() else None
@@ -519,7 +670,35 @@ class CachedResourceMixin(object):
         if request.method.upper() not in permissions.SAFE_METHODS:
             return super(CachedResourceMixin, self).dispatch(request, *args, **kwargs)
 
-        self.request = request
+        self._cache_key = None
+        response = super(CachedResourceMixin, self).dispatch(request, *args, **kwargs)
+
+        # Only cache on OK resposne that did not come from the cache. Streaming
+        # responses are never fully held in memory, so there is nothing to
+        # cache.
+        if (
+            self._cache_key is not None
+            and response.status_code == 200
+            and not response.streaming
+        ):
+            self.cache_response(self._cache_key, response)
+
+        # Save all the buffered data to the cache
+        cache_buffer.flush()
+
+        # Disable client-side caching. Cause IE wrongly assumes that it should
+        # cache.
+        response["Cache-Control"] = "no-cache"
+        return response
+
+    def initial(self, request, *args, **kwargs):
+        # Authenticate the user and client, and check their permissions, before
+        # looking in the cache, since what they are allowed to see is part of
+        # the cache key.
+        super(CachedResourceMixin, self).initial(request, *args, **kwargs)
+
+        if request.method.upper() not in permissions.SAFE_METHODS:
+            return
 
         # Check whether the response data is in the cache.
         key = self.get_cache_key(request, *args, **kwargs)
@@ -534,62 +713,46 @@ class CachedResourceMixin(object):
 
         if (response_data is not None) and (key in keyset):
             cached_response = self.respond_from_cache(response_data)
-            handler_name = request.method.lower()
 
             def cached_handler(*args, **kwargs):
                 return cached_response
 
-            # Patch the HTTP method
-            with patch.object(self, handler_name, new=cached_handler):
-                response = super(CachedResourceMixin, self).dispatch(
-                    request, *args, **kwargs
-                )
+            # Respond with the cached response in place of the HTTP method
+            setattr(self, request.method.lower(), cached_handler)
         else:
-            response = super(CachedResourceMixin, self).dispatch(
-                request, *args, **kwargs
-            )
+            self._cache_key = key
 
-            # Only cache on OK resposne
-            if response.status_code == 200:
-                self.cache_response(key, response)
+    def get_permissions_fingerprint(self, request):
+        """
+        Get a string that is the same for any requests whose user and client
+        have the same effective permissions on the view's dataset, so that
+        they can share cached responses.
+        """
+        dataset = None
+        if hasattr(self, "get_dataset"):
+            dataset = self.get_dataset()
+        if not dataset:
+            return ""
 
-        # Save all the buffered data to the cache
-        cache_buffer.flush()
+        # Superusers and owners can see everything
+        user = getattr(request, "user", None)
+        if user is not None and (user.is_superuser or user.id == dataset.owner_id):
+            return "__owners__"
 
-        # Disable client-side caching. Cause IE wrongly assumes that it should
-        # cache.
-        response["Cache-Control"] = "no-cache"
-        return response
+        client = getattr(request, "client", None)
+        return models.get_data_permission_evaluator(user, client, dataset).fingerprint
 
     def get_cache_key(self, request, *args, **kwargs):
         querystring = request.META.get("QUERY_STRING", "")
         contenttype = request.META.get("HTTP_ACCEPT", "")
-
-        if not hasattr(request, "user") or not request.user.is_authenticated():
-            groups = ""
-        else:
-            dataset = None
-            if hasattr(self, "get_dataset"):
-                dataset = self.get_dataset()
-
-            if dataset:
-                if request.user.id == dataset.owner_id:
-                    groups = "__owners__"
-                else:
-                    group_set = []
-                    for group in request.user._groups.all():
-                        if group.dataset_id == dataset.id:
-                            group_set.append(group.name)
-                    groups = ",".join(group_set)
-            else:
-                groups = ""
+        fingerprint = self.get_permissions_fingerprint(request)
 
         # TODO: Eliminate the jQuery cache busting parameter for now. Get
         # rid of this after the old API has been deprecated.
         cache_buster_pattern = re.compile(r"&?_=\d+")
         querystring = re.sub(cache_buster_pattern, "", querystring)
 
-        return ":".join([self.cache_prefix, contenttype, querystring, groups])
+        return ":".join([self.cache_prefix, contenttype, querystring, fingerprint])
 
     def respond_from_cache(self, cached_data):
         # Given some cached data, construct a response.
@@ -599,6 +762,13 @@ class CachedResourceMixin(object):
 
     def cache_response(self, key, response):
         data = response.data
+
+        # Cache plain data, with any pre-encoded JSON that was set aside for
+        # the renderer decoded into it.
+        fragments = getattr(self, "get_json_fragments", lambda: None)()
+        if fragments:
+            data = fragments.resolve(data)
+
         status = response.status_code
         headers = list(response.items())
 
@@ -788,6 +958,17 @@ class PlaceInstanceView(
 
         Show private places.
 
+      * `precision=<digits>`
+
+        Round the coordinates of the place geometry to the given number of
+        decimal places (between 0 and 15).
+
+      * `simplify=<tolerance>`
+
+        Simplify the place geometry so that it deviates from the original by
+        no more than the given tolerance, in degrees. Simplification never
+        collapses or invalidates polygon rings.
+
     PUT
     ---
     Update a place
@@ -849,7 +1030,7 @@ class PlaceInstanceView(
             pk = self.kwargs["place_id"]
         try:
             return (
-                self.model.objects.filter(pk=pk)
+                self.shape_queryset(self.model.objects.filter(pk=pk))
                 .select_related("dataset", "dataset__owner", "submitter")
                 .prefetch_related(
                     "submitter__social_auth",
@@ -962,6 +1143,17 @@ class PlaceListView(
         comma-separated list of 4 numeric values: western longitude, northern
         latitude, eastern longitude, southern latitude.
 
+      * `precision=<digits>`
+
+        Round the coordinates of each place geometry to the given number of
+        decimal places (between 0 and 15).
+
+      * `simplify=<tolerance>`
+
+        Simplify each place geometry so that it deviates from the original by
+        no more than the given tolerance, in degrees. Simplification never
+        collapses or invalidates polygon rings.
+
       * `<attr>=<value>`
  
         Filter the place list to only return the places where the attribute is
@@ -980,9 +1172,7 @@ class PlaceListView(
 
     serializer_class = serializers.PlaceSerializer
     pagination_class = serializers.FeatureCollectionPagination
-    renderer_classes = (
-        renderers.GeoJSONRenderer,
-    ) + OwnedResourceMixin.renderer_classes[2:]
+    renderer_classes = (renderers.GeoJSONRenderer, renderers.StreamingCSVRenderer)
     parser_classes = (parsers.GeoJSONParser,) + OwnedResourceMixin.parser_classes[1:]
 
     def get_serializer_context(self):
@@ -992,6 +1182,29 @@ class PlaceListView(
 
         return context
 
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if not isinstance(renderer, renderers.StreamingCSVRenderer):
+            return super(PlaceListView, self).list(request, *args, **kwargs)
+
+        # Write CSV out as each place is serialized, instead of building the
+        # whole document in memory first.
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        places = page if page is not None else queryset
+
+        serializer = self.get_serializer()
+        rows = (serializer.to_representation(place) for place in places)
+        known_keys = models.get_known_data_keys(
+            self.get_dataset(),
+            include_private=INCLUDE_PRIVATE_FIELDS_PARAM in request.GET,
+        )
+
+        return StreamingHttpResponse(
+            renderer.stream(rows, known_keys, self.get_renderer_context()),
+            content_type="%s; charset=%s" % (renderer.media_type, renderer.charset),
+        )
+
     # Overriding create so we can sanitize submitted fields, which may
     # contain raw HTML intended to be rendered in the client
     def create(self, request, *args, **kwargs):
@@ -1024,7 +1237,7 @@ class PlaceListView(
     def get_cache_metakey(self):
         metakey_kwargs = self.kwargs.copy()
         metakey_kwargs.pop("pk_list", None)
-        prefix = reverse("place-list", kwargs=metakey_kwargs)
+        prefix = routes.build_path("place-list", **metakey_kwargs)
         return prefix + "_keys"
 
     def post_save(self, obj, created):
@@ -1043,8 +1256,8 @@ class PlaceListView(
 
     def get_queryset(self):
         dataset = self.get_dataset()
-        queryset = self.locate_queryset(
-            self.filter_queryset(models.Place.objects.all())
+        queryset = self.shape_queryset(
+            self.locate_queryset(self.filter_queryset(models.Place.objects.all()))
         )
 
         # If the user is not allowed to request invisible data then we won't
@@ -1254,7 +1467,7 @@ class SubmissionListView(
     def get_cache_metakey(self):
         metakey_kwargs = self.kwargs.copy()
         metakey_kwargs.pop("pk_list", None)
-        prefix = reverse("submission-list", kwargs=metakey_kwargs)
+        prefix = routes.build_path("submission-list", **metakey_kwargs)
         return prefix + "_keys"
 
     def get_place_model(self, dataset):
@@ -1365,7 +1578,7 @@ class DataSetSubmissionListView(
     def get_cache_metakey(self):
         metakey_kwargs = self.kwargs.copy()
         metakey_kwargs.pop("pk_list", None)
-        prefix = reverse("dataset-submission-list", kwargs=metakey_kwargs)
+        prefix = routes.build_path("dataset-submission-list", **metakey_kwargs)
         return prefix + "_keys"
 
     def get_queryset(self):
@@ -1529,6 +1742,7 @@ class DataSetKeyListView(ProtectedOwnedResourceMixin, generics.ListAPIView):
     """
 
     model = apikey.models.ApiKey
+    queryset = apikey.models.ApiKey.objects.all()
     serializer_class = serializers.ApiKeySerializer
     authentication_classes = (
         authentication.BasicAuthentication,
@@ -1542,7 +1756,7 @@ class DataSetKeyListView(ProtectedOwnedResourceMixin, generics.ListAPIView):
     def get_queryset(self):
         dataset = self.get_dataset()
         queryset = super(DataSetKeyListView, self).get_queryset()
-        return queryset.filter(dataset=dataset)
+        return queryset.filter(dataset=dataset).prefetch_related("permissions")
 
 
 class DataSetListMixin(object):
@@ -1983,7 +2197,7 @@ class UserInstanceView(OwnedResourceMixin, generics.RetrieveAPIView):
     SAFE_CORS_METHODS = ("GET", "HEAD", "TRACE", "OPTIONS")
 
     def get_queryset(self):
-        return models.User.objects.all().prefetch_related("social_auth")
+        return models.User.objects.with_principal_relations()
 
     def get_object(self, queryset=None):
         owner_username = self.kwargs[self.owner_username_kwarg]
@@ -2053,7 +2267,7 @@ class CurrentUserInstanceView(CorsEnabledMixin, views.APIView):
 
 
 class SessionKeyView(CorsEnabledMixin, views.APIView):
-    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+    renderer_classes = (renderers.JSONRenderer, BrowsableAPIRenderer)
     content_negotiation_class = ShareaboutsContentNegotiation
 
     def get(self, request):
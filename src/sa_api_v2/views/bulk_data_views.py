@@ -1,5 +1,10 @@
+import gzip
+import re
+import uuid
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from mock import patch
 from rest_framework import views, permissions
 from rest_framework.negotiation import DefaultContentNegotiation
@@ -24,13 +29,62 @@ from ..params import (
     CALLBACK_PARAM,
 )
 from ..models import DataSnapshotRequest, DataSnapshot, DataSet
-from ..tasks import store_bulk_data, bulk_data_status_update
+from ..tasks import store_bulk_data, bulk_data_status_update, get_data_version
 from .base_views import OwnedResourceMixin
 import logging
 
 log = logging.getLogger("sa_api_v2.views")
 
 
+SNAPSHOT_CHUNK_SIZE = 64 * 1024
+accepts_gzip_re = re.compile(r"\bgzip\b")
+byte_range_re = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_byte_range(header, size):
+    """
+    Parse a Range header for a single range of bytes into the (start, end)
+    offsets of the range, inclusive. Returns None if there is no (supported)
+    range, and raises ValueError if the range cannot be satisfied.
+    """
+    match = byte_range_re.match(header.strip()) if header else None
+    if match is None:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    elif not start:
+        # A suffix range, e.g. "bytes=-500" for the last 500 bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+
+    if start > end or start >= size:
+        raise ValueError("Unsatisfiable range: %s" % (header,))
+    return start, end
+
+
+def iter_file_chunks(fileobj, length=None, closing=()):
+    """
+    Read a file in chunks, optionally up to a given length, and then close it
+    along with any other given objects.
+    """
+    remaining = float("inf") if length is None else length
+    try:
+        while remaining > 0:
+            chunk = fileobj.read(min(SNAPSHOT_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        fileobj.close()
+        for obj in closing:
+            obj.close()
+
+
 ###############################################################################
 #
 # Resource Views
@@ -58,6 +112,7 @@ class DataSnapshotMixin(object):
         return {
             "status": datarequest.status,
             "message": self.response_messages.get(datarequest.status, default_message),
+            "progress": datarequest.progress,
             "requested_at": datarequest.requested_at.isoformat(),
             "url": self.get_data_url(datarequest),
         }
@@ -97,33 +152,40 @@ class DataSnapshotRequestListView(DataSnapshotMixin, OwnedResourceMixin, views.A
         )
 
     def get_most_recent_request(self, characteristic_params):
+        """
+        Get the most recent request for the same data, at the same version,
+        that is either still being generated or has been fulfilled.
+        """
         try:
             return self.get_recent_requests(characteristic_params).filter(
-                status="pending"
+                status__in=("pending", "success")
             )[0]
         except IndexError:
             raise DataSnapshotRequest.DoesNotExist()
 
     def initiate_data_request(self, characteristic_params):
-        # Create a new data request
+        # Create a new data request, with the id of the task that will
+        # fulfill it decided up front.
         datarequest = DataSnapshotRequest(**characteristic_params)
         datarequest.requester = (
             self.request.user if self.request.user.is_authenticated() else None
         )
         datarequest.status = "pending"
+        datarequest.guid = str(uuid.uuid4())
         datarequest.save()
 
-        # Schedule the data to be generated and stored
-        task = store_bulk_data.apply_async(
-            args=(datarequest.pk,),
-            link=bulk_data_status_update.s(),
-            link_error=bulk_data_status_update.s(),
+        # Schedule the data to be generated and stored once the request is
+        # committed. The tasks mark the request as successful themselves once
+        # the snapshot has been written, which may be well after the
+        # scheduling task has finished.
+        transaction.on_commit(
+            lambda: store_bulk_data.apply_async(
+                args=(datarequest.pk,),
+                task_id=datarequest.guid,
+                link_error=bulk_data_status_update.s(),
+            )
         )
 
-        # Patch the task id on to the datarequest.
-        datarequest.guid = task.id
-        datarequest.save()
-
         # Return the data request
         return datarequest
 
@@ -155,14 +217,28 @@ class DataSnapshotRequestListView(DataSnapshotMixin, OwnedResourceMixin, views.A
         characteristic_params = self.get_characteristic_params(
             request, owner_username, dataset_slug, submission_set_name
         )
+        dataset = characteristic_params["dataset"]
+        flags = {
+            key: value
+            for key, value in characteristic_params.items()
+            if key.startswith("include_")
+        }
 
-        try:
-            datarequest = self.get_most_recent_request(characteristic_params)
-        except DataSnapshotRequest.DoesNotExist:
-            log.info("Initiating a new snapshot")
-            datarequest = self.initiate_data_request(characteristic_params)
-        else:
-            log.info("Duplicate reqest for a new snapshot")
+        # Lock the dataset, so that simultaneous requests for the same data
+        # share a single snapshot.
+        with transaction.atomic():
+            DataSet.objects.select_for_update().filter(pk=dataset.pk).exists()
+            characteristic_params["data_version"] = get_data_version(
+                dataset, submission_set_name, **flags
+            )
+
+            try:
+                datarequest = self.get_most_recent_request(characteristic_params)
+            except DataSnapshotRequest.DoesNotExist:
+                log.info("Initiating a new snapshot")
+                datarequest = self.initiate_data_request(characteristic_params)
+            else:
+                log.info("Duplicate request for a snapshot of unchanged data")
 
         return datarequest
 
@@ -214,6 +290,19 @@ class DataSnapshotInstanceView(DataSnapshotMixin, OwnedResourceMixin, views.APIV
     """
 
     submission_set_name_kwarg = "submission_set_name"
+    snapshot_content_types = {
+        "json": "application/json",
+        "geojson": "application/json",
+        "csv": "text/csv",
+        "ndjson": "application/x-ndjson",
+        "gpkg": "application/geopackage+sqlite3",
+        "parquet": "application/vnd.apache.parquet",
+    }
+
+    def get_format_suffix(self, **kwargs):
+        # The format picks which of the snapshot's files to respond with,
+        # rather than a renderer.
+        return None
 
     def get(
         self,
@@ -245,16 +334,75 @@ class DataSnapshotInstanceView(DataSnapshotMixin, OwnedResourceMixin, views.APIV
         if format is None:
             format = "json"
 
-        if format not in ("json", "geojson", "csv"):
+        if format not in self.snapshot_content_types:
             return Response({"message": "Invalid format: %s" % (format,)}, status=400)
+        mime = self.snapshot_content_types[format]
+
+        snapshot_file = datarequest.fulfillment.get_file(format)
+        if snapshot_file:
+            return self.stream_snapshot_file(request, snapshot_file, mime)
+
+        # Snapshots from before the content was written to files only have
+        # the original formats.
+        if format not in ("json", "geojson", "csv"):
+            return Response(
+                {"message": "This snapshot is not available as %s" % (format,)},
+                status=404,
+            )
 
         content = getattr(datarequest.fulfillment, format)
-        if format == "csv":
-            mime = "text/csv"
-        else:
-            mime = "application/json"
         return HttpResponse(content, content_type=mime)
 
+    def stream_snapshot_file(self, request, snapshot_file, content_type):
+        """
+        Stream a snapshot file from storage. Clients get gzip-compressed files
+        as-is if they accept gzip, and may request a range of them; others get
+        them decompressed as they are read. Files that are not gzip-compressed
+        are always sent as-is.
+        """
+        snapshot_file.open("rb")
+        compressed = snapshot_file.name.endswith(".gz")
+
+        if compressed and not accepts_gzip_re.search(
+            request.META.get("HTTP_ACCEPT_ENCODING", "")
+        ):
+            decompressed = gzip.GzipFile(fileobj=snapshot_file, mode="rb")
+            response = StreamingHttpResponse(
+                iter_file_chunks(decompressed, closing=[snapshot_file]),
+                content_type=content_type,
+            )
+            patch_vary_headers(response, ("Accept-Encoding",))
+            return response
+
+        size = snapshot_file.size
+        try:
+            byte_range = parse_byte_range(request.META.get("HTTP_RANGE"), size)
+        except ValueError:
+            snapshot_file.close()
+            response = HttpResponse(status=416)
+            response["Content-Range"] = "bytes */%s" % (size,)
+            return response
+
+        if byte_range is None:
+            start, end, status = 0, size - 1, 200
+        else:
+            (start, end), status = byte_range, 206
+            snapshot_file.seek(start)
+
+        response = StreamingHttpResponse(
+            iter_file_chunks(snapshot_file, length=end - start + 1),
+            status=status,
+            content_type=content_type,
+        )
+        response["Content-Length"] = str(end - start + 1)
+        response["Accept-Ranges"] = "bytes"
+        if status == 206:
+            response["Content-Range"] = "bytes %s-%s/%s" % (start, end, size)
+        if compressed:
+            response["Content-Encoding"] = "gzip"
+            patch_vary_headers(response, ("Accept-Encoding",))
+        return response
+
     def delete(
         self,
         request,
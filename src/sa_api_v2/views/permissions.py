@@ -208,10 +208,45 @@ class IsAllowedByDataPermissions(permissions.BasePermission):
         user = getattr(request, "user", None)
         client = getattr(request, "client", None)
         dataset = getattr(request, "get_dataset", lambda: None)()
-        place_id = None
-        if "id" in request.data:
-            place_id = request.data["id"]
+        if models.check_data_permission(
+            user, client, None, do_action, dataset, data_type, protected
+        ):
+            return True
+
+        # Otherwise, the user may still be allowed to act on the places that
+        # they submitted. Look all of the places up at once, so that bulk
+        # requests don't take a query per place.
+        if isinstance(request.data, list):
+            # Every item must name a place that the user may act on; anything
+            # else in the list (e.g., a new place) needs the permission above.
+            if not all(
+                isinstance(item, dict) and "id" in item for item in request.data
+            ):
+                return False
+            place_ids = [item["id"] for item in request.data]
+        elif "id" in request.data:
+            place_ids = [request.data["id"]]
+        else:
+            place_ids = []
 
-        return models.check_data_permission(
-            user, client, place_id, do_action, dataset, data_type, protected
+        if not place_ids:
+            return False
+
+        # The ids in the request data may be strings or numbers.
+        places_meta = {
+            str(place_id): place_meta
+            for place_id, place_meta in models.get_places_meta(place_ids).items()
+        }
+        return all(
+            models.check_data_permission(
+                user,
+                client,
+                place_id,
+                do_action,
+                dataset,
+                data_type,
+                protected,
+                place_meta=places_meta.get(str(place_id)),
+            )
+            for place_id in place_ids
         )
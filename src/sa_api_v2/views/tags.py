@@ -1,6 +1,6 @@
 from .. import models
 from rest_framework.response import Response
-from django.core.urlresolvers import reverse
+from .. import routes
 from rest_framework import status
 from django.shortcuts import get_object_or_404
 from .base_views import (
@@ -189,7 +189,7 @@ class PlaceTagListView(
     def get_cache_metakey(self):
         metakey_kwargs = self.kwargs.copy()
         metakey_kwargs.pop("pk_list", None)
-        prefix = reverse("place-tag-list", kwargs=metakey_kwargs)
+        prefix = routes.build_path("place-tag-list", **metakey_kwargs)
         return prefix + "_keys"
 
     def get_queryset(self):